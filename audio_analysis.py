@@ -0,0 +1,286 @@
+import os
+import json
+import hashlib
+import logging
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+ANALYSIS_SAMPLE_RATE = 22050
+# Only the first minutes are decoded; tempo and key are stable well before that.
+MAX_ANALYSIS_SECONDS = 300
+HASH_CHUNK_SIZE = 1 << 20
+# Frames transformed per FFT call, which bounds the memory of the complex intermediate.
+FFT_BLOCK_FRAMES = 2048
+
+MIN_BPM = 60.0
+MAX_BPM = 200.0
+BPM_STEP = 0.05
+
+KEY_NAMES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B']
+# Krumhansl-Kessler key profiles, starting at the tonic.
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+def decode_audio(filepath, sample_rate=ANALYSIS_SAMPLE_RATE, max_seconds=MAX_ANALYSIS_SECONDS, channels=1):
+    """
+    Decodes an audio file to float32 samples with ffmpeg.
+
+    Args:
+        filepath (str): The audio file.
+        sample_rate (int): The sample rate to resample to.
+        max_seconds (float, optional): Only decode this much audio. None decodes the whole file.
+        channels (int): The number of channels to mix to.
+
+    Returns:
+        numpy.ndarray: The samples, with shape (samples,) for mono or (samples, channels) otherwise.
+
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed.
+        subprocess.CalledProcessError: If ffmpeg cannot decode the file.
+    """
+    command = ['ffmpeg', '-v', 'error', '-nostdin', '-i', filepath]
+    if max_seconds:
+        command += ['-t', str(max_seconds)]
+    command += ['-ac', str(channels), '-ar', str(sample_rate), '-f', 'f32le', '-']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    samples = np.frombuffer(result.stdout, dtype=np.float32)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    return samples
+
+def spectrogram(samples, n_fft, hop):
+    """
+    Returns the magnitude spectrogram of the samples as a (frames, bins) float32 array.
+    """
+    if len(samples) < n_fft:
+        return np.zeros((0, n_fft // 2 + 1), dtype=np.float32)
+    frame_count = 1 + (len(samples) - n_fft) // hop
+    frames = np.lib.stride_tricks.sliding_window_view(samples, n_fft)[::hop][:frame_count]
+    window = np.hanning(n_fft).astype(np.float32)
+    result = np.empty((frame_count, n_fft // 2 + 1), dtype=np.float32)
+    for start in range(0, frame_count, FFT_BLOCK_FRAMES):
+        result[start:start + FFT_BLOCK_FRAMES] = np.abs(np.fft.rfft(frames[start:start + FFT_BLOCK_FRAMES] * window, axis=1))
+    return result
+
+def estimate_tempo(samples, sample_rate=ANALYSIS_SAMPLE_RATE):
+    """
+    Estimates the tempo from the autocorrelation of a spectral-flux onset envelope.
+    Each candidate tempo is scored at its first four beat multiples, which sharpens the
+    peak beyond the resolution of a single onset frame, and weighted towards 120 BPM to
+    settle half/double tempo ambiguity.
+
+    Returns:
+        float or None: The tempo in BPM, or None if the audio is too short.
+    """
+    hop = 256
+    spectrum = spectrogram(samples, 1024, hop)
+    if len(spectrum) < 4:
+        return None
+    onset = np.maximum(np.diff(np.log1p(100 * spectrum), axis=0), 0).sum(axis=1)
+    onset -= onset.mean()
+
+    size = 1 << (2 * len(onset) - 1).bit_length()
+    transform = np.fft.rfft(onset, size)
+    autocorrelation = np.fft.irfft(transform * np.conj(transform), size)[:len(onset)]
+    if autocorrelation[0] <= 0:
+        return None
+
+    frame_rate = sample_rate / hop
+    bpms = np.arange(MIN_BPM, MAX_BPM, BPM_STEP)
+    lags = 60 * frame_rate / bpms
+    frame_lags = np.arange(len(autocorrelation))
+    scores = sum(np.interp(lags * k, frame_lags, autocorrelation, right=0) for k in (1, 2, 3, 4))
+    scores *= np.exp(-0.5 * np.log2(bpms / 120) ** 2)
+    return float(round(bpms[np.argmax(scores)], 2))
+
+def estimate_key(samples, sample_rate=ANALYSIS_SAMPLE_RATE):
+    """
+    Estimates the musical key by correlating a chroma profile with the major and minor key profiles.
+
+    Returns:
+        str or None: The key, e.g. 'Am' or 'F#', or None if the audio is too short or silent.
+    """
+    n_fft = 8192
+    spectrum = spectrogram(samples, n_fft, n_fft // 2)
+    if not len(spectrum):
+        return None
+    frequencies = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    in_range = (frequencies >= 55) & (frequencies <= 2000)
+    pitch_classes = (np.round(12 * np.log2(frequencies[in_range] / 440)).astype(int) + 9) % 12
+    mapping = np.zeros((in_range.sum(), 12), dtype=np.float32)
+    mapping[np.arange(len(pitch_classes)), pitch_classes] = 1
+
+    frame_chroma = spectrum[:, in_range] @ mapping
+    frame_totals = frame_chroma.sum(axis=1, keepdims=True)
+    chroma = (frame_chroma / np.where(frame_totals > 0, frame_totals, 1)).sum(axis=0)
+    if not chroma.any():
+        return None
+
+    best_key, best_score = None, -np.inf
+    for tonic in range(12):
+        for profile, suffix in ((MAJOR_PROFILE, ''), (MINOR_PROFILE, 'm')):
+            score = np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+            if score > best_score:
+                best_key, best_score = KEY_NAMES[tonic] + suffix, score
+    return best_key
+
+def analyze_file(filepath):
+    """
+    Decodes one file and estimates its tempo and key. Runs in a worker process.
+
+    Returns:
+        dict: 'bpm' and 'key', or 'error' if the file could not be analyzed.
+    """
+    try:
+        samples = decode_audio(filepath)
+    except FileNotFoundError:
+        return {'error': "ffmpeg was not found."}
+    except subprocess.CalledProcessError as e:
+        return {'error': e.stderr.decode('utf-8', 'replace').strip() or "ffmpeg failed."}
+    return {'bpm': estimate_tempo(samples), 'key': estimate_key(samples)}
+
+def file_hash(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AudioAnalyzer:
+    """
+    Estimates BPM and musical key for downloaded files in a pool of worker processes.
+    Results are cached by the hash of the file's contents, so renamed, moved or linked
+    copies reuse them and only new or changed files are analyzed. Hashes are in turn
+    remembered by path, size and modification time so unchanged files are not re-read.
+    """
+
+    def __init__(self, cache_path='analysis_cache.json', max_workers=None):
+        """
+        Initializes the AudioAnalyzer.
+
+        Args:
+            cache_path (str): Where hashes and results are cached between runs.
+            max_workers (int, optional): The number of analysis processes. Defaults to the CPU count.
+        """
+        self.cache_path = cache_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        cache = self.load_cache()
+        self.file_hashes = cache.get('files', {})
+        self.results = cache.get('results', {})
+
+    def load_cache(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_cache(self):
+        with self.lock:
+            cache = {'files': dict(self.file_hashes), 'results': dict(self.results)}
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+
+    def _cached_hash(self, filepath, stat):
+        entry = self.file_hashes.get(filepath)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def get_result(self, filepath):
+        """
+        Returns the cached analysis of a file, or None if it has not been analyzed since it last changed.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        with self.lock:
+            digest = self._cached_hash(filepath, stat)
+            return self.results.get(digest) if digest else None
+
+    def rekordbox_attributes(self, filepath):
+        """
+        Returns the analysis as Rekordbox TRACK attributes, for use as a RekordboxExporter attribute provider.
+        """
+        result = self.get_result(filepath) or {}
+        attributes = {}
+        if result.get('bpm'):
+            attributes['AverageBpm'] = f"{result['bpm']:.2f}"
+        if result.get('key'):
+            attributes['Tonality'] = result['key']
+        return attributes
+
+    def analyze(self, filepaths, progress_callback=None, should_continue=None):
+        """
+        Analyzes every file whose contents have no cached result.
+
+        Args:
+            filepaths (iterable): The audio files to analyze.
+            progress_callback (callable, optional): Called as progress_callback(done, total).
+            should_continue (callable, optional): Polled between files; returning False stops the run.
+
+        Returns:
+            dict: The number of files 'analyzed', found in the 'cached' results, and 'failed'.
+        """
+        filepaths = list(filepaths)
+        total = len(filepaths)
+        completed = 0
+        pending = {}  # hash -> paths with that content
+        counts = {'analyzed': 0, 'cached': 0, 'failed': 0}
+
+        def report(file_count, outcome):
+            nonlocal completed
+            completed += file_count
+            counts[outcome] += file_count
+            if progress_callback:
+                progress_callback(completed, total)
+
+        for filepath in filepaths:
+            if should_continue and not should_continue():
+                break
+            try:
+                stat = os.stat(filepath)
+                with self.lock:
+                    digest = self._cached_hash(filepath, stat)
+                if digest is None:
+                    digest = file_hash(filepath)
+                    with self.lock:
+                        self.file_hashes[filepath] = [stat.st_size, stat.st_mtime_ns, digest]
+            except OSError as e:
+                logging.error(f"Could not read {filepath} for analysis: {e}")
+                report(1, 'failed')
+                continue
+            if digest in self.results:
+                report(1, 'cached')
+            else:
+                pending.setdefault(digest, []).append(filepath)
+
+        if pending and (not should_continue or should_continue()):
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(analyze_file, paths[0]): digest for digest, paths in pending.items()}
+                for future in as_completed(futures):
+                    digest = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': str(e)}
+                    if 'error' in result:
+                        logging.error(f"Could not analyze {pending[digest][0]}: {result['error']}")
+                        report(len(pending[digest]), 'failed')
+                    else:
+                        with self.lock:
+                            self.results[digest] = result
+                        report(len(pending[digest]), 'analyzed')
+                    if should_continue and not should_continue():
+                        for f in futures:
+                            f.cancel()
+                        break
+
+        self.save_cache()
+        return counts
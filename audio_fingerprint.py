@@ -0,0 +1,304 @@
+import os
+import json
+import logging
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from audio_analysis import decode_audio, spectrogram
+from fuzzy_matcher import prepare_text
+from track_checker import TrackChecker
+
+# Fingerprints follow Haitsma & Kalker: 33 log-spaced bands between 300 and 2000 Hz give one
+# 32-bit sub-fingerprint per frame from the signs of the band energy differences.
+FINGERPRINT_SAMPLE_RATE = 5512
+FINGERPRINT_SECONDS = 180
+FRAME_SIZE = 2048
+FRAME_HOP = 256
+BAND_EDGES = np.geomspace(300, 2000, 34)
+
+# The index is keyed on the upper KEY_BITS bits of each sub-fingerprint; fewer bits make a
+# lookup more tolerant of bit errors from re-encoding. Only keys whose hash falls into one of
+# SAMPLING_BUCKETS buckets are indexed. The choice depends on the value rather than the
+# position, so copies with different offsets or intros still index the same keys.
+KEY_BITS = 24
+SAMPLING_BUCKETS = 4
+MIN_VOTES = 3
+MIN_OVERLAP_FRAMES = 200
+MAX_BIT_ERROR_RATE = 0.35
+# Tracks whose names match and whose durations differ by at most this much are likely the same.
+DURATION_TOLERANCE = 2.0
+
+def compute_subprints(samples, sample_rate=FINGERPRINT_SAMPLE_RATE):
+    """
+    Computes the 32-bit sub-fingerprints of mono samples.
+
+    Returns:
+        numpy.ndarray: A uint32 array with one sub-fingerprint per frame.
+    """
+    spectrum = spectrogram(samples, FRAME_SIZE, FRAME_HOP)
+    if len(spectrum) < 2:
+        return np.zeros(0, dtype=np.uint32)
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / sample_rate)
+    band_of_bin = np.searchsorted(BAND_EDGES, frequencies, side='right') - 1
+    in_range = (band_of_bin >= 0) & (band_of_bin < len(BAND_EDGES) - 1)
+    mapping = np.zeros((len(frequencies), len(BAND_EDGES) - 1), dtype=np.float32)
+    mapping[np.nonzero(in_range)[0], band_of_bin[in_range]] = 1
+
+    energy = (spectrum ** 2) @ mapping
+    band_difference = energy[:, :-1] - energy[:, 1:]
+    bits = (band_difference[1:] - band_difference[:-1]) > 0
+    weights = np.left_shift(np.uint64(1), np.arange(32, dtype=np.uint64))
+    return (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+def fingerprint_file(filepath):
+    """
+    Decodes one file and computes its fingerprint. Runs in a worker process.
+
+    Returns:
+        dict: 'subprints' (uint32 array) and 'duration' (seconds), or 'error'.
+    """
+    try:
+        samples = decode_audio(filepath, FINGERPRINT_SAMPLE_RATE, max_seconds=None)
+    except FileNotFoundError:
+        return {'error': "ffmpeg was not found."}
+    except subprocess.CalledProcessError as e:
+        return {'error': e.stderr.decode('utf-8', 'replace').strip() or "ffmpeg failed."}
+    subprints = compute_subprints(samples[:FINGERPRINT_SAMPLE_RATE * FINGERPRINT_SECONDS])
+    return {'subprints': subprints, 'duration': len(samples) / FINGERPRINT_SAMPLE_RATE}
+
+def bit_error_rate(a, b):
+    """
+    Returns the fraction of differing bits between two aligned sub-fingerprint arrays.
+    """
+    return np.unpackbits(np.bitwise_xor(a, b).view(np.uint8)).mean()
+
+def track_name(filepath):
+    """
+    Returns the comparable name of a downloaded file: its base name without number prefix, prepared for matching.
+    """
+    return prepare_text(TrackChecker.strip_number_prefix(os.path.splitext(os.path.basename(filepath))[0]))
+
+class FingerprintIndex:
+    """
+    Stores compact spectral fingerprints of the downloaded files and finds audio duplicates
+    among them, such as the same song uploaded under different videoIds. Sampled
+    sub-fingerprints are kept in a sorted inverted index, so candidate pairs are found by
+    lookup rather than by comparing every pair. Candidates are then verified by the bit
+    error rate of their aligned fingerprints.
+    """
+
+    def __init__(self, cache_path='fingerprints.npz', max_workers=None):
+        """
+        Initializes the FingerprintIndex. Stored fingerprints are not read until load() is called.
+
+        Args:
+            cache_path (str): Where fingerprints are stored between runs.
+            max_workers (int, optional): The number of fingerprinting processes. Defaults to the CPU count.
+        """
+        self.cache_path = cache_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.entries = {}  # path -> (size, mtime_ns, duration, subprints)
+        self.names = {}  # prepared track name -> [(path, duration)]
+
+    def load(self, names_only=False):
+        """
+        Loads the stored fingerprints, if any.
+
+        Args:
+            names_only (bool): Only load what find_likely_duplicate() needs, leaving the
+                               fingerprints themselves on disk.
+        """
+        self.entries = {}
+        self.names = {}
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                paths = json.loads(str(data['paths']))
+                durations = data['durations']
+                if names_only:
+                    for path, duration in zip(paths, durations):
+                        self.names.setdefault(track_name(path), []).append((path, float(duration)))
+                    return
+                sizes, mtimes, offsets, subprints = data['sizes'], data['mtimes'], data['offsets'], data['subprints']
+                for i, path in enumerate(paths):
+                    self.entries[path] = (int(sizes[i]), int(mtimes[i]), float(durations[i]), subprints[offsets[i]:offsets[i + 1]])
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Could not load fingerprints from {self.cache_path}: {e}")
+            self.entries = {}
+        self._build_name_index()
+
+    def save(self):
+        paths = list(self.entries)
+        lengths = [len(self.entries[path][3]) for path in paths]
+        np.savez(self.cache_path,
+                 paths=np.array(json.dumps(paths)),
+                 sizes=np.array([self.entries[path][0] for path in paths], dtype=np.int64),
+                 mtimes=np.array([self.entries[path][1] for path in paths], dtype=np.int64),
+                 durations=np.array([self.entries[path][2] for path in paths], dtype=np.float64),
+                 offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+                 subprints=np.concatenate([self.entries[path][3] for path in paths]) if paths else np.zeros(0, dtype=np.uint32))
+
+    def _build_name_index(self):
+        self.names = {}
+        for path, (_, _, duration, _) in self.entries.items():
+            self.names.setdefault(track_name(path), []).append((path, duration))
+
+    def update(self, filepaths, progress_callback=None, should_continue=None):
+        """
+        Fingerprints new or changed files in a process pool and drops files that no longer exist.
+
+        Returns:
+            dict: The number of files 'fingerprinted', found 'cached' and 'failed'.
+        """
+        filepaths = list(filepaths)
+        counts = {'fingerprinted': 0, 'cached': 0, 'failed': 0}
+        current = {}
+        pending = {}
+        for filepath in filepaths:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                counts['failed'] += 1
+                continue
+            entry = self.entries.get(filepath)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                current[filepath] = entry
+                counts['cached'] += 1
+            else:
+                pending[filepath] = stat
+        if progress_callback:
+            progress_callback(counts['cached'], len(filepaths))
+
+        if pending and (not should_continue or should_continue()):
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(fingerprint_file, filepath): filepath for filepath in pending}
+                for done, future in enumerate(as_completed(futures), start=counts['cached'] + 1):
+                    filepath = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': str(e)}
+                    if 'error' in result:
+                        logging.error(f"Could not fingerprint {filepath}: {result['error']}")
+                        counts['failed'] += 1
+                    else:
+                        stat = pending[filepath]
+                        current[filepath] = (stat.st_size, stat.st_mtime_ns, result['duration'], result['subprints'])
+                        counts['fingerprinted'] += 1
+                    if progress_callback:
+                        progress_callback(done, len(filepaths))
+                    if should_continue and not should_continue():
+                        for f in futures:
+                            f.cancel()
+                        break
+
+        self.entries = current
+        self._build_name_index()
+        self.save()
+        return counts
+
+    def _sample(self, path):
+        """
+        Returns the sampled index keys of one file and the frames they occur at.
+        """
+        subprints = self.entries[path][3]
+        keys = subprints >> np.uint32(32 - KEY_BITS)
+        # Multiplicative hashing spreads the sampling evenly over the key values.
+        bucket = ((keys.astype(np.uint64) * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)) % np.uint64(SAMPLING_BUCKETS)
+        frames = np.nonzero((bucket == 0) & (keys != 0) & (keys != (1 << KEY_BITS) - 1))[0]
+        return keys[frames], frames.astype(np.int64)
+
+    def find_duplicates(self):
+        """
+        Groups the fingerprinted files into clusters of audio duplicates.
+
+        Returns:
+            list: Clusters with at least two files, each a sorted list of paths.
+        """
+        paths = sorted(self.entries)
+        samples = [self._sample(path) for path in paths]
+        if not samples:
+            return []
+        keys = np.concatenate([sample_keys for sample_keys, _ in samples])
+        frames = np.concatenate([sample_frames for _, sample_frames in samples])
+        file_ids = np.repeat(np.arange(len(paths)), [len(sample_keys) for sample_keys, _ in samples])
+        order = np.argsort(keys, kind='stable')
+        keys, frames, file_ids = keys[order], frames[order], file_ids[order]
+        parent = list(range(len(paths)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for file_id, (query_keys, query_frames) in enumerate(samples):
+            lefts = np.searchsorted(keys, query_keys, side='left')
+            hit_counts = np.searchsorted(keys, query_keys, side='right') - lefts
+            total_hits = int(hit_counts.sum())
+            if not total_hits:
+                continue
+            # Expand every query sub-fingerprint into the postings that share it.
+            run_starts = np.cumsum(hit_counts) - hit_counts
+            positions = np.repeat(lefts - run_starts, hit_counts) + np.arange(total_hits)
+            other_ids = file_ids[positions]
+            offsets = frames[positions] - np.repeat(query_frames, hit_counts)
+            later = other_ids > file_id
+            if not later.any():
+                continue
+
+            # Copies of the same audio agree on the offset between their fingerprints.
+            votes, vote_counts = np.unique(other_ids[later] * (1 << 32) + offsets[later] + (1 << 31), return_counts=True)
+            for vote in votes[vote_counts >= MIN_VOTES]:
+                other_id, offset = int(vote >> 32), int((vote & 0xFFFFFFFF) - (1 << 31))
+                if find(other_id) == find(file_id):
+                    continue
+                if self._verify(self.entries[paths[file_id]][3], self.entries[paths[other_id]][3], offset):
+                    parent[find(other_id)] = find(file_id)
+
+        clusters = {}
+        for file_id, path in enumerate(paths):
+            clusters.setdefault(find(file_id), []).append(path)
+        return [sorted(cluster) for cluster in clusters.values() if len(cluster) > 1]
+
+    @staticmethod
+    def _verify(a, b, offset):
+        """
+        Checks whether b, shifted by offset frames relative to a, matches a closely enough.
+        """
+        start_a, start_b = max(0, -offset), max(0, offset)
+        length = min(len(a) - start_a, len(b) - start_b)
+        if length < MIN_OVERLAP_FRAMES:
+            return False
+        return bit_error_rate(a[start_a:start_a + length], b[start_b:start_b + length]) <= MAX_BIT_ERROR_RATE
+
+    def find_likely_duplicate(self, base_filename, duration):
+        """
+        Looks for a fingerprinted file that is likely the same track, before it is downloaded,
+        by its prepared name and duration.
+
+        Args:
+            base_filename (str): The track's base filename, as generated by the FileManager.
+            duration (float, optional): The track's duration in seconds. Without it nothing matches.
+
+        Returns:
+            str or None: The path of an existing file, or None.
+        """
+        if not duration:
+            return None
+        for path, file_duration in self.names.get(prepare_text(base_filename), []):
+            if abs(file_duration - duration) <= DURATION_TOLERANCE and os.path.exists(path):
+                return path
+        return None
+
+def describe_clusters(clusters, download_directory):
+    """
+    Renders duplicate clusters as text, showing which playlist folder each copy is in.
+    """
+    lines = []
+    for number, cluster in enumerate(clusters, start=1):
+        lines.append(f"Duplicate group {number}:")
+        for path in cluster:
+            lines.append(f"    {os.path.relpath(path, download_directory)}")
+    return "\n".join(lines)
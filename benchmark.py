@@ -0,0 +1,302 @@
+"""
+Benchmarks for the library hot paths, runnable without a display or network access.
+
+A synthetic library (playlists, micro-playlists and a matching tree of empty audio files on
+tmpfs where available) is generated for each requested size, and the operations the app runs
+on every playlist view, download and reformat are timed against it. The app's startup
+(imports, first paint and library load) is timed in fresh processes on Qt's offscreen platform.
+
+Usage:
+    python benchmark.py --tracks 10000 50000 --output results.json
+    python benchmark.py --tracks 10000 --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import string
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from file_manager import FileManager
+from microplaylist_handler import MicroPlaylistHandler
+from rename_planner import RenamePlanner, build_reformat_mapping
+from storage import PlaylistStore
+from tag_index import TagIndex
+from track_checker import TrackChecker
+
+DEFAULT_CONFIG = {"numbering": "playlist_order", "name_order": "track_artist", "output_format": "mp3"}
+# Share of the synthetic tracks that get a file in the download directory.
+DOWNLOADED_SHARE = 0.8
+# Startup phases main.py reports when YTMUSIC_STARTUP_BENCHMARK is set, in seconds from process start.
+STARTUP_PHASES = ('imports', 'first_paint', 'library')
+
+def random_word(rng, min_length=3, max_length=10):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_length, max_length))).capitalize()
+
+def generate_library(track_count, microplaylist_count, tracks_per_playlist=200, seed=1):
+    """
+    Builds synthetic playlists and micro-playlists shaped like the app's playlists.json and microplaylists.json.
+
+    Returns:
+        tuple: (playlists, microplaylists)
+    """
+    rng = random.Random(seed)
+    artists = [' '.join(random_word(rng) for _ in range(rng.randint(1, 2))) for _ in range(max(50, track_count // 20))]
+    playlists = {}
+    for p in range((track_count + tracks_per_playlist - 1) // tracks_per_playlist):
+        tracks = []
+        for _ in range(min(tracks_per_playlist, track_count - p * tracks_per_playlist)):
+            track_artists = rng.sample(artists, rng.choice((1, 1, 1, 2)))
+            tracks.append({
+                'videoId': ''.join(rng.choice(string.ascii_letters + string.digits + '-_') for _ in range(11)),
+                'title': ' '.join(random_word(rng) for _ in range(rng.randint(1, 4))),
+                'artists': [{'name': name, 'id': None} for name in track_artists],
+                'album': {'name': random_word(rng), 'id': None},
+                'year': str(rng.randint(1970, 2025)),
+                'duration': f"{rng.randint(2, 7)}:{rng.randint(0, 59):02d}",
+            })
+        playlists[f"PL{p:06d}"] = {'title': f"Playlist {p} {random_word(rng)}", 'tracks': tracks}
+
+    microplaylists = {}
+    playlist_ids = list(playlists)
+    for m in range(microplaylist_count):
+        p_id = playlist_ids[m % len(playlist_ids)]
+        playlist_artists = sorted({a['name'] for t in playlists[p_id]['tracks'] for a in t['artists']})
+        microplaylists.setdefault(p_id, []).append({
+            'name': f"Micro {m} {random_word(rng)}",
+            'artists': rng.sample(playlist_artists, min(len(playlist_artists), rng.randint(1, 5))),
+        })
+    return playlists, microplaylists
+
+def create_directory_tree(root, playlists, microplaylist_handler, file_manager, seed=1):
+    """
+    Creates empty files for most tracks, named and placed exactly as the downloader would.
+
+    Returns:
+        int: The number of files created.
+    """
+    rng = random.Random(seed)
+    micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks(playlists)
+    placements = [(p_id, mp_name, tracks) for (p_id, mp_name), tracks in micro_tracks_map.items()]
+    placements += [(p_id, None, tracks) for p_id, tracks in remaining_tracks_map.items()]
+    created = 0
+    for p_id, micro_name, tracks in placements:
+        playlist_info = playlists[p_id]
+        directory = file_manager.get_track_directory(root, playlist_info['title'], micro_name)
+        os.makedirs(directory, exist_ok=True)
+        positions = {t['videoId']: i + 1 for i, t in enumerate(playlist_info['tracks'])}
+        for track in tracks:
+            if rng.random() < DOWNLOADED_SHARE:
+                filename = file_manager.get_filename(track, positions[track['videoId']], len(playlist_info['tracks']))
+                with open(os.path.join(directory, filename + '.mp3'), 'wb'):
+                    pass
+                created += 1
+    return created
+
+def time_call(function, repeats, setup=None):
+    """
+    Times a call several times, running the optional setup before each run outside the timing.
+
+    Returns:
+        dict: 'min', 'median' and 'max' in seconds, and 'repeats'.
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'max': max(timings), 'repeats': repeats}
+
+def time_startup(work_dir, playlists, microplaylists, download_dir, repeats):
+    """
+    Starts the app against the synthetic library in a fresh process for each run, on Qt's
+    offscreen platform, and collects the startup timings it reports.
+
+    Returns:
+        dict: 'startup_<phase>' names mapped to their timings, or an empty dict if the app could not start.
+    """
+    app_dir = os.path.join(work_dir, 'app')
+    os.makedirs(app_dir)
+    with open(os.path.join(app_dir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(DEFAULT_CONFIG, download_directory=download_dir), f)
+    store = PlaylistStore(os.path.join(app_dir, 'library'), legacy_file=None)
+    store.update(playlists)
+    store.save()
+    with open(os.path.join(app_dir, 'microplaylists.json'), 'w', encoding='utf-8') as f:
+        json.dump(microplaylists, f)
+
+    report_path = os.path.join(app_dir, 'startup.json')
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', YTMUSIC_STARTUP_BENCHMARK=report_path)
+    env.pop('YTMUSIC_PROFILE', None)
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    runs = []
+    for _ in range(repeats):
+        try:
+            subprocess.run([sys.executable, main_path], cwd=app_dir, env=env, timeout=120,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            with open(report_path, 'r', encoding='utf-8') as f:
+                runs.append(json.load(f))
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            print(f"  Skipping the startup benchmark, the app did not start: {e}")
+            return {}
+        os.remove(report_path)
+
+    results = {}
+    for phase in STARTUP_PHASES:
+        timings = [run[phase] for run in runs]
+        results[f'startup_{phase}'] = {'min': min(timings), 'median': statistics.median(timings),
+                                       'max': max(timings), 'repeats': repeats}
+    return results
+
+def scratch_directory():
+    """
+    Returns a base directory for the synthetic tree, preferring tmpfs so disk speed does not dominate.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def run_suite(track_count, microplaylist_count, repeats, startup=True):
+    """
+    Generates one synthetic library and times every benchmark against it.
+    With startup set, the app's startup is timed against it too.
+
+    Returns:
+        dict: Benchmark names mapped to their timings.
+    """
+    results = {}
+    playlists, microplaylists = generate_library(track_count, microplaylist_count)
+    work_dir = tempfile.mkdtemp(prefix='ytmusic-bench-', dir=scratch_directory())
+    try:
+        download_dir = os.path.join(work_dir, 'library')
+        microplaylist_handler = MicroPlaylistHandler(os.path.join(work_dir, 'microplaylists.json'))
+        microplaylist_handler.microplaylists = microplaylists
+        file_manager = FileManager(dict(DEFAULT_CONFIG))
+        file_count = create_directory_tree(download_dir, playlists, microplaylist_handler, file_manager)
+        print(f"  Generated {len(playlists)} playlists, {microplaylist_count} micro-playlists, {file_count} files in {work_dir}")
+
+        tag_index = TagIndex(os.path.join(work_dir, 'tag_index.json'))
+        track_checker = TrackChecker(file_manager, download_dir, tag_index=tag_index)
+        results['scan_directory'] = time_call(track_checker._scan_directory, repeats)
+
+        results['segregate_tracks'] = time_call(lambda: microplaylist_handler.segregate_tracks(playlists), repeats)
+        micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks(playlists)
+        placements = [(playlists[p_id], mp_name, tracks) for (p_id, mp_name), tracks in micro_tracks_map.items()]
+        placements += [(playlists[p_id], None, tracks) for p_id, tracks in remaining_tracks_map.items()]
+
+        def check_all():
+            for playlist_info, micro_name, tracks in placements:
+                for track in tracks:
+                    track_checker.is_downloaded(track, playlist_info, micro_name)
+        results['is_downloaded'] = time_call(check_all, repeats, setup=track_checker.rescan)
+
+        def name_all():
+            for playlist_info in playlists.values():
+                total = len(playlist_info['tracks'])
+                for position, track in enumerate(playlist_info['tracks'], start=1):
+                    file_manager.get_filename(track, position, total)
+        results['get_filename_cold'] = time_call(name_all, repeats, setup=file_manager.clear_cache)
+        results['get_filename_warm'] = time_call(name_all, repeats)
+
+        # Kept apart from the download directory, which the later benchmarks still scan.
+        library_dir = os.path.join(work_dir, 'store')
+
+        def save_library():
+            store = PlaylistStore(library_dir, legacy_file=None)
+            store.update(playlists)
+            store.save()
+        results['save_library'] = time_call(save_library, repeats, setup=lambda: shutil.rmtree(library_dir, ignore_errors=True))
+        # Opening the library reads only the manifest; selecting a playlist reads its tracks.
+        results['open_library'] = time_call(lambda: PlaylistStore(library_dir, legacy_file=None), repeats)
+        store = PlaylistStore(library_dir, legacy_file=None)
+        first_playlist = next(iter(store))
+        results['load_playlist'] = time_call(lambda: store[first_playlist], repeats, setup=store.loaded.clear)
+
+        # Plan dropping the number prefixes for every playlist, as 'Reformat Files' would after
+        # the numbering setting changed. Base names stay the same, so every file is located.
+        file_manager.config = dict(DEFAULT_CONFIG, numbering='none')
+
+        def plan_reformat():
+            for p_id, playlist_info in playlists.items():
+                RenamePlanner(build_reformat_mapping(p_id, playlist_info, file_manager, track_checker, microplaylist_handler))
+        results['plan_reformat'] = time_call(plan_reformat, repeats, setup=track_checker.rescan)
+
+        if startup:
+            results.update(time_startup(work_dir, playlists, microplaylists, download_dir, repeats))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def compare(current, baseline, threshold):
+    """
+    Prints a comparison against a baseline results file and returns the regressed benchmarks.
+    A benchmark regresses when its median is more than threshold (a fraction) slower.
+    """
+    regressions = []
+    print(f"\n{'Benchmark':<40} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+    for name, timing in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f"{name:<40} {'-':>12} {timing['median'] * 1000:>10.1f}ms {'new':>9}")
+            continue
+        change = timing['median'] / base['median'] - 1 if base['median'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<40} {base['median'] * 1000:>10.1f}ms {timing['median'] * 1000:>10.1f}ms {change:>+8.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the library hot paths on synthetic libraries.")
+    parser.add_argument('--tracks', type=int, nargs='+', default=[10000], help="Library sizes to benchmark (default: 10000).")
+    parser.add_argument('--microplaylists', type=int, default=300, help="Number of micro-playlists (default: 300).")
+    parser.add_argument('--repeats', type=int, default=5, help="Runs per benchmark (default: 5).")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="Compare against a previous results file and exit with 1 on regressions.")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Allowed slowdown before flagging a regression (default: 0.15).")
+    parser.add_argument('--no-startup', action='store_true', help="Skip timing the app's startup, which needs PyQt6.")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'microplaylists': args.microplaylists,
+            'repeats': args.repeats,
+        },
+        'results': {},
+    }
+    for track_count in args.tracks:
+        print(f"Benchmarking a library of {track_count} tracks...")
+        for name, timing in run_suite(track_count, args.microplaylists, args.repeats, not args.no_startup).items():
+            key = f"{name}[{track_count}]"
+            report['results'][key] = timing
+            print(f"  {name:<24} median {timing['median'] * 1000:9.1f} ms   min {timing['min'] * 1000:9.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}.")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
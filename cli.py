@@ -0,0 +1,306 @@
+"""
+Command-line entry point for running syncs and downloads without the GUI, e.g. from a nightly job.
+
+It uses the same config.json, library directory, microplaylists.json and token.pickle as the
+app, and never imports PyQt6. Log in once from the app so token.pickle exists.
+
+Usage:
+    python cli.py sync [--playlist ID ...]
+    python cli.py status [--playlist ID ...]
+    python cli.py download-missing [--playlist ID ...] [--workers 3] [--priority library|recent|shortest]
+    python cli.py reformat [--playlist ID ...] [--dry-run | --rollback]
+
+Every command accepts --json to print one JSON document on stdout instead of text.
+Exit codes: 0 on success, 1 if some playlists or tracks failed, 2 for usage or setup errors,
+130 if interrupted.
+"""
+import os
+import sys
+import json
+import argparse
+import contextlib
+import threading
+import instrumentation
+import storage
+from file_manager import FileManager
+from microplaylist_handler import MicroPlaylistHandler
+from track_checker import TrackChecker
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_ERROR = 2
+EXIT_INTERRUPTED = 130
+
+REFORMAT_JOURNAL_FILE = "reformat_journal.jsonl"
+
+class CommandError(Exception):
+    """
+    A setup or usage problem that stops a command before it does any work.
+    """
+
+def log(message):
+    """
+    Writes a progress line to stderr, keeping stdout for the command's result.
+    """
+    print(message, file=sys.stderr, flush=True)
+
+class Context:
+    """
+    The state shared by the commands: settings, synced playlists and the library helpers.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.config = storage.load_config(args.config)
+        self.playlists = storage.PlaylistStore(args.library, keep_raw=self.config.get("keep_raw_track_data", False))
+        self.microplaylist_handler = MicroPlaylistHandler(args.microplaylists_file)
+        self.file_manager = FileManager(self.config)
+        self._track_checker = None
+
+    @property
+    def download_directory(self):
+        directory = self.config.get("download_directory")
+        if not directory or not os.path.isdir(directory):
+            raise CommandError("The download directory is not set or does not exist. Set it in the app's Settings.")
+        return directory
+
+    @property
+    def track_checker(self):
+        if self._track_checker is None:
+            self._track_checker = TrackChecker(self.file_manager, self.download_directory)
+        return self._track_checker
+
+    def selected_playlist_ids(self):
+        """
+        Returns the playlists named with --playlist, or every synced playlist.
+        """
+        if not self.args.playlist:
+            return list(self.playlists)
+        unknown = [p_id for p_id in self.args.playlist if p_id not in self.playlists]
+        if unknown:
+            raise CommandError(f"Not a synced playlist: {', '.join(unknown)}")
+        return list(dict.fromkeys(self.args.playlist))
+
+def command_sync(context):
+    from youtube_handler import YouTubeHandler
+
+    handler = YouTubeHandler(api_endpoint=context.args.api_endpoint or os.environ.get("YTMUSIC_API_ENDPOINT"))
+    if not handler.is_authenticated():
+        raise CommandError("Not logged in. Log in once from the app so token.pickle is created.")
+
+    playlist_ids = context.selected_playlist_ids()
+    to_sync = {p_id: context.playlists[p_id] for p_id in playlist_ids}
+    updated_playlists, summary = handler.sync_playlists(
+        to_sync, lambda done, total: log(f"Synced {done}/{total} playlists"))
+
+    synced = []
+    for p_id, new_data in updated_playlists.items():
+        old_ids = {t['videoId'] for t in context.playlists[p_id].get('tracks', [])}
+        new_ids = {t['videoId'] for t in new_data.get('tracks', [])}
+        synced.append({'id': p_id, 'title': new_data.get('title'), 'tracks': len(new_data.get('tracks', [])),
+                       'new_tracks': len(new_ids - old_ids)})
+        context.playlists[p_id] = new_data
+    context.playlists.save()
+
+    failed = [{'id': p_id, 'title': to_sync[p_id].get('title')} for p_id in playlist_ids if p_id not in updated_playlists]
+    result = {'synced': synced, 'failed': failed, 'summary': summary}
+    lines = [f"Synced {len(synced)} playlist(s), {sum(s['new_tracks'] for s in synced)} new track(s); {len(failed)} failed."]
+    lines += summary
+    return result, lines, EXIT_FAILURES if failed else EXIT_OK
+
+def command_status(context):
+    from download_engine import find_missing_tracks
+
+    playlists = []
+    for p_id in context.selected_playlist_ids():
+        playlist_info = context.playlists[p_id]
+        missing = find_missing_tracks([p_id], context.playlists, context.microplaylist_handler, context.track_checker)
+        playlists.append({'id': p_id, 'title': playlist_info.get('title'),
+                          'tracks': len(playlist_info.get('tracks', [])), 'missing': len(missing),
+                          'synced_at': context.playlists.info(p_id)['synced_at']})
+
+    result = {'download_directory': context.download_directory, 'playlists': playlists,
+              'missing': sum(p['missing'] for p in playlists)}
+    lines = [f"{p['title']} ({p['id']}): {p['tracks']} track(s), {p['missing']} missing" for p in playlists]
+    lines.append(f"{result['missing']} track(s) missing in total.")
+    return result, lines, EXIT_OK
+
+def command_download_missing(context):
+    from download_engine import DownloadEngine, plan_missing_downloads
+    from library_index import LibraryIndex
+    from rekordbox_importer import RekordboxCollection
+    from loudness_scanner import LoudnessScanner
+    from audio_fingerprint import FingerprintIndex
+
+    if context.args.workers < 1:
+        raise CommandError("--workers must be at least 1.")
+    config = context.config
+    download_directory = context.download_directory
+    library_index = LibraryIndex()
+    jobs = plan_missing_downloads(context.selected_playlist_ids(), context.playlists, context.microplaylist_handler,
+                                  context.track_checker, library_index,
+                                  priority=context.args.priority or config.get("download_priority", "library"))
+    if not jobs:
+        return {'queued': 0, 'succeeded': 0, 'failed': []}, ["Nothing to download."], EXIT_OK
+    log(f"Downloading {len(jobs)} track(s)...")
+
+    staging_directory = None
+    if config.get("staging_enabled"):
+        import tempfile
+        staging_directory = config.get("staging_directory") or os.path.join(tempfile.gettempdir(), "ytmusic-rekordbox-staging")
+    rekordbox_collection = None
+    if config.get("rekordbox_collection_xml"):
+        rekordbox_collection = RekordboxCollection(config["rekordbox_collection_xml"])
+    loudness_scanner = None
+    if config.get("loudness_after_download"):
+        loudness_scanner = LoudnessScanner(write_tags=config.get("write_replaygain", False))
+
+    titles = {job['videoId']: job.get('title') for job in jobs}
+    outcomes = []
+    lock = threading.Lock()
+
+    def on_track_finished(video_id, success, message):
+        with lock:
+            outcomes.append({'videoId': video_id, 'title': titles.get(video_id), 'success': success, 'message': message})
+            log(f"[{len(outcomes)}/{len(jobs)}] {'OK' if success else 'FAILED'} {titles.get(video_id)}: {message}")
+
+    engine = DownloadEngine(jobs, context.file_manager, download_directory, max_workers=context.args.workers,
+                            staging_directory=staging_directory, library_index=library_index,
+                            rekordbox_collection=rekordbox_collection,
+                            collection_mode=config.get("rekordbox_collection_mode", "skip"),
+                            loudness_scanner=loudness_scanner, fingerprint_index=FingerprintIndex(),
+                            on_track_finished=on_track_finished)
+    # The engine runs on a worker thread so Ctrl+C can stop it cleanly between tracks.
+    worker = threading.Thread(target=engine.run, name="DownloadEngine")
+    worker.start()
+    interrupted = False
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        interrupted = True
+        log("Stopping after the downloads in progress...")
+        engine.stop()
+        worker.join()
+
+    failed = [o for o in outcomes if not o['success']]
+    result = {'queued': len(jobs), 'succeeded': len(outcomes) - len(failed), 'failed': failed, 'interrupted': interrupted}
+    lines = [f"Downloaded or linked {result['succeeded']} of {len(jobs)} track(s), {len(failed)} failed."]
+    lines += [f"FAILED {o['title']} ({o['videoId']}): {o['message']}" for o in failed]
+    if interrupted:
+        return result, lines, EXIT_INTERRUPTED
+    return result, lines, EXIT_FAILURES if failed or len(outcomes) < len(jobs) else EXIT_OK
+
+def command_reformat(context):
+    from rename_planner import RenamePlanner, build_reformat_mapping
+
+    journal_path = context.args.journal
+    if context.args.rollback:
+        reverted, errors = RenamePlanner.rollback(journal_path)
+        result = {'reverted': reverted, 'errors': [{'src': src, 'dst': dst, 'message': m} for src, dst, m in errors]}
+        lines = [f"Restored {reverted} file(s), {len(errors)} error(s)."] + [m for _, _, m in errors]
+        return result, lines, EXIT_FAILURES if errors else EXIT_OK
+
+    context.track_checker.rescan()
+    mapping = {}
+    for p_id in context.selected_playlist_ids():
+        mapping.update(build_reformat_mapping(p_id, context.playlists[p_id], context.file_manager,
+                                              context.track_checker, context.microplaylist_handler))
+    planner = RenamePlanner(mapping)
+    result = {
+        'planned': planner.rename_count(),
+        'conflicts': [{'src': src, 'dst': dst, 'reason': reason} for src, dst, reason in planner.conflicts],
+    }
+    if context.args.dry_run or not planner.operations:
+        result['renames'] = [{'src': src, 'dst': dst} for src, dst in planner.operations]
+        return result, [planner.describe()], EXIT_OK
+
+    renamed, errors = planner.apply(journal_path, lambda done, total: log(f"Renamed {done}/{total}") if done % 100 == 0 else None)
+    result['renamed'] = renamed
+    result['errors'] = [{'src': src, 'dst': dst, 'message': m} for src, dst, m in errors]
+    lines = [f"Renamed {renamed} file(s), skipped {len(planner.conflicts)}, {len(errors)} error(s)."]
+    if errors:
+        lines.append(f"Renaming stopped at: {errors[0][2]}")
+        lines.append("Run 'cli.py reformat --rollback' to undo the renames that were made.")
+    return result, lines, EXIT_FAILURES if errors else EXIT_OK
+
+COMMANDS = {
+    'sync': command_sync,
+    'status': command_status,
+    'download-missing': command_download_missing,
+    'reformat': command_reformat,
+}
+
+def common_options(argument_default=None):
+    """
+    Returns a parent parser with the options every command accepts. They may be given before or
+    after the command name; the copy on the subcommands suppresses its defaults so it only
+    overrides what was typed after the command.
+    """
+    common = argparse.ArgumentParser(add_help=False, argument_default=argument_default)
+    common.add_argument('--json', action='store_true', help="Print the result as JSON.")
+    common.add_argument('--config', help="Settings file (default: config.json).")
+    common.add_argument('--library', help="Synced playlists directory (default: library).")
+    common.add_argument('--microplaylists-file', help="Micro-playlists file (default: microplaylists.json).")
+    common.add_argument('--profile', metavar='TRACE', help="Record timings and write a Chrome trace to this file.")
+    if argument_default is None:
+        common.set_defaults(config=storage.CONFIG_FILE, library=storage.LIBRARY_DIRECTORY,
+                            microplaylists_file='microplaylists.json')
+    return common
+
+def build_parser():
+    from download_engine import DOWNLOAD_PRIORITIES
+
+    common = common_options(argparse.SUPPRESS)
+    parser = argparse.ArgumentParser(description="Sync and download YouTube Music playlists without the GUI.",
+                                     parents=[common_options()])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync = subparsers.add_parser('sync', parents=[common], help="Re-fetch synced playlists from YouTube.")
+    sync.add_argument('--playlist', action='append', metavar='ID', help="Only this playlist; repeat for more.")
+    sync.add_argument('--api-endpoint', help="Send API requests to this base URL, e.g. a mock_api_server.")
+
+    status = subparsers.add_parser('status', parents=[common], help="Count downloaded and missing tracks.")
+    status.add_argument('--playlist', action='append', metavar='ID', help="Only this playlist; repeat for more.")
+
+    download = subparsers.add_parser('download-missing', parents=[common], help="Download every missing track.")
+    download.add_argument('--playlist', action='append', metavar='ID', help="Only this playlist; repeat for more.")
+    download.add_argument('--workers', type=int, default=3, help="Concurrent downloads (default: 3).")
+    download.add_argument('--priority', choices=list(DOWNLOAD_PRIORITIES),
+                          help="Queue order: library order, recently synced playlists first, or shortest tracks "
+                               "first (default: the app's setting).")
+
+    reformat = subparsers.add_parser('reformat', parents=[common], help="Rename files to match the current settings.")
+    reformat.add_argument('--playlist', action='append', metavar='ID', help="Only this playlist; repeat for more.")
+    reformat.add_argument('--journal', default=REFORMAT_JOURNAL_FILE, help="Rename journal (default: reformat_journal.jsonl).")
+    mode = reformat.add_mutually_exclusive_group()
+    mode.add_argument('--dry-run', action='store_true', help="Only print the planned renames.")
+    mode.add_argument('--rollback', action='store_true', help="Undo the renames recorded in the journal.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        instrumentation.enable(args.profile)
+    try:
+        # The handlers print their progress; it goes to stderr so stdout holds only the result.
+        with contextlib.redirect_stdout(sys.stderr):
+            context = Context(args)
+            result, lines, exit_code = COMMANDS[args.command](context)
+    except CommandError as e:
+        result, lines, exit_code = {'error': str(e)}, [f"Error: {e}"], EXIT_ERROR
+    except (OSError, json.JSONDecodeError) as e:
+        result, lines, exit_code = {'error': str(e)}, [f"Error: {e}"], EXIT_ERROR
+    except KeyboardInterrupt:
+        result, lines, exit_code = {'error': "Interrupted."}, ["Interrupted."], EXIT_INTERRUPTED
+
+    if args.json:
+        print(json.dumps(dict(result, command=args.command, exit_code=exit_code), indent=2))
+    else:
+        print("\n".join(lines))
+    if args.profile:
+        log(f"Profile written to {instrumentation.write_trace()}")
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,501 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import logging
+import shutil
+import xml.etree.ElementTree as ET
+from download_estimator import DownloadEstimator
+from file_mover import FileMover, link_file
+from tag_index import VIDEO_ID_TAG
+from rekordbox_exporter import get_duration_seconds
+from instrumentation import span, start_span, count, timed
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Instrumentation span names for yt-dlp postprocessors, by their pp_key().
+POSTPROCESSOR_PHASES = {'ExtractAudio': 'download.encode', 'Metadata': 'download.tag'}
+
+# The orders in which "download all missing" queues tracks, by their "download_priority" setting.
+DOWNLOAD_PRIORITIES = {
+    'library': "Library order",
+    'recent': "Recently synced playlists first",
+    'shortest': "Shortest tracks first",
+}
+
+def _ignore(*args):
+    pass
+
+def make_download_job(track, playlist_info, microplaylist_name=None):
+    """
+    Returns a track as queued for download: its metadata plus the playlist context used for naming and placement.
+    """
+    return dict(track,
+                playlist_title=playlist_info.get('title'),
+                microplaylist_title=microplaylist_name,
+                playlist_track_count=len(playlist_info.get('tracks', [])))
+
+def find_missing_tracks(playlist_ids, playlists, microplaylist_handler, track_checker):
+    """
+    Builds download jobs for every track of the given playlists that has no local file yet,
+    fuzzy-matching each folder first as the track view does.
+    A track is queued once per target folder, in playlist order.
+
+    Args:
+        playlist_ids (iterable): The synced playlists to check.
+        playlists (dict): All synced playlists, keyed by playlist ID.
+        microplaylist_handler (MicroPlaylistHandler): Used to find each track's micro-playlist folder.
+        track_checker (TrackChecker): Used to locate the downloaded files.
+
+    Returns:
+        list: The download jobs, as made by make_download_job().
+    """
+    selected = {p_id: playlists[p_id] for p_id in playlist_ids if p_id in playlists}
+    micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks(selected)
+    placements = [(p_id, mp_name, tracks) for (p_id, mp_name), tracks in micro_tracks_map.items()]
+    placements += [(p_id, None, tracks) for p_id, tracks in remaining_tracks_map.items()]
+
+    jobs = []
+    unique_targets = set()
+    for p_id, micro_name, tracks in placements:
+        playlist_info = selected[p_id]
+        track_checker.match_playlist(tracks, playlist_info, micro_name)
+        for track in tracks:
+            video_id = track.get('videoId')
+            if not video_id or (video_id, micro_name) in unique_targets:
+                continue
+            unique_targets.add((video_id, micro_name))
+            if not track_checker.is_downloaded(track, playlist_info, micro_name):
+                jobs.append(make_download_job(track, playlist_info, micro_name))
+    return jobs
+
+def plan_missing_downloads(playlist_ids, playlists, microplaylist_handler, track_checker, library_index,
+                           priority='library'):
+    """
+    Builds download jobs for every missing track of the given playlists and their micro-playlists
+    in a single pass over the library, which also rebuilds the library index the DownloadEngine
+    links existing files from. A video missing from several folders is queued once per folder;
+    the engine downloads it once and links it into the others.
+
+    Args:
+        playlist_ids (iterable): The synced playlists to check.
+        playlists (dict or PlaylistStore): All synced playlists, keyed by playlist ID.
+        microplaylist_handler (MicroPlaylistHandler): Used to find each track's micro-playlist folder.
+        track_checker (TrackChecker): Used to locate the downloaded files.
+        library_index (LibraryIndex): The index to rebuild.
+        priority (str): A DOWNLOAD_PRIORITIES key: queue in library order, the most recently
+            synced playlists first, or the shortest tracks first.
+
+    Returns:
+        list: The download jobs, as made by make_download_job(), in queue order.
+    """
+    with span('download.plan', priority=priority):
+        missing = library_index.build(playlists, microplaylist_handler, track_checker, find_missing=playlist_ids)
+        # The sorts are stable, so library and playlist order breaks ties.
+        if priority == 'recent' and hasattr(playlists, 'info'):
+            missing.sort(key=lambda entry: playlists.info(entry[0])['synced_at'] or '', reverse=True)
+        elif priority == 'shortest':
+            missing.sort(key=lambda entry: entry[1].get('duration_seconds') or float('inf'))
+        count('download.planned', len(missing))
+        return [job for _, job in missing]
+
+class DownloadEngine:
+    """
+    Manages the downloading of tracks from YouTube.
+    This class handles the entire download process, including progress reporting,
+    error handling, and file naming, using the FileManager for consistency.
+    It has no Qt dependency: progress is reported through the on_* callbacks, so it can
+    run from DownloadHandler in the GUI or directly from the command line.
+    """
+
+    def __init__(self, tracks_to_download, file_manager, download_directory, max_workers=3, cookies_file=None,
+                 staging_directory=None, library_index=None, rekordbox_collection=None, collection_mode='skip',
+                 loudness_scanner=None, fingerprint_index=None, on_progress=None, on_track_finished=None,
+                 on_estimate=None, on_overall_progress=None, on_all_finished=None, on_staging_queue=None):
+        """
+        Initializes the DownloadEngine.
+
+        Args:
+            tracks_to_download (list): A list of track metadata dictionaries to be downloaded.
+            file_manager (FileManager): An instance of the FileManager to handle naming and paths.
+            download_directory (str): The root directory where tracks will be saved.
+            max_workers (int): The number of concurrent download threads to use.
+            cookies_file (str): Path to Netscape format cookies file (optional but recommended).
+            staging_directory (str, optional): A local scratch directory. If set, tracks are downloaded
+                                               and encoded there and then moved into place in batches.
+            library_index (LibraryIndex, optional): Index of files already in the library. Tracks found
+                                                    there are hardlinked into place instead of downloaded.
+            rekordbox_collection (RekordboxCollection, optional): Tracks already in the Rekordbox collection.
+                                                                  It is loaded when the download starts.
+            collection_mode (str): 'skip' to leave tracks found in the collection alone, or 'link' to
+                                   link the collection's file into the download directory.
+            loudness_scanner (LoudnessScanner, optional): If set, every downloaded file is measured
+                                                          (and tagged) in the scanner's worker pool.
+            fingerprint_index (FingerprintIndex, optional): Fingerprinted library files. A track whose name
+                                                            and duration match one of them is linked instead
+                                                            of downloaded. It is loaded when the download starts.
+            on_progress (callable, optional): Called as on_progress(video_id, status, percentage).
+            on_track_finished (callable, optional): Called as on_track_finished(video_id, success, message)
+                                                    once per requested target.
+            on_estimate (callable, optional): Called with the formatted size and time estimate.
+            on_overall_progress (callable, optional): Called with the overall percentage done.
+            on_all_finished (callable, optional): Called once every track is done, unless stopped.
+            on_staging_queue (callable, optional): Called with the number of files waiting to be moved.
+        """
+        self.on_progress = on_progress or _ignore
+        self.on_track_finished = on_track_finished or _ignore
+        self.on_estimate = on_estimate or _ignore
+        self.on_overall_progress = on_overall_progress or _ignore
+        self.on_all_finished = on_all_finished or _ignore
+        self.on_staging_queue = on_staging_queue or _ignore
+        self.tracks_to_download = tracks_to_download
+        self.file_manager = file_manager
+        self.download_directory = download_directory
+        self.max_workers = max_workers
+        self.cookies_file = cookies_file
+        self.staging_directory = staging_directory
+        self.file_mover = None
+        if staging_directory:
+            self.file_mover = FileMover(on_moved=self.on_file_moved, on_queue_changed=self.on_staging_queue)
+        self.library_index = library_index
+        self.rekordbox_collection = rekordbox_collection
+        self.collection_mode = collection_mode
+        self.loudness_scanner = loudness_scanner
+        self.fingerprint_index = fingerprint_index
+        self.is_running = True
+        self.total_tracks = len(tracks_to_download)
+        self.completed_tracks = 0
+        self.lock = threading.Lock()
+        # Open instrumentation spans of the transfer and postprocessing phases, keyed by
+        # (videoId, phase), since yt-dlp reports their start and end in separate hook calls.
+        self.phase_spans = {}
+
+        # The same video may be requested for several target folders. It is downloaded once
+        # and then linked into every other target.
+        self.groups = {}
+        # Files are numbered by the track's position in its playlist, or by queue order for
+        # tracks that do not carry one.
+        for i, track in enumerate(tracks_to_download):
+            self.groups.setdefault(track['videoId'], []).append((track, track.get('position') or i + 1))
+
+        # Sizes are only known once a track's format is resolved, so the projection starts
+        # from the first tracks and is refined as more of them start.
+        self.estimator = DownloadEstimator(len(self.groups))
+
+    def progress_hook(self, d):
+        """
+        A hook for yt-dlp to report download progress.
+        """
+        video_id = d.get('info_dict', {}).get('id')
+        if not video_id:
+            return
+
+        if self.estimator.update(d):
+            self.on_estimate(self.estimator.format())
+
+        if d['status'] == 'downloading' and (video_id, 'transfer') not in self.phase_spans:
+            self.phase_spans[(video_id, 'transfer')] = start_span('download.transfer', video_id=video_id)
+        elif d['status'] in ('finished', 'error'):
+            transfer_span = self.phase_spans.pop((video_id, 'transfer'), None)
+            if transfer_span:
+                downloaded = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+                transfer_span.end(bytes=downloaded, status=d['status'])
+                count('download.bytes', downloaded)
+
+        if d['status'] == 'downloading':
+            percentage = d.get('_percent_str', '0.0%')
+            speed = d.get('_speed_str', 'N/A')
+            self.on_progress(video_id, f"Downloading ({speed})", percentage)
+        elif d['status'] == 'finished':
+            self.on_progress(video_id, "Converting...", "100%")
+
+    def postprocessor_hook(self, d):
+        """
+        A hook for yt-dlp postprocessors that times the encode and tag phases.
+        It can be registered twice for one postprocessor, so repeated calls are ignored.
+        """
+        video_id = d.get('info_dict', {}).get('id')
+        if not video_id:
+            return
+        phase = POSTPROCESSOR_PHASES.get(d.get('postprocessor'), 'download.postprocess')
+        key = (video_id, phase)
+        if d['status'] == 'started' and key not in self.phase_spans:
+            self.phase_spans[key] = start_span(phase, video_id=video_id, postprocessor=d.get('postprocessor'))
+        elif d['status'] == 'finished':
+            phase_span = self.phase_spans.pop(key, None)
+            if phase_span:
+                phase_span.end()
+
+    def _build_postprocessors(self, ydl, info):
+        """
+        Chooses the single ffmpeg pass that produces the final, tagged file.
+        In 'mp3' mode this is the transcode. In 'native' mode a webm/opus stream is remuxed
+        into .opus, while a source that is already in an audio container (e.g. m4a) would be
+        skipped by FFmpegExtractAudio, so it is tagged with one metadata remux instead.
+        """
+        from yt_dlp.postprocessor import FFmpegExtractAudioPP, FFmpegMetadataPP
+        if self.file_manager.get_output_format() == 'native':
+            if info.get('ext') in FFmpegExtractAudioPP.COMMON_AUDIO_EXTS:
+                return [FFmpegMetadataPP(ydl, add_metadata=True, add_chapters=False, add_infojson=False)]
+            return [FFmpegExtractAudioPP(ydl, preferredcodec='best')]
+        return [FFmpegExtractAudioPP(ydl, preferredcodec='mp3', preferredquality='320')]
+
+    def _get_target(self, track_info, playlist_position):
+        """
+        Returns the final directory and filename (without extension) for a track.
+        """
+        playlist_name = track_info.get('playlist_title', 'Unknown Playlist')
+        microplaylist_name = track_info.get('microplaylist_title')
+        total_tracks_in_playlist = track_info.get('playlist_track_count', self.total_tracks)
+        final_directory = self.file_manager.get_track_directory(self.download_directory, playlist_name, microplaylist_name)
+        filename = self.file_manager.get_filename(track_info, playlist_position, total_tracks_in_playlist)
+        return final_directory, filename
+
+    def _process_group(self, video_id, jobs):
+        """
+        Handles every requested target of one video: links an archived copy if the library
+        already has one, otherwise downloads the first target and links the rest.
+        """
+        if not self.is_running:
+            return
+
+        owned = self.rekordbox_collection.find(jobs[0][0]) if self.rekordbox_collection else None
+        if owned:
+            self.estimator.mark_skipped(video_id)
+            if self.collection_mode == 'link':
+                self._place_copies(owned, jobs)
+            else:
+                for _ in jobs:
+                    self.on_track_finished(video_id, True, "Already in Rekordbox collection")
+                self._complete_jobs(len(jobs))
+            return
+
+        existing = self.library_index.find(video_id) if self.library_index else None
+        if not existing and self.fingerprint_index:
+            # The same song may already be in the library under another videoId.
+            track_info = jobs[0][0]
+            existing = self.fingerprint_index.find_likely_duplicate(self.file_manager.get_base_filename(track_info),
+                                                                    get_duration_seconds(track_info))
+        if existing:
+            self.estimator.mark_skipped(video_id)
+            self._place_copies(existing, jobs)
+            return
+
+        track_info, playlist_position = jobs[0]
+        self._download_track(track_info, playlist_position, jobs[1:])
+
+    def _place_copies(self, source_path, jobs):
+        """
+        Makes an existing file available in each job's target directory by hardlinking it,
+        falling back to a reflink or a copy when a hardlink is not possible.
+        """
+        extension = os.path.splitext(source_path)[1]
+        for track_info, playlist_position in jobs:
+            video_id = track_info['videoId']
+            directory, filename = self._get_target(track_info, playlist_position)
+            destination = os.path.join(directory, filename + extension)
+            try:
+                if not os.path.exists(destination):
+                    os.makedirs(directory, exist_ok=True)
+                    with span('download.link') as link_span:
+                        method = link_file(source_path, destination)
+                        link_span.set(method=method)
+                    self.on_track_finished(video_id, True, f"Linked from library ({method})")
+                else:
+                    self.on_track_finished(video_id, True, "Already in library")
+            except OSError as e:
+                self.on_track_finished(video_id, False, f"Error linking file: {e}")
+                logging.error(f"Error linking {source_path} to {destination}: {e}")
+            self._complete_jobs(1)
+
+    def _on_track_ready(self, video_id, filepath, other_jobs):
+        """
+        Records a newly downloaded file in the library index and links it into any other targets.
+        """
+        if self.library_index:
+            self.library_index.add(video_id, filepath)
+        if self.loudness_scanner:
+            self.loudness_scanner.submit(filepath)
+        self.on_track_finished(video_id, True, "Download successful")
+        self._place_copies(filepath, other_jobs)
+
+    def _complete_jobs(self, count):
+        with self.lock:
+            self.completed_tracks += count
+            
+            progress_percent = int((self.completed_tracks / self.total_tracks) * 100)
+            self.on_overall_progress(progress_percent)
+            self.on_estimate(self.estimator.format())
+
+    @timed('download.track')
+    def _download_track(self, track_info, playlist_position, other_jobs=()):
+        """
+        Downloads a single track. Once the file is in place it is also linked into the
+        targets of other_jobs, a list of (track_info, playlist_position) for the same video.
+        """
+        if not self.is_running:
+            return
+
+        video_id = track_info['videoId']
+
+        # Generate paths and filenames using FileManager
+        final_directory, filename = self._get_target(track_info, playlist_position)
+        if self.file_mover:
+            # One scratch folder per track keeps .part files and intermediates apart.
+            output_path = os.path.join(self.staging_directory, video_id)
+        else:
+            output_path = final_directory
+        
+        if not os.path.exists(output_path):
+            os.makedirs(output_path, exist_ok=True)
+            
+        output_template = os.path.join(output_path, filename + '.%(ext)s')
+
+        if self.file_manager.get_output_format() == 'native':
+            audio_format = 'bestaudio[ext=webm]/bestaudio[ext=m4a]/bestaudio/best'
+        else:
+            audio_format = 'bestaudio/best'
+
+        # Tags are passed as output options of whichever single ffmpeg pass runs, so the
+        # file is written once instead of being rewritten by a separate metadata step.
+        # The videoId tag lets TrackChecker recognise the file whatever it is named.
+        metadata_args = [
+            '-metadata', f"artist={', '.join([a['name'] for a in track_info.get('artists', [])])}",
+            '-metadata', f"title={track_info.get('title', 'N/A')}",
+            '-metadata', f"{VIDEO_ID_TAG}={video_id}"
+        ]
+
+        ydl_opts = {
+            'format': audio_format,
+            'outtmpl': output_template,
+            'progress_hooks': [self.progress_hook],
+            'postprocessor_hooks': [self.postprocessor_hook],
+            'nocheckcertificate': True,
+            'ignoreerrors': True,
+            'quiet': True,
+            'noplaylist': True,
+            'retries': 10,
+            'fragment_retries': 10,
+            'skip_unavailable_fragments': True,
+            # Enhanced anti-bot measures
+            'extractor_args': {
+                'youtube': {
+                    'player_client': ['android', 'web'],
+                    'player_skip': ['webpage', 'configs'],
+                }
+            },
+            # User agent and headers
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-us,en;q=0.5',
+                'Sec-Fetch-Mode': 'navigate',
+            },
+            'postprocessor_args': {
+                'extractaudio+ffmpeg_o': metadata_args,
+                'metadata+ffmpeg_o': metadata_args,
+            }
+        }
+
+        # Add cookies if provided
+        if self.cookies_file and os.path.exists(self.cookies_file):
+            ydl_opts['cookiefile'] = self.cookies_file
+            logging.info(f"Using cookies file: {self.cookies_file}")
+
+        try:
+            # yt_dlp is imported here rather than at module level to keep it off the GUI's startup path.
+            import yt_dlp
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # Resolve the format first so its size is known before the transfer starts.
+                with span('download.extract', video_id=video_id):
+                    info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
+                if info:
+                    self.estimator.set_expected_size(video_id, info.get('filesize') or info.get('filesize_approx'))
+                    self.on_estimate(self.estimator.format())
+                    for postprocessor in self._build_postprocessors(ydl, info):
+                        ydl.add_post_processor(postprocessor)
+                    ydl.process_ie_result(info, download=True)
+
+            final_filepath = self.file_manager.find_audio_file(output_path, filename)
+            if final_filepath and self.file_mover:
+                self.on_progress(video_id, "Moving...", "100")
+                destination = os.path.join(final_directory, os.path.basename(final_filepath))
+                self.file_mover.enqueue(final_filepath, destination, (video_id, destination, list(other_jobs)))
+            elif final_filepath:
+                self._on_track_ready(video_id, final_filepath, other_jobs)
+            else:
+                self.on_track_finished(video_id, False, "File is empty or missing.")
+                self._complete_jobs(len(other_jobs))
+
+        except Exception as e:
+            self.on_track_finished(video_id, False, f"Error: {str(e)}")
+            logging.error(f"Error downloading {video_id}: {e}")
+            self._complete_jobs(len(other_jobs))
+        finally:
+            # Close phases that never reported their end, e.g. after a failed download.
+            for key in [key for key in list(self.phase_spans) if key[0] == video_id]:
+                phase_span = self.phase_spans.pop(key, None)
+                if phase_span:
+                    phase_span.end(status='incomplete')
+
+        self.estimator.mark_finished(video_id)
+        self._complete_jobs(1)
+
+    def on_file_moved(self, context, success, message):
+        """
+        Called by the FileMover once a staged track has reached its final location.
+        """
+        video_id, destination, other_jobs = context
+        shutil.rmtree(os.path.join(self.staging_directory, video_id), ignore_errors=True)
+        if success:
+            self._on_track_ready(video_id, destination, other_jobs)
+        else:
+            self.on_track_finished(video_id, False, message)
+            self._complete_jobs(len(other_jobs))
+
+    def run(self):
+        """
+        Downloads every track using a thread pool and returns once all of them are done.
+        """
+        if self.file_mover:
+            self.file_mover.start()
+        if self.loudness_scanner:
+            self.loudness_scanner.start()
+
+        if self.fingerprint_index:
+            self.fingerprint_index.load(names_only=True)
+
+        if self.rekordbox_collection:
+            try:
+                self.rekordbox_collection.load()
+            except (OSError, ET.ParseError) as e:
+                logging.error(f"Could not load the Rekordbox collection {self.rekordbox_collection.xml_path}: {e}")
+                self.rekordbox_collection = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._process_group, video_id, jobs): video_id for video_id, jobs in self.groups.items()}
+
+            for future in as_completed(futures):
+                if not self.is_running:
+                    for f in futures:
+                        f.cancel()
+                    break
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"A download future resulted in an error: {e}")
+
+        if self.file_mover:
+            # Finish moving everything that was already downloaded, even when stopped.
+            self.file_mover.stop(wait=True)
+        if self.loudness_scanner:
+            self.on_estimate("Finishing loudness scans...")
+            self.loudness_scanner.finish()
+
+        if self.is_running:
+            self.on_all_finished()
+
+    def stop(self):
+        """
+        Stops the download process.
+        """
+        self.is_running = False
\ No newline at end of file
@@ -0,0 +1,167 @@
+import time
+import threading
+
+class DownloadEstimator:
+    """
+    Projects the total size, throughput and remaining time of a batch of downloads.
+    Estimates are based on bytes rather than track counts: every started track contributes
+    its expected size (from its resolved format or reported by yt-dlp), tracks that have not
+    started are projected at the average of those sizes, and the transfer rate is smoothed
+    with an exponentially weighted moving average so that single slow or fast fragments
+    do not make the ETA jump around.
+    """
+
+    def __init__(self, total_tracks, smoothing=0.3, sample_interval=0.5):
+        """
+        Initializes the DownloadEstimator.
+
+        Args:
+            total_tracks (int): The number of tracks in the batch.
+            smoothing (float): The EWMA weight given to the newest throughput sample (0-1).
+            sample_interval (float): Minimum number of seconds between throughput samples.
+        """
+        self.total_tracks = total_tracks
+        self.smoothing = smoothing
+        self.sample_interval = sample_interval
+        self.expected_bytes = {}
+        self.downloaded_bytes = {}
+        self.finished = set()
+        self.skipped = set()
+        self.rate = None
+        self._last_sample_time = None
+        self._last_sample_bytes = 0
+        self._last_report_time = 0
+        self.lock = threading.Lock()
+
+    def set_expected_size(self, video_id, size):
+        """
+        Records the expected transfer size of a track, e.g. from its resolved format.
+        Sizes reported later by the progress hook take precedence.
+        """
+        if not size:
+            return
+        with self.lock:
+            self.expected_bytes.setdefault(video_id, int(size))
+
+    def update(self, d):
+        """
+        Feeds a yt-dlp progress dictionary into the estimator.
+
+        Args:
+            d (dict): The progress dictionary passed to yt-dlp progress hooks.
+
+        Returns:
+            bool: True if enough time has passed that a new estimate should be reported.
+        """
+        video_id = d.get('info_dict', {}).get('id')
+        if not video_id:
+            return False
+
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        now = time.monotonic()
+
+        with self.lock:
+            if total:
+                self.expected_bytes[video_id] = int(total)
+            if d.get('status') == 'finished':
+                downloaded = downloaded or d.get('total_bytes') or self.expected_bytes.get(video_id, 0)
+            self.downloaded_bytes[video_id] = max(self.downloaded_bytes.get(video_id, 0), int(downloaded))
+            self._sample_rate(now)
+
+            if now - self._last_report_time >= self.sample_interval:
+                self._last_report_time = now
+                return True
+        return False
+
+    def mark_finished(self, video_id):
+        """
+        Marks a track as complete, whether it succeeded or failed, so that it no longer
+        contributes to the remaining bytes.
+        """
+        with self.lock:
+            self.finished.add(video_id)
+
+    def mark_skipped(self, video_id):
+        """
+        Marks a track that completed without a network transfer (e.g. a cache hit).
+        Skipped tracks count as done but are excluded from the size projection, so they
+        neither inflate the projected total nor skew the average track size.
+        """
+        with self.lock:
+            self.skipped.add(video_id)
+            self.finished.add(video_id)
+            self.expected_bytes.pop(video_id, None)
+            self.downloaded_bytes.pop(video_id, None)
+
+    def _sample_rate(self, now):
+        """
+        Updates the smoothed transfer rate from the bytes received since the last sample.
+        Must be called with the lock held.
+        """
+        total_downloaded = sum(self.downloaded_bytes.values())
+        if self._last_sample_time is None:
+            self._last_sample_time = now
+            self._last_sample_bytes = total_downloaded
+            return
+
+        elapsed = now - self._last_sample_time
+        if elapsed < self.sample_interval:
+            return
+
+        sample = max(total_downloaded - self._last_sample_bytes, 0) / elapsed
+        if self.rate is None:
+            self.rate = sample
+        else:
+            self.rate = self.smoothing * sample + (1 - self.smoothing) * self.rate
+        self._last_sample_time = now
+        self._last_sample_bytes = total_downloaded
+
+    def snapshot(self):
+        """
+        Returns the current projection.
+
+        Returns:
+            dict: 'projected_bytes', 'downloaded_bytes', 'rate' (bytes/s or None) and
+                  'eta' (seconds or None while the rate is still unknown).
+        """
+        with self.lock:
+            known_sizes = list(self.expected_bytes.values())
+            sized_ids = set(self.expected_bytes)
+            unsized_finished = len(self.finished - sized_ids - self.skipped)
+            pending_unknown = self.total_tracks - len(self.skipped) - len(sized_ids) - unsized_finished
+            average_size = sum(known_sizes) / len(known_sizes) if known_sizes else 0
+            projected = sum(known_sizes) + average_size * max(pending_unknown, 0)
+
+            downloaded = 0
+            for video_id, size in self.expected_bytes.items():
+                if video_id in self.finished:
+                    downloaded += size
+                else:
+                    downloaded += min(self.downloaded_bytes.get(video_id, 0), size)
+
+            remaining = max(projected - downloaded, 0)
+            eta = remaining / self.rate if self.rate else None
+            return {
+                'projected_bytes': projected,
+                'downloaded_bytes': downloaded,
+                'rate': self.rate,
+                'eta': eta,
+            }
+
+    def format(self):
+        """
+        Formats the current projection for display, e.g. "~84.2 MB | 1.9 MB/s | 0m 31s remaining".
+        """
+        snapshot = self.snapshot()
+        parts = [f"~{snapshot['projected_bytes'] / 1_000_000:.1f} MB"]
+        if snapshot['rate'] is not None:
+            parts.append(f"{snapshot['rate'] / 1_000_000:.1f} MB/s")
+        if snapshot['eta'] is None:
+            parts.append("Estimating...")
+        elif snapshot['eta'] > 0:
+            mins, secs = divmod(snapshot['eta'], 60)
+            parts.append(f"{int(mins)}m {int(secs)}s remaining")
+        else:
+            parts.append("Finishing...")
+        return " | ".join(parts)
@@ -0,0 +1,23 @@
+import requests
+from ytmusicapi.constants import YTM_DOMAIN
+from instrumentation import span, count
+
+class EndpointSession(requests.Session):
+    """
+    The requests session YTMusic sends its requests through. Each request is timed as an
+    'api.ytmusic' span, and if an endpoint is given, YouTube Music requests are sent there
+    instead, such as to a mock_api_server.
+    """
+
+    def __init__(self, endpoint=None):
+        super().__init__()
+        self.endpoint = endpoint.rstrip('/') if endpoint else None
+
+    def request(self, method, url, *args, **kwargs):
+        if self.endpoint and url.startswith(YTM_DOMAIN):
+            url = self.endpoint + url[len(YTM_DOMAIN):]
+        # ytmusicapi only applies its timeout to sessions it creates itself.
+        kwargs.setdefault('timeout', 30)
+        count('api.requests')
+        with span('api.ytmusic', endpoint=url.split('?', 1)[0].rsplit('/', 1)[-1]):
+            return super().request(method, url, *args, **kwargs)
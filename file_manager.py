@@ -1,13 +1,32 @@
-import re
 import os
+import string
+
+# Characters that are not allowed in file or directory names, mapped to '_'.
+SANITIZE_TABLE = str.maketrans({char: '_' for char in '\\/*?:"<>|'})
+
+# The built-in name orders, expressed as filename templates.
+PRESET_TEMPLATES = {
+    'track_artist': '{title}_{artists}',
+    'artist_track': '{artists}_{title}',
+}
+
+# Fields that may be used in a custom filename template.
+TEMPLATE_FIELDS = ('title', 'artists', 'artist', 'album', 'year', 'videoId')
 
 class FileManager:
     """
     Handles the creation and management of file and directory names for downloaded tracks.
     This class provides a centralized system for defining filename formats, ensuring that
     both the downloader and the download detector use the exact same naming conventions.
+    Filename templates are compiled once per configuration, and generated base names are
+    memoized per track until the configuration changes.
     """
 
+    # Extensions a downloaded track may have. 'mp3' mode always produces .mp3, while
+    # 'native' mode keeps the source codec and produces .opus or .m4a.
+    AUDIO_EXTENSIONS = ('.mp3', '.opus', '.m4a', '.ogg', '.aac')
+    OUTPUT_FORMATS = ('mp3', 'native')
+
     def __init__(self, config):
         """
         Initializes the FileManager with a given configuration.
@@ -15,10 +34,90 @@ class FileManager:
 
         Args:
             config (dict): A dictionary containing filename formatting options.
-                           Expected keys: 'numbering', 'numbering_style', 'name_order'.
+                           Expected keys: 'numbering', 'numbering_style', 'name_order',
+                           and 'name_template' when 'name_order' is 'custom'.
         """
+        self.config_version = 0
+        self._base_name_cache = {}
         self.config = config
 
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        """
+        Replaces the configuration, recompiling the filename template and invalidating
+        all memoized names. Assign a new dict rather than mutating the current one.
+        """
+        self._config = config
+        self._formatter = self.compile_template(self.get_name_template())
+        self.config_version += 1
+        self._base_name_cache = {}
+
+    def clear_cache(self):
+        """
+        Drops memoized names, e.g. after playlists were re-synced and titles may have changed.
+        """
+        self._base_name_cache = {}
+
+    def get_name_template(self):
+        """
+        Returns the filename template for the configured name order.
+        """
+        name_order = self._config.get('name_order')
+        if name_order == 'custom' and self._config.get('name_template'):
+            return self._config['name_template']
+        return PRESET_TEMPLATES.get(name_order, PRESET_TEMPLATES['track_artist'])
+
+    @staticmethod
+    def compile_template(template):
+        """
+        Compiles a filename template such as '{artists} - {title} ({year})' into a formatter.
+        The text before a field is only kept when that field has a value and something
+        precedes it (or it starts the template), and the text after the last field only when
+        that field has a value, so empty fields leave no stray separators.
+
+        Args:
+            template (str): The template, using the fields in TEMPLATE_FIELDS.
+
+        Returns:
+            callable: A function that renders a dict of sanitized field values.
+
+        Raises:
+            ValueError: If the template is malformed or uses an unknown field.
+        """
+        segments = []
+        for i, (literal, field, format_spec, conversion) in enumerate(string.Formatter().parse(template)):
+            if field is not None and field not in TEMPLATE_FIELDS:
+                raise ValueError(f"Unknown field '{{{field}}}' in filename template. "
+                                 f"Available fields: {', '.join(TEMPLATE_FIELDS)}")
+            if format_spec or conversion:
+                raise ValueError(f"Field '{{{field}}}' in filename template has a format spec or conversion; "
+                                 "only plain fields such as '{title}' are supported.")
+            segments.append((i == 0, literal.translate(SANITIZE_TABLE), field))
+
+        def render(values):
+            parts = []
+            # The trailing text follows the last field, or stands alone in a template without fields.
+            previous_rendered = True
+            for is_first, literal, field in segments:
+                if field is None:
+                    if previous_rendered:
+                        parts.append(literal)
+                    continue
+                value = values[field]
+                previous_rendered = bool(value)
+                if not value:
+                    continue
+                if parts or is_first:
+                    parts.append(literal)
+                parts.append(value)
+            return ''.join(parts)
+
+        return render
+
     def sanitize(self, name):
         """
         Removes characters from a string that are not allowed in file or directory names.
@@ -29,12 +128,13 @@ class FileManager:
         Returns:
             str: The sanitized string, safe to be used as a part of a filename.
         """
-        return re.sub(r'[\\/*?:"<>|]', '_', name)
+        return name.translate(SANITIZE_TABLE)
 
     def get_base_filename(self, track_info):
         """
         Constructs the base filename (artist and track name) without any numeric prefix.
-        This is used for comparison by the TrackChecker.
+        This is used for comparison by the TrackChecker. Results are memoized per videoId
+        for the current configuration.
 
         Args:
             track_info (dict): A dictionary containing the track's metadata.
@@ -42,16 +142,28 @@ class FileManager:
         Returns:
             str: The generated base filename.
         """
-        title = self.sanitize(track_info.get('title', 'Unknown Title'))
-        artists = self.sanitize(', '.join([artist['name'] for artist in track_info.get('artists', [])]))
-        
-        name_parts = []
-        if self.config.get('name_order') == 'artist_track':
-            name_parts.extend([artists, title])
-        else:  # Default to 'track_artist'
-            name_parts.extend([title, artists])
-
-        return '_'.join(filter(None, name_parts))
+        title = track_info.get('title', 'Unknown Title')
+        key = track_info.get('videoId')
+        cached = self._base_name_cache.get(key)
+        # The title guards against an entry made before the track was edited upstream.
+        if cached and cached[0] == title:
+            return cached[1]
+
+        artist_names = [artist['name'] for artist in track_info.get('artists', [])]
+        album = track_info.get('album')
+        values = {
+            'title': title.translate(SANITIZE_TABLE),
+            'artists': ', '.join(artist_names).translate(SANITIZE_TABLE),
+            'artist': artist_names[0].translate(SANITIZE_TABLE) if artist_names else '',
+            'album': (album.get('name') or '').translate(SANITIZE_TABLE) if isinstance(album, dict) else '',
+            'year': str(track_info.get('year') or ''),
+            'videoId': key or '',
+        }
+        base_filename = self._formatter(values)
+
+        if key:
+            self._base_name_cache[key] = (title, base_filename)
+        return base_filename
 
     def get_filename(self, track_info, playlist_position=None, total_tracks=None):
         """
@@ -92,6 +204,34 @@ class FileManager:
         
         return ""
 
+    def get_output_format(self):
+        """
+        Returns the configured output mode: 'mp3' (transcode to 320 kbps MP3) or
+        'native' (keep the source audio stream without re-encoding).
+        """
+        output_format = self.config.get('output_format', 'mp3')
+        return output_format if output_format in self.OUTPUT_FORMATS else 'mp3'
+
+    def is_audio_file(self, filename):
+        """
+        Checks whether a filename has one of the extensions a downloaded track can have.
+        """
+        return filename.lower().endswith(self.AUDIO_EXTENSIONS)
+
+    def find_audio_file(self, directory, filename):
+        """
+        Finds the downloaded file for a filename (without extension) in a directory,
+        whatever audio extension it was saved with.
+
+        Returns:
+            str or None: The full file path, or None if no non-empty file exists.
+        """
+        for ext in self.AUDIO_EXTENSIONS:
+            filepath = os.path.join(directory, filename + ext)
+            if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+                return filepath
+        return None
+
     def get_track_directory(self, download_dir, playlist_name, microplaylist_name=None):
         """
         Constructs the full directory path where a track should be saved.
@@ -0,0 +1,161 @@
+import os
+import queue
+import shutil
+import threading
+import logging
+from instrumentation import span
+
+# ioctl request number for FICLONE on Linux (copy-on-write clone of a whole file).
+FICLONE = 0x40049409
+
+def link_file(src, dst):
+    """
+    Makes src available at dst without copying its data where the filesystem allows it.
+    Tries a hardlink first, then a copy-on-write reflink, and finally a regular copy.
+
+    Returns:
+        str: The method that was used: 'hardlink', 'reflink' or 'copy'.
+    """
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    try:
+        import fcntl
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+def move_file(src, dst):
+    """
+    Moves a file so that it appears at its destination atomically.
+    A rename is used when both paths are on the same filesystem. Otherwise the file is
+    copied next to the destination under a temporary name and then renamed into place,
+    so a half-copied file is never visible under its final name.
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        pass
+
+    temp_dst = dst + '.moving'
+    try:
+        shutil.copyfile(src, temp_dst)
+        os.replace(temp_dst, dst)
+    except OSError:
+        if os.path.exists(temp_dst):
+            os.remove(temp_dst)
+        raise
+    os.remove(src)
+
+class FileMover:
+    """
+    Moves finished files from a local staging area into their final location in the background.
+    Downloads and encoding then only touch fast local storage, while the slower destination
+    (e.g. a network share) receives one finished file per track. Pending moves are collected
+    into batches so destination directories are created once per batch.
+    """
+
+    def __init__(self, on_moved=None, on_queue_changed=None, batch_size=16, batch_wait=0.5):
+        """
+        Initializes the FileMover.
+
+        Args:
+            on_moved (callable, optional): Called as on_moved(context, success, message) after each move.
+            on_queue_changed (callable, optional): Called with the number of pending moves whenever it changes.
+            batch_size (int): The maximum number of files moved per batch.
+            batch_wait (float): Seconds to wait for more files before starting a partial batch.
+        """
+        self.on_moved = on_moved
+        self.on_queue_changed = on_queue_changed
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="FileMover", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, src, dst, context=None):
+        """
+        Schedules a file to be moved to dst. The context is passed back to on_moved.
+        """
+        with self.lock:
+            self.pending += 1
+        self.queue.put((src, dst, context))
+        self._report_queue()
+
+    def queue_depth(self):
+        with self.lock:
+            return self.pending
+
+    def stop(self, wait=True):
+        """
+        Stops the mover after all queued files have been moved.
+        """
+        self.queue.put(None)
+        if wait and self.thread:
+            self.thread.join()
+
+    def _report_queue(self):
+        if self.on_queue_changed:
+            self.on_queue_changed(self.queue_depth())
+
+    def _next_batch(self):
+        """
+        Blocks for the first item, then collects more until the batch is full or the queue stays
+        empty for batch_wait seconds. Returns the batch and whether the stop marker was seen.
+        """
+        first = self.queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get(timeout=self.batch_wait)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+
+            for directory in {os.path.dirname(dst) for _, dst, _ in batch}:
+                try:
+                    os.makedirs(directory, exist_ok=True)
+                except OSError as e:
+                    logging.error(f"Error creating directory {directory}: {e}")
+
+            for src, dst, context in batch:
+                try:
+                    with span('download.move'):
+                        move_file(src, dst)
+                    success, message = True, "Download successful"
+                except OSError as e:
+                    success, message = False, f"Error moving file: {e}"
+                    logging.error(f"Error moving {src} to {dst}: {e}")
+
+                with self.lock:
+                    self.pending -= 1
+                if self.on_moved:
+                    self.on_moved(context, success, message)
+                self._report_queue()
@@ -0,0 +1,170 @@
+import numpy as np
+from functools import lru_cache
+from normalization import normalize_title
+
+NGRAM_SIZE = 3
+# Without SciPy the n-grams are folded into this many columns so the dense matrices stay small.
+DENSE_DIMENSIONS = 2048
+# Rows of the score matrix that are materialized at a time.
+BLOCK_ROWS = 512
+
+_sparse = False  # Not imported yet.
+
+def get_sparse():
+    """
+    Returns scipy.sparse, or None without SciPy. It is imported on the first match rather
+    than at module load because it takes longer to import than the rest of the app's startup.
+    """
+    global _sparse
+    if _sparse is False:
+        try:
+            from scipy import sparse
+        except ImportError:
+            sparse = None  # Fall back to dense NumPy matrices over hashed n-gram columns.
+        _sparse = sparse
+    return _sparse
+
+@lru_cache(maxsize=65536)
+def prepare_text(text):
+    """
+    Normalizes a title or filename and sorts its words, so that word order (e.g. the order
+    of featured artists, or artist and title in a filename) does not affect the score.
+    """
+    return ' '.join(sorted(normalize_title(text).split()))
+
+class FuzzyMatcher:
+    """
+    Matches track names to filenames by the cosine similarity of their character n-gram
+    TF-IDF vectors. All queries are scored against all candidates in one batched sparse
+    matrix product, so a whole playlist can be matched against a whole directory at once.
+    """
+
+    def __init__(self, threshold=0.8, review_threshold=0.55):
+        """
+        Initializes the FuzzyMatcher.
+
+        Args:
+            threshold (float): The minimum score for a match to be accepted.
+            review_threshold (float): The minimum score for a rejected match to be offered for review.
+        """
+        self.threshold = threshold
+        self.review_threshold = review_threshold
+
+    def _vectorize(self, texts):
+        """
+        Builds L2-normalized TF-IDF rows for all texts, in coordinate form. The n-grams of
+        all texts are extracted at once from a single array of code points.
+
+        Returns:
+            tuple: (rows, columns, values, column_count)
+        """
+        padded = [f' {text} ' for text in texts]
+        # Texts are joined with NUL separators; n-grams that span a separator are dropped.
+        code_points = np.frombuffer('\x00'.join(padded).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+        lengths = np.fromiter((len(text) + 1 for text in padded), dtype=np.int64, count=len(padded))
+        row_of_position = np.repeat(np.arange(len(texts)), lengths)[:len(code_points)]
+
+        position_count = len(code_points) - NGRAM_SIZE + 1
+        codes = np.zeros(position_count, dtype=np.int64)
+        valid = np.ones(position_count, dtype=bool)
+        for offset in range(NGRAM_SIZE):
+            window = code_points[offset:offset + position_count]
+            codes = (codes << 21) | window  # Unicode code points fit in 21 bits.
+            valid &= window != 0
+        rows = row_of_position[:position_count][valid]
+        _, cols = np.unique(codes[valid], return_inverse=True)
+        column_count = int(cols.max()) + 1 if len(cols) else 1
+
+        keys, counts = np.unique(rows * column_count + cols, return_counts=True)
+        rows, cols = keys // column_count, keys % column_count
+
+        document_frequency = np.bincount(cols, minlength=column_count)
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        values = counts * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+        values = (values / np.where(norms > 0, norms, 1)[rows]).astype(np.float32)
+        return rows, cols, values, column_count
+
+    def _best_matches(self, query_count, candidate_count, rows, cols, values, column_count):
+        """
+        Returns the best candidate index and score for every query.
+        """
+        is_query = rows < query_count
+        sparse = get_sparse()
+        if sparse is not None:
+            queries = sparse.csr_matrix((values[is_query], (rows[is_query], cols[is_query])),
+                                        shape=(query_count, column_count))
+            candidates = sparse.csr_matrix((values[~is_query], (rows[~is_query] - query_count, cols[~is_query])),
+                                           shape=(candidate_count, column_count)).T.tocsr()
+        else:
+            queries = np.zeros((query_count, DENSE_DIMENSIONS), dtype=np.float32)
+            np.add.at(queries, (rows[is_query], cols[is_query] % DENSE_DIMENSIONS), values[is_query])
+            candidates = np.zeros((candidate_count, DENSE_DIMENSIONS), dtype=np.float32)
+            np.add.at(candidates, (rows[~is_query] - query_count, cols[~is_query] % DENSE_DIMENSIONS), values[~is_query])
+            candidates = candidates.T
+
+        best_index = np.empty(query_count, dtype=np.int64)
+        best_score = np.empty(query_count, dtype=np.float32)
+        for start in range(0, query_count, BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            scores = queries[block] @ candidates
+            if sparse is not None:
+                best_index[block], best_score[block] = self._row_maxima(scores)
+            else:
+                best_index[block] = scores.argmax(axis=1)
+                best_score[block] = np.take_along_axis(scores, best_index[block, None], axis=1)[:, 0]
+        return best_index, best_score
+
+    @staticmethod
+    def _row_maxima(scores):
+        """
+        Returns the column and value of each row's largest entry of a sparse CSR score block,
+        reading only the stored entries. Ties go to the lowest column, as with argmax().
+        """
+        row_count = scores.shape[0]
+        counts = np.diff(scores.indptr)
+        non_empty = counts > 0
+        row_max = np.zeros(row_count, dtype=np.float32)
+        if scores.nnz:
+            row_max[non_empty] = np.maximum.reduceat(scores.data, scores.indptr[:-1][non_empty])
+        positions = np.flatnonzero(scores.data == np.repeat(row_max, counts))
+        best_column = np.zeros(row_count, dtype=np.int64)
+        if len(positions):
+            # The maxima of each row, lowest column first, then the first of each row.
+            rows = np.repeat(np.arange(row_count), counts)[positions]
+            columns = scores.indices[positions]
+            order = np.lexsort((columns, rows))
+            rows, columns = rows[order], columns[order]
+            first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            best_column[rows[first]] = columns[first]
+        return best_column, row_max
+
+    def match(self, queries, candidates):
+        """
+        Matches each query text to at most one candidate text. When several queries pick the
+        same candidate, only the best-scoring one keeps it and the others go to review.
+
+        Args:
+            queries (list): Texts to find, e.g. expected track names.
+            candidates (list): Texts to search, e.g. filenames without extensions.
+
+        Returns:
+            tuple: (matches, review), both lists of (query_index, candidate_index, score).
+                   matches holds the accepted matches, review the near misses.
+        """
+        if not queries or not candidates:
+            return [], []
+
+        texts = [prepare_text(text) for text in queries] + [prepare_text(text) for text in candidates]
+        best_index, best_score = self._best_matches(len(queries), len(candidates), *self._vectorize(texts))
+
+        matches, review = [], []
+        claimed = set()
+        for query_index in np.argsort(-best_score, kind='stable'):
+            candidate_index, score = int(best_index[query_index]), float(best_score[query_index])
+            if score >= self.threshold and candidate_index not in claimed:
+                claimed.add(candidate_index)
+                matches.append((int(query_index), candidate_index, score))
+            elif score >= self.review_threshold:
+                review.append((int(query_index), candidate_index, score))
+        return matches, review
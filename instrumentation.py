@@ -0,0 +1,293 @@
+"""
+Lightweight timing spans and counters for the app's hot operations.
+
+Instrumentation is off by default. While it is off, span() returns a shared no-op object
+and count() returns immediately, so the call sites cost a function call each. Once enable()
+has been called, every span is recorded as a Chrome trace event (open the written file in
+chrome://tracing or https://ui.perfetto.dev) and folded into a rolling per-operation summary.
+
+    from instrumentation import span, count, timed
+
+    with span('rescan', directory=path):
+        ...
+    count('api.requests')
+
+    @timed('segregate_tracks')
+    def segregate_tracks(...):
+        ...
+"""
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+DEFAULT_TRACE_PATH = 'profile_trace.json'
+# Recorded events are capped so a long session cannot grow memory without bound.
+MAX_EVENTS = 500000
+# Recent durations kept per operation for the rolling summary.
+SUMMARY_WINDOW = 256
+
+_recorder = None
+
+class _NullSpan:
+    """
+    The span handed out while instrumentation is disabled. Every method does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+    def end(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """
+    One timed operation. Use it as a context manager, or call end() when it finishes.
+    """
+    __slots__ = ('recorder', 'name', 'args', 'start', 'thread_id', 'ended')
+
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.ended = False
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.end()
+        return False
+
+    def set(self, **args):
+        """
+        Attaches more arguments to the span, e.g. a result size known only at the end.
+        """
+        self.args.update(args)
+
+    def end(self, **args):
+        if self.ended:
+            return
+        self.ended = True
+        self.args.update(args)
+        self.recorder.record(self.name, self.start, time.perf_counter(), self.args, self.thread_id)
+
+class Recorder:
+    """
+    Collects spans and counters into a bounded trace buffer and rolling per-operation statistics.
+    """
+
+    def __init__(self, trace_path=DEFAULT_TRACE_PATH, max_events=MAX_EVENTS, window=SUMMARY_WINDOW):
+        """
+        Initializes the Recorder.
+
+        Args:
+            trace_path (str): Where write_trace() saves the Chrome trace by default.
+            max_events (int): The most trace events kept; the oldest are dropped first.
+            window (int): The number of recent durations the rolling summary covers per operation.
+        """
+        self.trace_path = trace_path
+        self.window = window
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=max_events)
+        self.dropped = 0
+        self.stats = {}  # name -> [count, total, max, recent durations]
+        self.counters = {}
+        self.thread_names = {}
+
+    def _timestamp(self, perf_time):
+        return (perf_time - self.origin) * 1e6
+
+    def record(self, name, start, end, args, thread_id):
+        duration = end - start
+        event = {
+            'name': name,
+            'cat': name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': self._timestamp(start),
+            'dur': duration * 1e6,
+            'pid': self.pid,
+            'tid': thread_id,
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+            if thread_id not in self.thread_names:
+                self.thread_names[thread_id] = threading.current_thread().name
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = [0, 0.0, 0.0, deque(maxlen=self.window)]
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+            entry[3].append(duration)
+
+    def count(self, name, value):
+        with self.lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append({
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'C',
+                'ts': self._timestamp(time.perf_counter()),
+                'pid': self.pid,
+                'args': {'value': total},
+            })
+
+    def summary(self):
+        """
+        Returns one row per operation, slowest total first.
+
+        Returns:
+            list: Dicts with 'name', 'count', 'total', 'max', and the rolling 'mean' and 'p95'
+                  over the most recent durations, all in seconds.
+        """
+        with self.lock:
+            entries = [(name, entry[0], entry[1], entry[2], list(entry[3])) for name, entry in self.stats.items()]
+        rows = []
+        for name, count, total, longest, recent in entries:
+            recent.sort()
+            rows.append({
+                'name': name,
+                'count': count,
+                'total': total,
+                'max': longest,
+                'mean': sum(recent) / len(recent),
+                'p95': recent[min(len(recent) - 1, int(len(recent) * 0.95))],
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def write_trace(self, path=None):
+        """
+        Writes the recorded events as a Chrome trace JSON file.
+
+        Returns:
+            str: The path written.
+        """
+        path = path or self.trace_path
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+            other_data = {'dropped_events': self.dropped, 'counters': dict(self.counters)}
+        for thread_id, thread_name in thread_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread_id, 'args': {'name': thread_name}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': other_data}, f)
+        return path
+
+def enable(trace_path=DEFAULT_TRACE_PATH, max_events=MAX_EVENTS, window=SUMMARY_WINDOW):
+    """
+    Starts recording. Calling it again while enabled keeps the current recording.
+
+    Returns:
+        Recorder: The active recorder.
+    """
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder(trace_path, max_events, window)
+    return _recorder
+
+def disable():
+    global _recorder
+    _recorder = None
+
+def is_enabled():
+    return _recorder is not None
+
+def get_recorder():
+    return _recorder
+
+def span(name, **args):
+    """
+    Returns a span timing the enclosed block, or a no-op span while instrumentation is disabled.
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, args)
+
+def record(name, start, end, **args):
+    """
+    Records a span whose start and end times (from time.perf_counter()) were taken elsewhere,
+    e.g. before instrumentation was enabled.
+    """
+    if _recorder is not None:
+        _recorder.record(name, start, end, args, threading.get_ident())
+
+# start_span() reads better where a span is ended from another callback than the one that started it.
+start_span = span
+
+def count(name, value=1):
+    """
+    Adds value to a named counter.
+    """
+    if _recorder is not None:
+        _recorder.count(name, value)
+
+def timed(name):
+    """
+    Decorates a function so every call is recorded as a span with the given name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with Span(_recorder, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def summary():
+    return _recorder.summary() if _recorder else []
+
+def counters():
+    if _recorder is None:
+        return {}
+    with _recorder.lock:
+        return dict(_recorder.counters)
+
+def format_summary(rows=None):
+    """
+    Formats the rolling summary as a plain-text table.
+    """
+    rows = summary() if rows is None else rows
+    lines = [f"{'Operation':<32} {'Count':>8} {'Total':>10} {'Mean':>10} {'p95':>10} {'Max':>10}"]
+    for row in rows:
+        lines.append(f"{row['name']:<32} {row['count']:>8} {row['total']:>9.3f}s "
+                     f"{row['mean'] * 1000:>8.1f}ms {row['p95'] * 1000:>8.1f}ms {row['max'] * 1000:>8.1f}ms")
+    for name, value in sorted(counters().items()):
+        lines.append(f"{name:<32} {value:>8}")
+    return "\n".join(lines)
+
+def write_trace(path=None):
+    """
+    Writes the Chrome trace of the active recording.
+
+    Returns:
+        str or None: The path written, or None if instrumentation is disabled.
+    """
+    return _recorder.write_trace(path) if _recorder else None
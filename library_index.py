@@ -0,0 +1,81 @@
+import os
+import threading
+from download_engine import make_download_job
+
+class LibraryIndex:
+    """
+    A library-wide map of videoIds to files that already exist in the download directory.
+    It lets the downloader reuse a track archived for one playlist or micro-playlist
+    when the same video is requested for another, instead of downloading it again.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def build(self, playlists, microplaylist_handler, track_checker, find_missing=()):
+        """
+        Rebuilds the index from the tagged files found by the TrackChecker, then resolves the
+        remaining tracks of every synced playlist to their local files by name. The folders of
+        the find_missing playlists are also fuzzy-matched, so a track is only reported missing
+        if the track view would show it as not downloaded.
+
+        Args:
+            playlists (dict or PlaylistStore): All synced playlists, keyed by playlist ID.
+            microplaylist_handler (MicroPlaylistHandler): Used to find each track's micro-playlist folder.
+            track_checker (TrackChecker): Used to locate the downloaded files.
+            find_missing (iterable): IDs of playlists whose tracks without a local file are
+                collected in the same pass.
+
+        Returns:
+            list: (playlist ID, download job) for every target folder of the find_missing playlists
+                that lacks its track, in library and playlist order. See make_download_job().
+        """
+        find_missing = set(find_missing)
+        missing = []
+        # Tagged files are found regardless of their name or folder.
+        paths = {video_id: filepaths[0] for video_id, filepaths in track_checker.video_id_map.items()}
+        # One playlist at a time, so a lazily loaded library only holds a few playlists' tracks at once.
+        for p_id in playlists:
+            playlist_info = playlists[p_id]
+            micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks({p_id: playlist_info})
+            placements = [(mp_name, tracks) for (_, mp_name), tracks in micro_tracks_map.items()]
+            placements += [(None, tracks) for tracks in remaining_tracks_map.values()]
+            # Every target folder is checked in these playlists, not only the first one per video.
+            check_all_targets = p_id in find_missing
+            seen_targets = set()
+
+            for micro_name, tracks in placements:
+                if check_all_targets:
+                    # Files named differently from the current template count, as they do in the track view.
+                    track_checker.match_playlist(tracks, playlist_info, micro_name)
+                for track in tracks:
+                    video_id = track.get('videoId')
+                    if not video_id or (video_id, micro_name) in seen_targets:
+                        continue
+                    if not check_all_targets and video_id in paths:
+                        continue
+                    seen_targets.add((video_id, micro_name))
+                    filepath = track_checker.is_downloaded(track, playlist_info, micro_name)
+                    if filepath:
+                        paths.setdefault(video_id, filepath)
+                    elif check_all_targets:
+                        missing.append((p_id, make_download_job(track, playlist_info, micro_name)))
+
+        with self.lock:
+            self.paths = paths
+        return missing
+
+    def add(self, video_id, filepath):
+        with self.lock:
+            self.paths[video_id] = filepath
+
+    def find(self, video_id):
+        """
+        Returns the path of an existing, non-empty file for a videoId, or None.
+        """
+        with self.lock:
+            filepath = self.paths.get(video_id)
+        if filepath and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            return filepath
+        return None
@@ -0,0 +1,188 @@
+import os
+import threading
+from track_checker import TrackChecker
+from instrumentation import span, count
+
+class LibraryStatus:
+    """
+    Keeps the number of downloaded and missing tracks, and the size of the downloaded files, of
+    every synced playlist and micro-playlist folder.
+    A playlist is counted once with the TrackChecker. After that, a folder is brought up to date
+    by reading that one folder again (refresh_directory) when a download finishes or the folder
+    changes on disk, so the counts never require walking the whole download directory.
+    Files are matched by name and then fuzzily, as in the track view, so the counts agree with it.
+    """
+
+    def __init__(self, file_manager, download_directory, fuzzy_matcher=None):
+        """
+        Initializes the LibraryStatus.
+
+        Args:
+            file_manager (FileManager): Used to find each folder and the expected filenames.
+            download_directory (str): The root directory where tracks are saved.
+            fuzzy_matcher (FuzzyMatcher, optional): Scores near-miss filenames when a folder is read
+                again. A default one is created on first use, which also defers importing NumPy.
+        """
+        self.file_manager = file_manager
+        self.download_directory = download_directory
+        self.fuzzy_matcher = fuzzy_matcher
+        # (playlist ID, micro-playlist name or None) -> {'directory', 'files', 'missing', 'size'}.
+        # 'files' maps the videoIds found to their filenames and 'missing' maps the others to the
+        # prefix-stripped base name their file will have.
+        self.folders = {}
+        self.lock = threading.RLock()
+
+    def _list_directory(self, directory):
+        """
+        Returns the audio files of one directory with their sizes, or an empty dict if it does not exist.
+        """
+        listing = {}
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return listing
+        for entry in entries:
+            if entry.is_file() and self.file_manager.is_audio_file(entry.name):
+                try:
+                    listing[entry.name] = entry.stat().st_size
+                except OSError:
+                    pass
+        return listing
+
+    @staticmethod
+    def _base_name(filename):
+        return TrackChecker.strip_number_prefix(os.path.splitext(filename)[0])
+
+    def update_playlist(self, p_id, playlist_info, microplaylist_handler, track_checker):
+        """
+        Counts one playlist's folders from the TrackChecker's last scan, replacing its previous counts.
+
+        Args:
+            p_id (str): The playlist ID.
+            playlist_info (dict): The synced playlist.
+            microplaylist_handler (MicroPlaylistHandler): Used to find each track's micro-playlist folder.
+            track_checker (TrackChecker): Used to locate the downloaded files.
+        """
+        with span('library_status.update_playlist', playlist_id=p_id):
+            micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks({p_id: playlist_info})
+            placements = [(mp_name, tracks) for (_, mp_name), tracks in micro_tracks_map.items()]
+            placements += [(None, tracks) for tracks in remaining_tracks_map.values()]
+
+            folders = {}
+            for micro_name, tracks in placements:
+                directory = self.file_manager.get_track_directory(
+                    self.download_directory, playlist_info.get('title', 'Unknown Playlist'), micro_name)
+                folder = folders.setdefault((p_id, micro_name), {'directory': directory, 'files': {}, 'missing': {}, 'size': 0})
+                track_checker.match_playlist(tracks, playlist_info, micro_name)
+                for track in tracks:
+                    video_id = track.get('videoId')
+                    if not video_id or video_id in folder['files'] or video_id in folder['missing']:
+                        continue
+                    filepath = track_checker.is_downloaded(track, playlist_info, micro_name)
+                    if filepath:
+                        folder['files'][video_id] = os.path.basename(filepath)
+                    else:
+                        folder['missing'][video_id] = self.file_manager.get_base_filename(track)
+            for folder in folders.values():
+                listing = self._list_directory(folder['directory'])
+                folder['size'] = sum(listing.get(filename, 0) for filename in folder['files'].values())
+
+        with self.lock:
+            self.remove_playlist(p_id)
+            self.folders.update(folders)
+
+    def remove_playlist(self, p_id):
+        with self.lock:
+            for key in [key for key in self.folders if key[0] == p_id]:
+                del self.folders[key]
+
+    def refresh_directory(self, directory):
+        """
+        Reads one directory again and updates the folders stored in it: files that appeared
+        are matched to missing tracks by name and then fuzzily, and tracks whose file is gone
+        count as missing.
+
+        Returns:
+            set: The IDs of the playlists whose counts changed.
+        """
+        listing = self._list_directory(directory)
+        index = {}
+        for filename in listing:
+            index.setdefault(self._base_name(filename), filename)
+
+        changed = set()
+        with self.lock:
+            for (p_id, _), folder in self.folders.items():
+                if folder['directory'] != directory:
+                    continue
+                before = (len(folder['files']), folder['size'])
+                for video_id, filename in list(folder['files'].items()):
+                    if filename not in listing:
+                        del folder['files'][video_id]
+                        folder['missing'][video_id] = self._base_name(filename)
+                for video_id, base_name in list(folder['missing'].items()):
+                    filename = index.get(base_name)
+                    if filename:
+                        del folder['missing'][video_id]
+                        folder['files'][video_id] = filename
+                if folder['missing']:
+                    self._match_fuzzy(folder, listing)
+                folder['size'] = sum(listing.get(filename, 0) for filename in folder['files'].values())
+                if (len(folder['files']), folder['size']) != before:
+                    changed.add(p_id)
+        count('library_status.refreshed_directories')
+        return changed
+
+    def _match_fuzzy(self, folder, listing):
+        """
+        Matches a folder's missing tracks against the files no track of the folder claims, in one batch.
+        """
+        claimed = set(folder['files'].values())
+        candidates = [filename for filename in listing if filename not in claimed]
+        if not candidates:
+            return
+        missing = list(folder['missing'].items())
+        if self.fuzzy_matcher is None:
+            from fuzzy_matcher import FuzzyMatcher
+            self.fuzzy_matcher = FuzzyMatcher()
+        matches, _ = self.fuzzy_matcher.match([base_name for _, base_name in missing],
+                                              [self._base_name(filename) for filename in candidates])
+        for query_index, candidate_index, _ in matches:
+            video_id = missing[query_index][0]
+            del folder['missing'][video_id]
+            folder['files'][video_id] = candidates[candidate_index]
+
+    def directories(self):
+        """
+        Returns the directories of all counted folders, including ones that do not exist yet.
+        """
+        with self.lock:
+            return {folder['directory'] for folder in self.folders.values()}
+
+    def directories_with(self, video_id):
+        """
+        Returns the directories of the folders in which a videoId is missing.
+        """
+        with self.lock:
+            return {folder['directory'] for folder in self.folders.values() if video_id in folder['missing']}
+
+    def get_counts(self, p_id):
+        """
+        Returns a playlist's counts, or None if it has not been counted yet.
+
+        Returns:
+            dict: 'downloaded', 'missing' and 'size' (in bytes) summed over the playlist's folders,
+                and 'micro' with the same counts per micro-playlist name.
+        """
+        with self.lock:
+            folders = [(key[1], folder) for key, folder in self.folders.items() if key[0] == p_id]
+            if not folders:
+                return None
+            totals = {'downloaded': 0, 'missing': 0, 'size': 0, 'micro': {}}
+            for micro_name, folder in folders:
+                counts = {'downloaded': len(folder['files']), 'missing': len(folder['missing']), 'size': folder['size']}
+                for key in ('downloaded', 'missing', 'size'):
+                    totals[key] += counts[key]
+                if micro_name is not None:
+                    totals['micro'][micro_name] = counts
+            return totals
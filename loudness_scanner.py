@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import shutil
+import logging
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from audio_analysis import decode_audio
+
+# ITU-R BS.1770 / EBU R128 measurement parameters.
+LOUDNESS_SAMPLE_RATE = 48000
+SEGMENT_SECONDS = 0.1  # Gating blocks are 400 ms with 75% overlap, i.e. four 100 ms segments.
+SEGMENTS_PER_BLOCK = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# K-weighting filter stages at 48 kHz as (b, a) coefficients: a high shelf, then a high-pass.
+K_WEIGHTING_STAGES = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+# True peak is measured on a 4x oversampled signal using a 48-tap interpolation filter.
+OVERSAMPLING = 4
+OVERSAMPLING_TAPS = 48
+# Segments or samples processed per vectorized step, which bounds memory use.
+PROCESSING_BLOCK = 1 << 16
+
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+OPUS_REFERENCE_LUFS = -23.0
+
+def k_weighting_power(frequencies, sample_rate=LOUDNESS_SAMPLE_RATE):
+    """
+    Returns the power response of the K-weighting filter at the given frequencies.
+    """
+    z = np.exp(-2j * np.pi * np.asarray(frequencies) / sample_rate)
+    response = np.ones_like(z)
+    for b, a in K_WEIGHTING_STAGES:
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+def integrated_loudness(samples, sample_rate=LOUDNESS_SAMPLE_RATE):
+    """
+    Computes the gated integrated loudness of a (samples, channels) array.
+    The K-weighting is applied in the frequency domain: by Parseval's theorem the mean
+    square of each filtered 100 ms segment is the K-weighted sum of its power spectrum,
+    so every segment of every channel is filtered and measured in one batched FFT.
+
+    Returns:
+        float or None: The loudness in LUFS, or None if the audio is shorter than one block or silent.
+    """
+    segment_length = int(sample_rate * SEGMENT_SECONDS)
+    segment_count = len(samples) // segment_length
+    if segment_count < SEGMENTS_PER_BLOCK:
+        return None
+
+    # Weights that turn an rfft power spectrum into the mean square of the filtered segment.
+    weights = k_weighting_power(np.fft.rfftfreq(segment_length, 1 / sample_rate))
+    weights[1:(segment_length + 1) // 2] *= 2
+    weights /= segment_length ** 2
+
+    segments = samples[:segment_count * segment_length].reshape(segment_count, segment_length, -1)
+    segment_power = np.empty(segment_count)
+    step = max(1, PROCESSING_BLOCK // segment_length)
+    for start in range(0, segment_count, step):
+        spectrum = np.fft.rfft(segments[start:start + step], axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        # Channel weights are 1.0 for left and right, so channel powers are simply summed.
+        segment_power[start:start + step] = np.einsum('sfc,f->s', power, weights)
+
+    kernel = np.ones(SEGMENTS_PER_BLOCK) / SEGMENTS_PER_BLOCK
+    block_power = np.convolve(segment_power, kernel, mode='valid')
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+
+    gated = block_loudness > ABSOLUTE_GATE_LUFS
+    if not gated.any():
+        return None
+    relative_gate = -0.691 + 10 * np.log10(block_power[gated].mean()) + RELATIVE_GATE_LU
+    gated &= block_loudness > relative_gate
+    return float(-0.691 + 10 * np.log10(block_power[gated].mean()))
+
+def _oversampling_matrix():
+    """
+    Returns the polyphase interpolation filter as a (taps per phase, phases) matrix.
+    """
+    n = np.arange(OVERSAMPLING_TAPS) - (OVERSAMPLING_TAPS - 1) / 2
+    taps = np.sinc(n / OVERSAMPLING) * np.hanning(OVERSAMPLING_TAPS + 2)[1:-1]
+    taps *= OVERSAMPLING / taps.sum()
+    return taps.reshape(-1, OVERSAMPLING)[::-1].astype(np.float32)
+
+def true_peak(samples):
+    """
+    Returns the true peak of a (samples, channels) array as a linear amplitude. Every
+    window of the signal is multiplied with the polyphase filter matrix at once, which
+    yields all four interpolated phases per input sample.
+    """
+    matrix = _oversampling_matrix()
+    taps_per_phase = matrix.shape[0]
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    for channel in range(samples.shape[1]):
+        padded = np.concatenate([np.zeros(taps_per_phase, dtype=np.float32), samples[:, channel],
+                                 np.zeros(taps_per_phase, dtype=np.float32)])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, taps_per_phase)
+        for start in range(0, len(windows), PROCESSING_BLOCK):
+            peak = max(peak, float(np.abs(windows[start:start + PROCESSING_BLOCK] @ matrix).max()))
+    return peak
+
+def write_replaygain_tags(filepath, loudness, peak):
+    """
+    Writes ReplayGain 2.0 track tags (and the R128 gain tag for Opus) by remuxing the file
+    without re-encoding. Files that are hardlinked elsewhere in the library are rewritten in
+    place so every link sees the tags; other files are replaced atomically.
+
+    Raises:
+        FileNotFoundError: If ffmpeg is not installed.
+        subprocess.CalledProcessError: If ffmpeg cannot remux the file.
+    """
+    directory, filename = os.path.split(filepath)
+    temp_path = os.path.join(directory, f".replaygain-{filename}")
+    metadata = [
+        '-metadata', f"REPLAYGAIN_TRACK_GAIN={REPLAYGAIN_REFERENCE_LUFS - loudness:+.2f} dB",
+        '-metadata', f"REPLAYGAIN_TRACK_PEAK={peak:.6f}",
+    ]
+    if filename.lower().endswith('.opus'):
+        # Opus players apply R128_TRACK_GAIN, a Q7.8 number relative to -23 LUFS.
+        metadata += ['-metadata', f"R128_TRACK_GAIN={round((OPUS_REFERENCE_LUFS - loudness) * 256)}"]
+    command = ['ffmpeg', '-v', 'error', '-nostdin', '-y', '-i', filepath, '-map', '0', '-c', 'copy',
+               '-map_metadata', '0'] + metadata + [temp_path]
+    try:
+        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        if os.stat(filepath).st_nlink > 1:
+            with open(temp_path, 'rb') as src, open(filepath, 'r+b') as dst:
+                shutil.copyfileobj(src, dst)
+                dst.truncate()
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, filepath)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def scan_file(filepath, write_tags=False):
+    """
+    Measures one file's integrated loudness and true peak. Runs in a worker process.
+
+    Returns:
+        dict: 'loudness' (LUFS), 'true_peak' (dBTP), 'gain' (ReplayGain dB) and 'duration' (seconds),
+              or 'error' if the file could not be scanned.
+    """
+    try:
+        samples = decode_audio(filepath, LOUDNESS_SAMPLE_RATE, max_seconds=None, channels=2)
+        loudness = integrated_loudness(samples)
+        if loudness is None:
+            return {'error': "The file is too short or silent."}
+        peak = true_peak(samples)
+        if write_tags:
+            write_replaygain_tags(filepath, loudness, peak)
+    except FileNotFoundError:
+        return {'error': "ffmpeg was not found."}
+    except subprocess.CalledProcessError as e:
+        return {'error': e.stderr.decode('utf-8', 'replace').strip() or "ffmpeg failed."}
+    except OSError as e:
+        return {'error': str(e)}
+    return {
+        'loudness': round(loudness, 2),
+        'true_peak': round(20 * np.log10(peak), 2) if peak > 0 else None,
+        'gain': round(REPLAYGAIN_REFERENCE_LUFS - loudness, 2),
+        'duration': round(len(samples) / LOUDNESS_SAMPLE_RATE, 2),
+    }
+
+def format_throughput(stats, library_size=60000):
+    """
+    Summarizes a scan's throughput, including the projected time for a library of the given size.
+    """
+    if not stats.get('scanned') or not stats.get('elapsed'):
+        return "No files were scanned."
+    files_per_second = stats['scanned'] / stats['elapsed']
+    realtime_factor = stats['audio_seconds'] / stats['elapsed']
+    projected_hours = library_size / files_per_second / 3600
+    return (f"{files_per_second:.1f} files/s ({realtime_factor:.0f}x realtime); "
+            f"{library_size:,} tracks would take about {projected_hours:.1f} h")
+
+class LoudnessScanner:
+    """
+    Measures EBU R128 integrated loudness and true peak of downloaded files in a pool of
+    worker processes, and optionally writes ReplayGain tags. Results are cached per file
+    by size and modification time. Files can be scanned as a batch over the library, or
+    submitted one by one while a download is running.
+    """
+
+    def __init__(self, cache_path='loudness_cache.json', max_workers=None, write_tags=False):
+        """
+        Initializes the LoudnessScanner.
+
+        Args:
+            cache_path (str): Where results are cached between runs.
+            max_workers (int, optional): The number of scanning processes. Defaults to the CPU count.
+            write_tags (bool): Whether to write ReplayGain tags into the scanned files.
+        """
+        self.cache_path = cache_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.write_tags = write_tags
+        self.lock = threading.Lock()
+        self.cache = self.load_cache()
+        self.executor = None
+
+    def load_cache(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_cache(self):
+        with self.lock:
+            cache = dict(self.cache)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+
+    def get_result(self, filepath):
+        """
+        Returns the cached measurement of a file, or None if it has not been scanned since it last changed.
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.cache.get(filepath)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def _store(self, filepath, result):
+        """
+        Caches a result under the file's current size and mtime, which change if tags were written.
+        """
+        if 'error' in result:
+            logging.error(f"Could not scan the loudness of {filepath}: {result['error']}")
+            return False
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        with self.lock:
+            self.cache[filepath] = [stat.st_size, stat.st_mtime_ns, result]
+        return True
+
+    def scan(self, filepaths, progress_callback=None, should_continue=None):
+        """
+        Scans every file without a cached result.
+
+        Args:
+            filepaths (iterable): The audio files to scan.
+            progress_callback (callable, optional): Called as progress_callback(done, total).
+            should_continue (callable, optional): Polled between files; returning False stops the run.
+
+        Returns:
+            dict: 'scanned', 'cached' and 'failed' file counts, plus 'audio_seconds' scanned and
+                  'elapsed' wall-clock seconds for throughput reporting.
+        """
+        filepaths = list(filepaths)
+        stats = {'scanned': 0, 'cached': 0, 'failed': 0, 'audio_seconds': 0.0, 'elapsed': 0.0}
+        pending = [filepath for filepath in filepaths if self.get_result(filepath) is None]
+        stats['cached'] = len(filepaths) - len(pending)
+        if progress_callback:
+            progress_callback(stats['cached'], len(filepaths))
+
+        started = time.perf_counter()
+        if pending and (not should_continue or should_continue()):
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(scan_file, filepath, self.write_tags): filepath for filepath in pending}
+                for done, future in enumerate(as_completed(futures), start=stats['cached'] + 1):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': str(e)}
+                    if self._store(futures[future], result):
+                        stats['scanned'] += 1
+                        stats['audio_seconds'] += result['duration']
+                    else:
+                        stats['failed'] += 1
+                    if progress_callback:
+                        progress_callback(done, len(filepaths))
+                    if should_continue and not should_continue():
+                        for f in futures:
+                            f.cancel()
+                        break
+        stats['elapsed'] = time.perf_counter() - started
+
+        self.save_cache()
+        return stats
+
+    def start(self):
+        """
+        Starts the worker pool for submit().
+        """
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, filepath):
+        """
+        Schedules one file, e.g. right after it was downloaded. The result is cached when it completes.
+        """
+        future = self.executor.submit(scan_file, filepath, self.write_tags)
+        future.add_done_callback(lambda f: self._on_scanned(filepath, f))
+
+    def _on_scanned(self, filepath, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'error': str(e)}
+        self._store(filepath, result)
+
+    def finish(self):
+        """
+        Waits for all submitted files and saves the cache.
+        """
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.save_cache()
@@ -1,25 +1,61 @@
+import time
+# Startup timings are measured from here; see MainWindow.report_startup().
+STARTED_AT = time.perf_counter()
 import sys
+import json
+import locale
+import multiprocessing
 import os
 import re
-import json
+import tempfile
 import qdarkstyle
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QLabel,
     QPushButton, QTreeWidget, QTreeWidgetItem, QTableWidget, QTableWidgetItem, QComboBox,
     QProgressBar, QInputDialog, QFileDialog, QDialog, QLineEdit, QMessageBox, QListWidget,
-    QTreeWidgetItemIterator, QDialogButtonBox, QRadioButton, QGroupBox
+    QTreeWidgetItemIterator, QDialogButtonBox, QRadioButton, QGroupBox, QCheckBox, QHeaderView
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl, QTimer, QFileSystemWatcher
 from PyQt6.QtGui import QBrush, QColor, QDesktopServices
 
 from youtube_handler import YouTubeHandler
 from microplaylist_handler import MicroPlaylistHandler
-from file_manager import FileManager
+from file_manager import FileManager, PRESET_TEMPLATES, TEMPLATE_FIELDS
 from download_handler import DownloadHandler
+from download_engine import DOWNLOAD_PRIORITIES, make_download_job, plan_missing_downloads
+import storage
 from track_checker import TrackChecker
+from tag_index import TagIndex
+from library_index import LibraryIndex
+from library_status import LibraryStatus
+from update_checker import UpdateChecker, DEFAULT_CHECK_INTERVAL_MINUTES, DEFAULT_DAILY_QUOTA
+from rename_planner import RenamePlanner, build_reformat_mapping
+from rekordbox_exporter import RekordboxExporter
+from rekordbox_importer import RekordboxCollection
+import instrumentation
+from instrumentation import count, span, timed
 from styling import STYLE_SHEET
 
+IMPORTED_AT = time.perf_counter()
+
+# How long folder change notifications are collected before the affected folders are read again.
+STATUS_REFRESH_DELAY_MS = 500
+
+# The track view's sort orders, by the sort box's text. "Date Added" keeps the playlist order.
+TRACK_SORT_KEYS = {
+    "Track Name": lambda track: (track.title_key, track.artist_key, track.position or 0),
+    "Artist Name": lambda track: (track.artist_key, track.title_key, track.position or 0),
+}
+
+def format_size(size):
+    """
+    Formats a size in bytes for display, e.g. "840 MB" or "12.4 GB".
+    """
+    if size >= 1_000_000_000:
+        return f"{size / 1_000_000_000:.1f} GB"
+    return f"{size / 1_000_000:.0f} MB"
+
 # --- Worker Threads ---
 class LoginThread(QThread):
     auth_finished = pyqtSignal(str)
@@ -30,6 +66,49 @@ class LoginThread(QThread):
         result = self.youtube_handler.authenticate()
         self.auth_finished.emit(result)
 
+class CredentialsThread(QThread):
+    credentials_loaded = pyqtSignal()
+    def __init__(self, youtube_handler):
+        super().__init__()
+        self.youtube_handler = youtube_handler
+    def run(self):
+        # Refreshing an expired token is a network request, so it is kept off the GUI thread.
+        self.youtube_handler.load_credentials()
+        self.credentials_loaded.emit()
+
+class LibraryLoadThread(QThread):
+    """
+    Opens the synced playlists' manifest, loads the analysis caches and scans the download
+    directory, so the window can be shown before the library is ready.
+    """
+    library_loaded = pyqtSignal(dict)
+
+    def __init__(self, library_directory, track_checker, config):
+        super().__init__()
+        self.library_directory = library_directory
+        self.track_checker = track_checker
+        self.config = config
+
+    def run(self):
+        # The analysis modules pull in NumPy, so they are first imported here rather than at startup.
+        from audio_analysis import AudioAnalyzer
+        from loudness_scanner import LoudnessScanner
+        from audio_fingerprint import FingerprintIndex
+        try:
+            with span('startup.library'):
+                playlists = storage.PlaylistStore(self.library_directory,
+                                                  keep_raw=self.config.get("keep_raw_track_data", False))
+                self.track_checker.rescan()
+                library = {
+                    'playlists': playlists,
+                    'audio_analyzer': AudioAnalyzer(),
+                    'loudness_scanner': LoudnessScanner(write_tags=self.config.get("write_replaygain", False)),
+                    'fingerprint_index': FingerprintIndex(),
+                }
+        except Exception as e:
+            library = {'error': str(e)}
+        self.library_loaded.emit(library)
+
 class FetchAllPlaylistsThread(QThread):
     fetch_finished = pyqtSignal(object)
     def __init__(self, youtube_handler):
@@ -40,7 +119,7 @@ class FetchAllPlaylistsThread(QThread):
         self.fetch_finished.emit(playlists)
 
 class FullSyncThread(QThread):
-    sync_finished = pyqtSignal(dict, list)
+    sync_finished = pyqtSignal(dict, list, dict)
 
     def __init__(self, youtube_handler, playlists_to_sync):
         super().__init__()
@@ -48,41 +127,175 @@ class FullSyncThread(QThread):
         self.playlists_to_sync = playlists_to_sync
 
     def run(self):
-        live_user_playlists = self.youtube_handler.get_all_user_playlists()
-        if 'error' in live_user_playlists:
-            self.sync_finished.emit({}, [f"Error fetching playlists: {live_user_playlists['error']}"])
-            return
-            
-        live_playlist_map = {p['id']: p for p in live_user_playlists}
-        updated_playlists = {}
-        summary = []
-        
-        for playlist_id, old_playlist_data in self.playlists_to_sync.items():
-            if playlist_id not in live_playlist_map:
-                summary.append(f"'{old_playlist_data.get('title', '...')}'': Skipped (not found in your account).")
-                continue
+        # Fetched first, so a change made while the playlists are read is found by the next update check.
+        signatures = self.youtube_handler.get_playlist_signatures(list(self.playlists_to_sync))
+        updated_playlists, summary = self.youtube_handler.sync_playlists(self.playlists_to_sync)
+        self.sync_finished.emit(updated_playlists, summary, {} if 'error' in signatures else signatures)
+
+class DownloadPlanThread(QThread):
+    """
+    Finds the missing tracks of synced playlists and their micro-playlists, e.g. for "Download All Missing".
+    It scans with its own TrackChecker and builds a new LibraryIndex, so the track view can keep
+    using the window's while the plan is made.
+    """
+    plan_finished = pyqtSignal(list)
+
+    def __init__(self, playlists, microplaylist_handler, track_checker, priority, playlist_ids=None):
+        super().__init__()
+        self.playlists = playlists
+        self.playlist_ids = playlist_ids
+        self.microplaylist_handler = microplaylist_handler
+        self.track_checker = track_checker
+        self.library_index = LibraryIndex()
+        self.priority = priority
 
-            live_data = live_playlist_map[playlist_id]
-            is_now_private = live_data['privacyStatus'] != 'public'
-            
-            new_data = self.youtube_handler.get_playlist_info(playlist_id, is_now_private)
-            
-            if new_data and 'error' not in new_data:
-                old_ids = {t['videoId'] for t in old_playlist_data.get('tracks', [])}
-                new_ids = {t['videoId'] for t in new_data.get('tracks', [])}
-                count = len(new_ids - old_ids)
-                if count > 0:
-                    summary.append(f"'{new_data.get('title', '...')[:30]}...': {count} new song(s)")
-
-                new_data['is_private'] = is_now_private
-                updated_playlists[playlist_id] = new_data
+    def run(self):
+        self.track_checker.rescan()
+        playlist_ids = list(self.playlists) if self.playlist_ids is None else self.playlist_ids
+        jobs = plan_missing_downloads(playlist_ids, self.playlists, self.microplaylist_handler,
+                                      self.track_checker, self.library_index, self.priority)
+        self.plan_finished.emit(jobs)
+
+class LibraryIndexThread(QThread):
+    """
+    Builds a new LibraryIndex with its own TrackChecker, e.g. before the selected tracks are downloaded.
+    """
+    index_built = pyqtSignal()
+
+    def __init__(self, playlists, microplaylist_handler, track_checker):
+        super().__init__()
+        self.playlists = playlists
+        self.microplaylist_handler = microplaylist_handler
+        self.track_checker = track_checker
+        self.library_index = LibraryIndex()
+
+    def run(self):
+        self.track_checker.rescan()
+        self.library_index.build(self.playlists, self.microplaylist_handler, self.track_checker)
+        self.index_built.emit()
+
+class UpdateCheckThread(QThread):
+    check_finished = pyqtSignal(dict)
+
+    def __init__(self, update_checker, track_counts):
+        super().__init__()
+        self.update_checker = update_checker
+        self.track_counts = track_counts
+
+    def run(self):
+        self.check_finished.emit(self.update_checker.check(list(self.track_counts), self.track_counts))
+
+class LibraryStatusThread(QThread):
+    """
+    Counts the downloaded and missing tracks of synced playlists for the playlist tree.
+    It scans with its own TrackChecker, so the track view can rescan the window's meanwhile.
+    """
+    playlist_counted = pyqtSignal(str)
+
+    def __init__(self, library_status, playlists, playlist_ids, microplaylist_handler, track_checker):
+        super().__init__()
+        self.library_status = library_status
+        self.playlists = playlists
+        self.playlist_ids = playlist_ids
+        self.microplaylist_handler = microplaylist_handler
+        self.track_checker = track_checker
+        self.is_running = True
+
+    def run(self):
+        self.track_checker.rescan()
+        for p_id in self.playlist_ids:
+            if not self.is_running:
+                break
+            if p_id in self.playlists:
+                self.library_status.update_playlist(p_id, self.playlists[p_id], self.microplaylist_handler, self.track_checker)
             else:
-                summary.append(f"'{old_playlist_data.get('title', '...')}'': Failed to sync.")
-            
-            QApplication.processEvents()
-            
-        self.sync_finished.emit(updated_playlists, summary)
+                self.library_status.remove_playlist(p_id)
+            self.playlist_counted.emit(p_id)
+
+    def stop(self):
+        self.is_running = False
 
+class ReformatThread(QThread):
+    progress = pyqtSignal(int, int)
+    reformat_finished = pyqtSignal(int, list)
+
+    def __init__(self, planner, journal_path):
+        super().__init__()
+        self.planner = planner
+        self.journal_path = journal_path
+
+    def run(self):
+        renamed, errors = self.planner.apply(self.journal_path, self.progress.emit)
+        self.reformat_finished.emit(renamed, errors)
+
+class RekordboxExportThread(QThread):
+    progress = pyqtSignal(int, int)
+    export_finished = pyqtSignal(object)
+
+    def __init__(self, exporter, playlists, output_path):
+        super().__init__()
+        self.exporter = exporter
+        self.playlists = playlists
+        self.output_path = output_path
+
+    def run(self):
+        try:
+            result = self.exporter.export(self.playlists, self.output_path, self.progress.emit)
+        except OSError as e:
+            result = {"error": str(e)}
+        self.export_finished.emit(result)
+
+class AnalysisThread(QThread):
+    progress = pyqtSignal(int, int)
+    analysis_finished = pyqtSignal(dict)
+
+    def __init__(self, analyzer, filepaths):
+        super().__init__()
+        self.analyzer = analyzer
+        self.filepaths = filepaths
+        self.is_running = True
+
+    def run(self):
+        counts = self.analyzer.analyze(self.filepaths, self.progress.emit, lambda: self.is_running)
+        self.analysis_finished.emit(counts)
+
+    def stop(self):
+        self.is_running = False
+
+class LoudnessScanThread(QThread):
+    progress = pyqtSignal(int, int)
+    scan_finished = pyqtSignal(dict)
+
+    def __init__(self, scanner, filepaths):
+        super().__init__()
+        self.scanner = scanner
+        self.filepaths = filepaths
+        self.is_running = True
+
+    def run(self):
+        stats = self.scanner.scan(self.filepaths, self.progress.emit, lambda: self.is_running)
+        self.scan_finished.emit(stats)
+
+    def stop(self):
+        self.is_running = False
+class DuplicateScanThread(QThread):
+    progress = pyqtSignal(int, int)
+    scan_finished = pyqtSignal(dict, list)
+
+    def __init__(self, fingerprint_index, filepaths):
+        super().__init__()
+        self.fingerprint_index = fingerprint_index
+        self.filepaths = filepaths
+        self.is_running = True
+
+    def run(self):
+        self.fingerprint_index.load()
+        counts = self.fingerprint_index.update(self.filepaths, self.progress.emit, lambda: self.is_running)
+        clusters = self.fingerprint_index.find_duplicates() if self.is_running else []
+        self.scan_finished.emit(counts, clusters)
+
+    def stop(self):
+        self.is_running = False
 
 # --- Dialogs ---
 class CreateMicroPlaylistDialog(QDialog):
@@ -310,9 +523,88 @@ class SettingsDialog(QDialog):
         self.rb_order_artist_track = QRadioButton("Artist Name - Track Name")
         order_layout.addWidget(self.rb_order_track_artist)
         order_layout.addWidget(self.rb_order_artist_track)
+        self.rb_order_custom = QRadioButton("Custom Template")
+        self.template_input = QLineEdit()
+        self.template_input.setPlaceholderText(PRESET_TEMPLATES["track_artist"])
+        self.template_input.setToolTip("Available fields: " + ", ".join("{" + field + "}" for field in TEMPLATE_FIELDS))
+        self.rb_order_custom.toggled.connect(self.template_input.setEnabled)
+        order_layout.addWidget(self.rb_order_custom)
+        order_layout.addWidget(self.template_input)
         order_group.setLayout(order_layout)
         self.layout.addWidget(order_group)
 
+        format_group = QGroupBox("Output Format")
+        format_layout = QVBoxLayout()
+        self.rb_format_mp3 = QRadioButton("MP3 320 kbps (re-encode)")
+        self.rb_format_native = QRadioButton("Original (no re-encode, .opus/.m4a)")
+        format_layout.addWidget(self.rb_format_mp3)
+        format_layout.addWidget(self.rb_format_native)
+        format_group.setLayout(format_layout)
+        self.layout.addWidget(format_group)
+
+        self.staging_checkbox = QCheckBox("Download to local scratch disk first, then move into the download directory")
+        self.layout.addWidget(self.staging_checkbox)
+
+        priority_layout = QHBoxLayout()
+        self.priority_combo = QComboBox()
+        for priority, label in DOWNLOAD_PRIORITIES.items():
+            self.priority_combo.addItem(label, priority)
+        priority_layout.addWidget(QLabel("Download All Missing order:"))
+        priority_layout.addWidget(self.priority_combo)
+        priority_layout.addStretch()
+        self.layout.addLayout(priority_layout)
+
+        loudness_group = QGroupBox("Loudness")
+        loudness_layout = QVBoxLayout()
+        self.loudness_checkbox = QCheckBox("Measure loudness (EBU R128) right after each download")
+        self.replaygain_checkbox = QCheckBox("Write ReplayGain tags into scanned files")
+        loudness_layout.addWidget(self.loudness_checkbox)
+        loudness_layout.addWidget(self.replaygain_checkbox)
+        loudness_group.setLayout(loudness_layout)
+        self.layout.addWidget(loudness_group)
+
+        collection_group = QGroupBox("Existing Rekordbox Collection")
+        collection_layout = QVBoxLayout()
+        xml_layout = QHBoxLayout()
+        self.collection_xml_input = QLineEdit(self.config.get("rekordbox_collection_xml", ""))
+        self.collection_xml_input.setPlaceholderText("rekordbox.xml exported from Rekordbox (optional)")
+        collection_browse_button = QPushButton("Browse...")
+        collection_browse_button.clicked.connect(self.browse_collection_xml)
+        xml_layout.addWidget(self.collection_xml_input)
+        xml_layout.addWidget(collection_browse_button)
+        collection_layout.addLayout(xml_layout)
+        self.rb_collection_skip = QRadioButton("Skip tracks already in the collection")
+        self.rb_collection_link = QRadioButton("Link the collection's file into the download folder")
+        collection_layout.addWidget(self.rb_collection_skip)
+        collection_layout.addWidget(self.rb_collection_link)
+        collection_group.setLayout(collection_layout)
+        self.layout.addWidget(collection_group)
+
+        updates_group = QGroupBox("Update Checks")
+        updates_layout = QVBoxLayout()
+        interval_layout = QHBoxLayout()
+        self.update_interval_combo = QComboBox()
+        for label, minutes in (("Never", 0), ("Every 15 minutes", 15), ("Every 30 minutes", 30),
+                               ("Every hour", 60), ("Every 6 hours", 360), ("Once a day", 1440)):
+            self.update_interval_combo.addItem(label, minutes)
+        interval_layout.addWidget(QLabel("Check synced playlists for changes:"))
+        interval_layout.addWidget(self.update_interval_combo)
+        interval_layout.addStretch()
+        updates_layout.addLayout(interval_layout)
+        self.auto_sync_checkbox = QCheckBox("Sync changed playlists automatically")
+        self.auto_download_checkbox = QCheckBox("Then download their new tracks")
+        self.auto_sync_checkbox.toggled.connect(self.auto_download_checkbox.setEnabled)
+        updates_layout.addWidget(self.auto_sync_checkbox)
+        updates_layout.addWidget(self.auto_download_checkbox)
+        updates_group.setLayout(updates_layout)
+        self.layout.addWidget(updates_group)
+
+        self.keep_raw_checkbox = QCheckBox("Also keep the full track data YouTube returns when syncing (library/raw)")
+        self.layout.addWidget(self.keep_raw_checkbox)
+
+        self.profiling_checkbox = QCheckBox(f"Record a performance profile (written to {instrumentation.DEFAULT_TRACE_PATH} on exit)")
+        self.layout.addWidget(self.profiling_checkbox)
+
         self.button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         self.button_box.accepted.connect(self.accept)
         self.button_box.rejected.connect(self.reject)
@@ -326,6 +618,11 @@ class SettingsDialog(QDialog):
             self.dir_label.setText(directory)
             self.config["download_directory"] = directory
 
+    def browse_collection_xml(self):
+        filepath, _ = QFileDialog.getOpenFileName(self, "Select Rekordbox Collection XML", "", "Rekordbox XML (*.xml)")
+        if filepath:
+            self.collection_xml_input.setText(filepath)
+
     def load_settings(self):
         num_setting = self.config.get("numbering", "playlist_order")
         if num_setting == "none": self.rb_num_none.setChecked(True)
@@ -334,18 +631,122 @@ class SettingsDialog(QDialog):
         
         order_setting = self.config.get("name_order", "track_artist")
         if order_setting == "artist_track": self.rb_order_artist_track.setChecked(True)
+        elif order_setting == "custom": self.rb_order_custom.setChecked(True)
         else: self.rb_order_track_artist.setChecked(True)
+        self.template_input.setText(self.config.get("name_template", ""))
+        self.template_input.setEnabled(self.rb_order_custom.isChecked())
+
+        format_setting = self.config.get("output_format", "mp3")
+        if format_setting == "native": self.rb_format_native.setChecked(True)
+        else: self.rb_format_mp3.setChecked(True)
+
+        self.staging_checkbox.setChecked(self.config.get("staging_enabled", False))
+        self.priority_combo.setCurrentIndex(max(0, self.priority_combo.findData(self.config.get("download_priority", "library"))))
+        self.loudness_checkbox.setChecked(self.config.get("loudness_after_download", False))
+        self.replaygain_checkbox.setChecked(self.config.get("write_replaygain", False))
+
+        if self.config.get("rekordbox_collection_mode") == "link": self.rb_collection_link.setChecked(True)
+        else: self.rb_collection_skip.setChecked(True)
+
+        interval_index = self.update_interval_combo.findData(self.config.get("update_check_minutes", DEFAULT_CHECK_INTERVAL_MINUTES))
+        self.update_interval_combo.setCurrentIndex(interval_index if interval_index >= 0 else 0)
+        self.auto_sync_checkbox.setChecked(self.config.get("auto_sync_updates", False))
+        self.auto_download_checkbox.setChecked(self.config.get("auto_download_updates", False))
+        self.auto_download_checkbox.setEnabled(self.auto_sync_checkbox.isChecked())
+
+        self.keep_raw_checkbox.setChecked(self.config.get("keep_raw_track_data", False))
+        self.profiling_checkbox.setChecked(self.config.get("profiling_enabled", False))
 
     def accept(self):
         if self.rb_num_none.isChecked(): self.config["numbering"] = "none"
         elif self.rb_num_release.isChecked(): self.config["numbering"] = "release_year"
         else: self.config["numbering"] = "playlist_order"
         
-        if self.rb_order_artist_track.isChecked(): self.config["name_order"] = "artist_track"
+        if self.rb_order_custom.isChecked():
+            template = self.template_input.text().strip()
+            try:
+                FileManager.compile_template(template)
+            except ValueError as e:
+                QMessageBox.warning(self, "Invalid Template", str(e))
+                return
+            if not template:
+                QMessageBox.warning(self, "Invalid Template", "Please enter a filename template.")
+                return
+            self.config["name_order"] = "custom"
+            self.config["name_template"] = template
+        elif self.rb_order_artist_track.isChecked(): self.config["name_order"] = "artist_track"
         else: self.config["name_order"] = "track_artist"
+
+        if self.rb_format_native.isChecked(): self.config["output_format"] = "native"
+        else: self.config["output_format"] = "mp3"
+
+        self.config["staging_enabled"] = self.staging_checkbox.isChecked()
+        self.config["download_priority"] = self.priority_combo.currentData()
+        self.config["loudness_after_download"] = self.loudness_checkbox.isChecked()
+        self.config["write_replaygain"] = self.replaygain_checkbox.isChecked()
+
+        self.config["rekordbox_collection_xml"] = self.collection_xml_input.text().strip()
+        self.config["rekordbox_collection_mode"] = "link" if self.rb_collection_link.isChecked() else "skip"
+        self.config["update_check_minutes"] = self.update_interval_combo.currentData()
+        self.config["auto_sync_updates"] = self.auto_sync_checkbox.isChecked()
+        self.config["auto_download_updates"] = self.auto_download_checkbox.isChecked()
+        self.config["keep_raw_track_data"] = self.keep_raw_checkbox.isChecked()
+        self.config["profiling_enabled"] = self.profiling_checkbox.isChecked()
         
         super().accept()
 
+class ProfileDialog(QDialog):
+    """
+    A live view of the instrumentation summary, refreshed every second while open.
+    """
+    COLUMNS = ["Operation", "Count", "Total (s)", "Mean (ms)", "p95 (ms)", "Max (ms)"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Performance Profile")
+        self.setMinimumSize(700, 450)
+        self.layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setColumnWidth(0, 240)
+        self.table.verticalHeader().setVisible(False)
+        self.layout.addWidget(self.table)
+        self.counters_label = QLabel()
+        self.counters_label.setWordWrap(True)
+        self.layout.addWidget(self.counters_label)
+
+        buttons_layout = QHBoxLayout()
+        save_button = QPushButton("Save Trace...")
+        save_button.clicked.connect(self.save_trace)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(save_button)
+        buttons_layout.addWidget(close_button)
+        self.layout.addLayout(buttons_layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        rows = instrumentation.summary()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row['name'], str(row['count']), f"{row['total']:.3f}",
+                      f"{row['mean'] * 1000:.1f}", f"{row['p95'] * 1000:.1f}", f"{row['max'] * 1000:.1f}"]
+            for column, value in enumerate(values):
+                self.table.setItem(i, column, QTableWidgetItem(value))
+        counters = instrumentation.counters()
+        self.counters_label.setText("Counters: " + (", ".join(f"{name} {value}" for name, value in sorted(counters.items())) or "none"))
+
+    def save_trace(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, "Save Chrome Trace", instrumentation.DEFAULT_TRACE_PATH, "Trace (*.json)")
+        if filepath:
+            instrumentation.write_trace(filepath)
+
 # --- Main Window ---
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -355,40 +756,98 @@ class MainWindow(QMainWindow):
         self.setGeometry(100, 100, 1200, 800)
         
         print("Initializing handlers...")
-        self.youtube_handler = YouTubeHandler()
+        # Set YTMUSIC_API_ENDPOINT to run against a local mock_api_server instead of the live services.
+        # Stored credentials are loaded (and refreshed if expired) by a CredentialsThread below.
+        self.youtube_handler = YouTubeHandler(api_endpoint=os.environ.get("YTMUSIC_API_ENDPOINT"), defer_credentials=True)
         print("YouTubeHandler initialized.")
         self.microplaylist_handler = MicroPlaylistHandler()
         print("MicroPlaylistHandler initialized.")
 
         self.playlists = {}
         self.downloader = None
-        self.playlists_file = "playlists.json"
-        self.config_file = "config.json"
+        # The DownloadPlanThread or LibraryIndexThread preparing the next downloads, while it runs.
+        self.download_plan = None
+        self.library_directory = storage.LIBRARY_DIRECTORY
+        self.config_file = storage.CONFIG_FILE
+        self.reformat_journal_file = "reformat_journal.jsonl"
         self.config = {}
         self.expanded_folders = set()
+        # p_id -> (tracks list, {sort mode: the tracks in that order}) for recently viewed playlists.
+        self.track_orders = OrderedDict()
+        self.credentials_checked = False
+        self.library_loaded = False
+        self.startup_times = {'imports': IMPORTED_AT - STARTED_AT}
         
         print("Loading config...")
         self.load_config()
         print("Config loaded.")
+        if self.config.get("profiling_enabled") or os.environ.get("YTMUSIC_PROFILE"):
+            instrumentation.enable(os.environ.get("YTMUSIC_PROFILE") or instrumentation.DEFAULT_TRACE_PATH)
+            instrumentation.record('startup.imports', STARTED_AT, IMPORTED_AT)
 
         self.file_manager = FileManager(self.config)
         print("FileManager initialized.")
-        self.track_checker = TrackChecker(self.file_manager, self.config.get("download_directory"))
+        # The directory scan and the analysis caches are loaded by the LibraryLoadThread.
+        self.track_checker = TrackChecker(self.file_manager, self.config.get("download_directory"), scan=False)
         print("TrackChecker initialized.")
+        self.library_index = LibraryIndex()
+        # Counts for the playlist tree, kept up to date from folder change notifications.
+        self.library_status = LibraryStatus(self.file_manager, self.config.get("download_directory"))
+        self.status_thread = None
+        self.pending_status_counts = set()
+        self.pending_status_directories = set()
+        self.status_watcher = QFileSystemWatcher(self)
+        self.status_watcher.directoryChanged.connect(self.on_status_directory_changed)
+        self.status_refresh_timer = QTimer(self)
+        self.status_refresh_timer.setSingleShot(True)
+        self.status_refresh_timer.setInterval(STATUS_REFRESH_DELAY_MS)
+        self.status_refresh_timer.timeout.connect(self.refresh_status_directories)
+        self.playlist_items = {}
+        # Periodic checks for playlists changed on YouTube, started once the library is loaded.
+        self.update_checker = UpdateChecker(self.youtube_handler,
+                                            daily_quota=self.config.get("update_check_daily_quota", DEFAULT_DAILY_QUOTA))
+        self.update_check_timer = QTimer(self)
+        self.update_check_timer.setSingleShot(True)
+        self.update_check_timer.timeout.connect(self.start_update_check)
+        self.audio_analyzer = None
+        self.loudness_scanner = None
+        self.fingerprint_index = None
 
         print("Setting up UI...")
         self.setup_ui()
         print("UI setup finished.")
 
-        print("Loading playlists...")
+        print("Loading playlists in the background...")
         self.load_playlists()
-        print("Playlists loaded.")
 
         self.update_login_button_state()
-        if self.youtube_handler.is_authenticated():
-            self.fetch_all_user_playlists()
+        self.credentials_thread = CredentialsThread(self.youtube_handler)
+        self.credentials_thread.credentials_loaded.connect(self.on_credentials_loaded)
+        self.credentials_thread.start()
         print("MainWindow initialization finished.")
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if 'first_paint' not in self.startup_times:
+            self.startup_times['first_paint'] = time.perf_counter() - STARTED_AT
+            instrumentation.record('startup.first_paint', STARTED_AT, time.perf_counter())
+            self.report_startup()
+
+    def report_startup(self):
+        """
+        Prints the startup timings once the window has painted and the library has loaded.
+        With YTMUSIC_STARTUP_BENCHMARK set to a file path, the timings are written there as JSON
+        and the app quits, which is how benchmark.py tracks them.
+        """
+        if 'first_paint' not in self.startup_times or 'library' not in self.startup_times:
+            return
+        print("Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.startup_times.items()))
+        report_path = os.environ.get("YTMUSIC_STARTUP_BENCHMARK")
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(self.startup_times, f)
+            QTimer.singleShot(0, self.close)
+
     def setup_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -399,6 +858,11 @@ class MainWindow(QMainWindow):
         left_layout.addWidget(QLabel("Playlists"))
         self.playlist_tree = QTreeWidget()
         self.playlist_tree.setHeaderHidden(True)
+        # The second column shows each synced playlist's missing tracks and downloaded size.
+        self.playlist_tree.setColumnCount(2)
+        self.playlist_tree.header().setStretchLastSection(False)
+        self.playlist_tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.playlist_tree.header().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
         self.playlist_tree.itemDoubleClicked.connect(self.sync_playlist_from_tree)
         self.playlist_tree.currentItemChanged.connect(self.display_tracks)
         left_layout.addWidget(self.playlist_tree)
@@ -448,9 +912,12 @@ class MainWindow(QMainWindow):
         right_layout.addLayout(tracks_header_layout)
 
         self.tracks_tree = QTreeWidget()
-        self.tracks_tree.setHeaderLabels(["Track", "Artist", "Status"])
+        self.tracks_tree.setHeaderLabels(["Track", "Artist", "Status", "BPM", "Key", "Loudness"])
         self.tracks_tree.setColumnWidth(0, 400)
         self.tracks_tree.setColumnWidth(1, 200)
+        self.tracks_tree.setColumnWidth(2, 150)
+        self.tracks_tree.setColumnWidth(3, 60)
+        self.tracks_tree.setColumnWidth(4, 60)
         self.tracks_tree.setSelectionMode(QTreeWidget.SelectionMode.ExtendedSelection)
         self.tracks_tree.currentItemChanged.connect(self.update_micro_buttons_state)
         self.tracks_tree.itemDoubleClicked.connect(self.on_track_double_clicked)
@@ -473,10 +940,31 @@ class MainWindow(QMainWindow):
         self.full_refresh_button = QPushButton("Full Refresh")
         self.full_refresh_button.clicked.connect(self.start_full_sync)
 
+        export_button = QPushButton("Export to Rekordbox")
+        export_button.clicked.connect(self.export_rekordbox_xml)
+
+        self.analyze_button = QPushButton("Analyze BPM/Key")
+        self.analyze_button.clicked.connect(self.start_analysis)
+
+        self.loudness_button = QPushButton("Scan Loudness")
+        self.loudness_button.clicked.connect(self.start_loudness_scan)
+
+        self.duplicates_button = QPushButton("Find Duplicates")
+        self.duplicates_button.clicked.connect(self.start_duplicate_scan)
+
         controls_layout.addWidget(self.login_logout_button)
         controls_layout.addWidget(settings_button)
         controls_layout.addWidget(reformat_button)
         controls_layout.addWidget(self.full_refresh_button)
+        controls_layout.addWidget(export_button)
+        controls_layout.addWidget(self.analyze_button)
+        controls_layout.addWidget(self.loudness_button)
+        controls_layout.addWidget(self.duplicates_button)
+
+        self.profile_button = QPushButton("Profile")
+        self.profile_button.clicked.connect(self.open_profile_dialog)
+        self.profile_button.setVisible(instrumentation.is_enabled())
+        controls_layout.addWidget(self.profile_button)
         controls_layout.addStretch()
 
         self.logged_out_label = QLabel("Login to sync your YouTube playlists.")
@@ -486,6 +974,13 @@ class MainWindow(QMainWindow):
         self.download_button = QPushButton("Download Selected")
         self.download_button.clicked.connect(self.start_download)
         controls_layout.addWidget(self.download_button)
+        self.download_all_button = QPushButton("Download All Missing")
+        self.download_all_button.clicked.connect(self.start_download_all_missing)
+        controls_layout.addWidget(self.download_all_button)
+        # Enabled once the LibraryLoadThread has finished.
+        self.library_buttons = [add_playlist_button, remove_playlist_button, settings_button, reformat_button,
+                                export_button, self.analyze_button, self.loudness_button, self.duplicates_button,
+                                self.download_button, self.download_all_button]
         self.progress_bar = QProgressBar()
         bottom_layout.addLayout(controls_layout)
         bottom_layout.addWidget(self.progress_bar)
@@ -500,20 +995,12 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(bottom_panel)
 
     def load_config(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                self.config = json.load(f)
-        else:
-            self.config = {
-                "download_directory": "",
-                "numbering": "playlist_order",
-                "name_order": "track_artist"
-            }
+        self.config = storage.load_config(self.config_file)
+        if not os.path.exists(self.config_file):
             self.save_config()
 
     def save_config(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        storage.save_config(self.config, self.config_file)
     
     def on_track_double_clicked(self, item, column):
         data = item.data(0, Qt.ItemDataRole.UserRole)
@@ -553,10 +1040,25 @@ class MainWindow(QMainWindow):
             old_config = self.config
             self.config = dialog.config
             self.save_config()
+            # Assigning the config recompiles the filename template and drops memoized names.
             self.file_manager.config = self.config
+            self.loudness_scanner.write_tags = self.config.get("write_replaygain", False)
+            self.playlists.keep_raw = self.config.get("keep_raw_track_data", False)
+            if self.config.get("profiling_enabled") and not instrumentation.is_enabled():
+                instrumentation.enable()
+            elif not self.config.get("profiling_enabled") and instrumentation.is_enabled() and not os.environ.get("YTMUSIC_PROFILE"):
+                print(f"Profile written to {instrumentation.write_trace()}")
+                instrumentation.disable()
+            self.profile_button.setVisible(instrumentation.is_enabled())
 
             if old_config.get("download_directory") != self.config.get("download_directory"):
                 self.track_checker = TrackChecker(self.file_manager, self.config.get("download_directory"))
+                self.library_status.download_directory = self.config.get("download_directory")
+                if self.status_watcher.directories():
+                    self.status_watcher.removePaths(self.status_watcher.directories())
+            # Folder and file names may have changed with the settings.
+            self.recount_playlists()
+            self.schedule_update_check()
 
             current_playlist_item = self.playlist_tree.currentItem()
             if current_playlist_item:
@@ -567,6 +1069,12 @@ class MainWindow(QMainWindow):
                                     "Settings have been updated. If you changed the filename format, "
                                     "you may want to use the 'Reformat Files' button.")
 
+    def open_profile_dialog(self):
+        if not hasattr(self, 'profile_dialog'):
+            self.profile_dialog = ProfileDialog(self)
+        self.profile_dialog.show()
+        self.profile_dialog.raise_()
+
     def reformat_filenames(self):
         current_item = self.playlist_tree.currentItem()
         if not current_item:
@@ -580,47 +1088,170 @@ class MainWindow(QMainWindow):
         
         item_type, p_id = user_data
             
-        reply = QMessageBox.question(self, "Confirm Reformat", 
-                                     "This will rename all downloaded files in the selected playlist according to the current settings. "
-                                     "This action cannot be undone. Are you sure you want to continue?",
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
-                                     QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.No:
+        playlist_info = self.playlists.get(p_id)
+        if not playlist_info:
             return
 
-        self.status_label.setText("Reformatting files... Please wait.")
-        QApplication.processEvents()
+        self.track_checker.rescan()
+        mapping = build_reformat_mapping(p_id, playlist_info, self.file_manager, self.track_checker, self.microplaylist_handler)
+        planner = RenamePlanner(mapping)
+        if not planner.operations:
+            self.status_label.setText(f"Nothing to reformat. Conflicts: {len(planner.conflicts)}")
+            return
 
-        playlist_info = self.playlists.get(p_id)
-        if not playlist_info:
+        confirm_box = QMessageBox(QMessageBox.Icon.Question, "Confirm Reformat",
+                                  f"{planner.rename_count()} downloaded file(s) in the selected playlist will be renamed "
+                                  f"according to the current settings ({len(planner.conflicts)} skipped). "
+                                  "See the details for the full list. Do you want to continue?",
+                                  QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, self)
+        confirm_box.setDetailedText(planner.describe())
+        confirm_box.setDefaultButton(QMessageBox.StandardButton.No)
+        if confirm_box.exec() != QMessageBox.StandardButton.Yes:
             return
 
+        self.status_label.setText("Reformatting files...")
+        self.progress_bar.setValue(0)
+        self.reformat_thread = ReformatThread(planner, self.reformat_journal_file)
+        self.reformat_thread.progress.connect(lambda done, total: self.progress_bar.setValue(int(done / total * 100)))
+        self.reformat_thread.reformat_finished.connect(lambda renamed, errors: self.on_reformat_finished(renamed, errors, len(planner.conflicts)))
+        self.reformat_thread.start()
+
+    def on_reformat_finished(self, renamed_count, errors, skipped_count):
+        message = f"Reformatting complete. Renamed: {renamed_count}, Skipped: {skipped_count}, Errors: {len(errors)}"
+        if errors:
+            reply = QMessageBox.question(self, "Reformat Failed",
+                                         f"{len(errors)} file(s) could not be renamed, {renamed_count} were:\n{errors[0][2]}\n\n"
+                                         "Do you want to undo the renames that were made?")
+            if reply == QMessageBox.StandardButton.Yes:
+                reverted, rollback_errors = RenamePlanner.rollback(self.reformat_journal_file)
+                message = f"Reformat rolled back. Restored: {reverted}, Errors: {len(rollback_errors)}"
+
         self.track_checker.rescan()
-        renamed_count = 0
-        error_count = 0
+        current_item = self.playlist_tree.currentItem()
+        if current_item:
+            self.display_tracks(current_item, None)
+        self.status_label.setText(message)
+
+    def export_rekordbox_xml(self):
+        if not self.playlists:
+            self.status_label.setText("No synced playlists to export.")
+            return
+
+        default_path = self.config.get("rekordbox_export_path") or os.path.join(self.config.get("download_directory", ""), "rekordbox.xml")
+        output_path, _ = QFileDialog.getSaveFileName(self, "Export Rekordbox XML", default_path, "Rekordbox XML (*.xml)")
+        if not output_path:
+            return
+        self.config["rekordbox_export_path"] = output_path
+        self.save_config()
 
-        for i, track_data in enumerate(playlist_info.get("tracks", [])):
-            microplaylist_name = track_data.get('microplaylist_name')
-            old_filepath = self.track_checker.is_downloaded(track_data, playlist_info, microplaylist_name)
-            
-            if old_filepath:
-                new_filename = self.file_manager.get_filename(track_data, i + 1, len(playlist_info.get("tracks", [])))
-                new_directory = os.path.dirname(old_filepath)
-                new_filepath = os.path.join(new_directory, new_filename + '.mp3')
-
-                if old_filepath != new_filepath:
-                    try:
-                        if not os.path.exists(new_filepath):
-                            os.rename(old_filepath, new_filepath)
-                            renamed_count += 1
-                        else:
-                            error_count += 1
-                    except OSError:
-                        error_count += 1
-        
         self.track_checker.rescan()
-        self.display_tracks(current_item, None)
-        self.status_label.setText(f"Reformatting complete. Renamed: {renamed_count}, Errors: {error_count}")
+        exporter = RekordboxExporter(self.file_manager, self.track_checker, self.microplaylist_handler,
+                                     attribute_providers=[self.audio_analyzer.rekordbox_attributes])
+        self.status_label.setText("Exporting Rekordbox XML...")
+        self.progress_bar.setValue(0)
+        self.export_thread = RekordboxExportThread(exporter, dict(self.playlists), output_path)
+        self.export_thread.progress.connect(lambda done, total: self.progress_bar.setValue(int(done / total * 100)))
+        self.export_thread.export_finished.connect(self.on_rekordbox_export_finished)
+        self.export_thread.start()
+
+    def on_rekordbox_export_finished(self, result):
+        if "error" in result:
+            self.status_label.setText(f"Rekordbox export failed: {result['error']}")
+        else:
+            self.status_label.setText(f"Exported {result['tracks']} track(s) in {result['playlists']} playlist(s) "
+                                      f"to Rekordbox XML ({result['reused']} unchanged).")
+
+    def get_library_files(self):
+        self.track_checker.rescan()
+        return [os.path.join(directory, filename)
+                for directory, filenames in self.track_checker.local_files_map.items() for filename in filenames]
+
+    def start_analysis(self):
+        if hasattr(self, 'analysis_thread') and self.analysis_thread.isRunning():
+            return
+        filepaths = self.get_library_files()
+        if not filepaths:
+            self.status_label.setText("No downloaded files to analyze.")
+            return
+
+        self.analyze_button.setEnabled(False)
+        self.status_label.setText(f"Analyzing BPM and key of {len(filepaths)} file(s)...")
+        self.progress_bar.setValue(0)
+        self.analysis_thread = AnalysisThread(self.audio_analyzer, filepaths)
+        self.analysis_thread.progress.connect(lambda done, total: self.progress_bar.setValue(int(done / total * 100)))
+        self.analysis_thread.analysis_finished.connect(self.on_analysis_finished)
+        self.analysis_thread.start()
+
+    def on_analysis_finished(self, counts):
+        self.analyze_button.setEnabled(True)
+        message = f"Analysis finished: {counts['analyzed']} analyzed, {counts['cached']} unchanged"
+        if counts['failed']:
+            message += f", {counts['failed']} failed (see log)"
+        self.status_label.setText(message + ".")
+        self.display_tracks(self.playlist_tree.currentItem(), None)
+
+    def start_loudness_scan(self):
+        if hasattr(self, 'loudness_thread') and self.loudness_thread.isRunning():
+            return
+        filepaths = self.get_library_files()
+        if not filepaths:
+            self.status_label.setText("No downloaded files to scan.")
+            return
+
+        self.loudness_button.setEnabled(False)
+        self.status_label.setText(f"Scanning loudness of {len(filepaths)} file(s)...")
+        self.progress_bar.setValue(0)
+        self.loudness_thread = LoudnessScanThread(self.loudness_scanner, filepaths)
+        self.loudness_thread.progress.connect(lambda done, total: self.progress_bar.setValue(int(done / total * 100)))
+        self.loudness_thread.scan_finished.connect(self.on_loudness_scan_finished)
+        self.loudness_thread.start()
+
+    def on_loudness_scan_finished(self, stats):
+        self.loudness_button.setEnabled(True)
+        message = f"Loudness scan finished: {stats['scanned']} scanned, {stats['cached']} unchanged"
+        if stats['failed']:
+            message += f", {stats['failed']} failed (see log)"
+        if stats['scanned']:
+            from loudness_scanner import format_throughput
+            message += f". {format_throughput(stats)}"
+        print(message)
+        self.status_label.setText(message + ".")
+        self.display_tracks(self.playlist_tree.currentItem(), None)
+
+    def start_duplicate_scan(self):
+        if hasattr(self, 'duplicate_thread') and self.duplicate_thread.isRunning():
+            return
+        filepaths = self.get_library_files()
+        if not filepaths:
+            self.status_label.setText("No downloaded files to fingerprint.")
+            return
+
+        self.duplicates_button.setEnabled(False)
+        self.status_label.setText(f"Fingerprinting {len(filepaths)} file(s)...")
+        self.progress_bar.setValue(0)
+        # The download pre-check reads the index from disk, so the scan works on its own instance.
+        from audio_fingerprint import FingerprintIndex
+        self.duplicate_thread = DuplicateScanThread(FingerprintIndex(self.fingerprint_index.cache_path), filepaths)
+        self.duplicate_thread.progress.connect(lambda done, total: self.progress_bar.setValue(int(done / total * 100)))
+        self.duplicate_thread.scan_finished.connect(self.on_duplicate_scan_finished)
+        self.duplicate_thread.start()
+
+    def on_duplicate_scan_finished(self, counts, clusters):
+        self.duplicates_button.setEnabled(True)
+        message = f"Fingerprinted {counts['fingerprinted']} file(s), {counts['cached']} unchanged"
+        if counts['failed']:
+            message += f", {counts['failed']} failed (see log)"
+        self.status_label.setText(message + f". Found {len(clusters)} group(s) of duplicates.")
+        if not clusters:
+            return
+
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Duplicate Tracks")
+        msg_box.setText(f"Found {len(clusters)} group(s) of files with the same audio "
+                        f"({sum(len(cluster) for cluster in clusters)} files in total).")
+        from audio_fingerprint import describe_clusters
+        msg_box.setDetailedText(describe_clusters(clusters, self.config.get("download_directory", "")))
+        msg_box.exec()
 
     def open_create_micro_dialog(self):
         current_item = self.playlist_tree.currentItem()
@@ -635,6 +1266,7 @@ class MainWindow(QMainWindow):
         dialog = CreateMicroPlaylistDialog(playlist_id, all_tracks, self.microplaylist_handler, self)
         if dialog.exec():
             self.refresh_playlist_tree() 
+            self.recount_playlists([playlist_id])
             new_name = dialog.new_micro_playlist_name
             iterator = QTreeWidgetItemIterator(self.tracks_tree)
             while iterator.value():
@@ -669,6 +1301,7 @@ class MainWindow(QMainWindow):
         if dialog.exec():
             current_playlist_item = self.playlist_tree.currentItem()
             self.display_tracks(current_playlist_item, None)
+            self.recount_playlists([parent_id])
 
     def delete_micro_playlist(self):
         current_track_item = self.tracks_tree.currentItem()
@@ -680,6 +1313,7 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.StandardButton.Yes:
             self.microplaylist_handler.remove_microplaylist(parent_id, micro_name)
             self.display_tracks(self.playlist_tree.currentItem(), None)
+            self.recount_playlists([parent_id])
 
     def refresh_playlist_tree(self):
         current_selection = self.playlist_tree.currentItem()
@@ -701,10 +1335,15 @@ class MainWindow(QMainWindow):
         self.user_playlists_item.setFlags(self.user_playlists_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
         
         new_item_to_select = None
-        for p_id, p_data in sorted(self.playlists.items(), key=lambda item: item[1].get('title', '').lower()):
+        self.playlist_items = {}
+        # Titles come from the manifest, so building the tree reads no playlist's tracks.
+        for p_id in sorted(self.playlists, key=lambda p_id: (self.playlists.info(p_id)['title'] or '').lower()):
             playlist_item = QTreeWidgetItem(self.synced_playlists_item)
-            playlist_item.setText(0, p_data.get('title', 'Untitled Playlist'))
+            playlist_item.setText(0, self.playlists.info(p_id)['title'] or 'Untitled Playlist')
             playlist_item.setData(0, Qt.ItemDataRole.UserRole, ('playlist', p_id))
+            self.playlist_items[p_id] = playlist_item
+            self.show_playlist_counts(p_id)
+            self.show_update_flag(p_id)
             if p_id == selected_id:
                 new_item_to_select = playlist_item
 
@@ -715,6 +1354,100 @@ class MainWindow(QMainWindow):
         if new_item_to_select:
             self.playlist_tree.setCurrentItem(new_item_to_select)
 
+    def show_playlist_counts(self, p_id):
+        """
+        Shows a synced playlist's missing tracks and downloaded size in the playlist tree, with
+        one row per micro-playlist below it.
+        """
+        playlist_item = self.playlist_items.get(p_id)
+        if playlist_item is None:
+            return
+        counts = self.library_status.get_counts(p_id)
+        # A playlist whose micro-playlist rows appear for the first time is expanded like the rest of the tree.
+        expanded = playlist_item.isExpanded() or not playlist_item.childCount()
+        playlist_item.takeChildren()
+        if counts is None:
+            playlist_item.setText(1, "")
+            return
+
+        def show(item, counts):
+            item.setText(1, f"{counts['missing']} missing · {format_size(counts['size'])}" if counts['missing']
+                         else f"✓ {format_size(counts['size'])}")
+            item.setToolTip(1, f"{counts['downloaded']} downloaded, {counts['missing']} missing, "
+                               f"{format_size(counts['size'])} on disk")
+            item.setForeground(1, QBrush(QColor("orange" if counts['missing'] else "grey")))
+
+        show(playlist_item, counts)
+        for micro_name in sorted(counts['micro']):
+            micro_item = QTreeWidgetItem(playlist_item)
+            micro_item.setText(0, f"📁 {micro_name}")
+            micro_item.setFlags(micro_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+            show(micro_item, counts['micro'][micro_name])
+        playlist_item.setExpanded(expanded)
+
+    def recount_playlists(self, playlist_ids=None):
+        """
+        Counts the downloaded and missing tracks of some synced playlists, or of all of them, on
+        a worker thread. Playlists requested while a count is running are counted next.
+        """
+        playlist_ids = list(self.playlists) if playlist_ids is None else list(playlist_ids)
+        if self.status_thread and self.status_thread.isRunning():
+            self.pending_status_counts.update(playlist_ids)
+            return
+        self.status_thread = LibraryStatusThread(self.library_status, self.playlists, playlist_ids,
+                                                 self.microplaylist_handler, self.create_worker_track_checker())
+        self.status_thread.playlist_counted.connect(self.on_playlist_counted)
+        self.status_thread.finished.connect(self.on_status_count_finished)
+        self.status_thread.start()
+
+    def on_playlist_counted(self, p_id):
+        self.show_playlist_counts(p_id)
+        self.watch_status_directories()
+
+    def on_status_count_finished(self):
+        if self.pending_status_counts:
+            playlist_ids, self.pending_status_counts = self.pending_status_counts, set()
+            self.recount_playlists(playlist_ids)
+
+    def watch_status_directories(self):
+        """
+        Watches every counted folder for changes. A folder that does not exist yet is noticed
+        through its nearest existing parent inside the download directory.
+        """
+        download_dir = self.library_status.download_directory
+        if not download_dir or not os.path.isdir(download_dir):
+            return
+        paths = set()
+        for directory in self.library_status.directories():
+            while not os.path.isdir(directory) and os.path.dirname(directory).startswith(download_dir):
+                directory = os.path.dirname(directory)
+            if os.path.isdir(directory):
+                paths.add(directory)
+        new_paths = paths - set(self.status_watcher.directories())
+        if new_paths:
+            self.status_watcher.addPaths(sorted(new_paths))
+
+    def on_status_directory_changed(self, path):
+        # Downloads change a folder many times, so the notifications are collected for a moment.
+        self.pending_status_directories.add(path)
+        self.status_refresh_timer.start()
+
+    def refresh_status_directories(self):
+        """
+        Reads the changed folders again and updates the counts of their playlists.
+        """
+        paths, self.pending_status_directories = self.pending_status_directories, set()
+        watched = set(self.status_watcher.directories())
+        changed = set()
+        for directory in self.library_status.directories():
+            # A change in a parent folder may be a new, not yet watched folder below it.
+            if directory in paths or (directory not in watched and
+                                      any(directory.startswith(path + os.sep) for path in paths)):
+                changed |= self.library_status.refresh_directory(directory)
+        for p_id in changed:
+            self.show_playlist_counts(p_id)
+        self.watch_status_directories()
+
     def update_micro_buttons_state(self, current_item, previous_item):
         is_micro_folder = False
         if current_item:
@@ -730,6 +1463,30 @@ class MainWindow(QMainWindow):
         if current_item:
             self.display_tracks(current_item, None)
 
+    def sorted_tracks(self, p_id, playlist_info):
+        """
+        Returns a playlist's tracks in the sort box's order.
+
+        Every order is sorted once per loaded playlist and kept, so switching between sort modes
+        or playlists reuses it. A playlist that is synced again or reloaded from disk has a new
+        tracks list and is sorted again.
+        """
+        tracks = playlist_info.get('tracks', [])
+        mode = self.sort_combo.currentText()
+        if mode not in TRACK_SORT_KEYS:
+            return tracks
+        cached = self.track_orders.get(p_id)
+        if cached is None or cached[0] is not tracks:
+            cached = self.track_orders[p_id] = (tracks, {})
+        self.track_orders.move_to_end(p_id)
+        while len(self.track_orders) > storage.PLAYLIST_CACHE_SIZE:
+            self.track_orders.popitem(last=False)
+        if mode not in cached[1]:
+            with span('display_tracks.sort', mode=mode, tracks=len(tracks)):
+                cached[1][mode] = sorted(tracks, key=TRACK_SORT_KEYS[mode])
+        return cached[1][mode]
+
+    @timed('display_tracks')
     def display_tracks(self, current, previous):
         self.tracks_tree.clear()
         
@@ -750,24 +1507,10 @@ class MainWindow(QMainWindow):
         item_type, p_id = user_data
         
         self.track_checker.rescan()
-        micro_tracks_map, remaining_tracks_map = self.microplaylist_handler.segregate_tracks(self.playlists)
-        sort_key = self.sort_combo.currentText()
-
-        def get_sort_key_func(track):
-            if sort_key == "Track Name":
-                return track.get('title', 'N/A').lower()
-            elif sort_key == "Artist Name":
-                artists = track.get('artists', [])
-                if artists and artists[0] is not None:
-                    return artists[0].get('name', 'N/A').lower()
-                return 'N/A'
-            return None
-
-        def sort_tracks(tracks):
-            if sort_key == "Date Added":
-                return tracks
-            else:
-                return sorted(tracks, key=get_sort_key_func)
+        playlist_info = self.playlists.get(p_id)
+        # Segregating the sorted tracks keeps every folder in that order, so nothing is sorted per folder.
+        sorted_playlist = dict(playlist_info, tracks=self.sorted_tracks(p_id, playlist_info))
+        micro_tracks_map, remaining_tracks_map = self.microplaylist_handler.segregate_tracks({p_id: sorted_playlist})
 
         seen_video_ids = set()
 
@@ -781,14 +1524,27 @@ class MainWindow(QMainWindow):
             artists = ", ".join([a['name'].replace(' - Topic', '').strip() for a in track.get('artists', []) if a and 'name' in a])
             track_item.setText(1, artists)
             
-            playlist_info = self.playlists.get(p_id)
             matched_filepath = self.track_checker.is_downloaded(track, playlist_info, micro_name)
 
             if matched_filepath:
                 status = "Downloaded"
                 track['filepath'] = matched_filepath
+                analysis = self.audio_analyzer.get_result(matched_filepath)
+                if analysis:
+                    if analysis.get('bpm'):
+                        track_item.setText(3, f"{analysis['bpm']:.1f}")
+                    track_item.setText(4, analysis.get('key') or "")
+                loudness = self.loudness_scanner.get_result(matched_filepath)
+                if loudness:
+                    track_item.setText(5, f"{loudness['loudness']:.1f} LUFS")
+                    track_item.setToolTip(5, f"True peak {loudness['true_peak']} dBTP, ReplayGain {loudness['gain']:+.2f} dB")
             else:
                 status = "Not Downloaded"
+                review_match = self.track_checker.get_review_match(track, playlist_info, micro_name)
+                if review_match:
+                    review_path, score = review_match
+                    status = f"Possible match ({score:.0%})"
+                    track_item.setToolTip(2, review_path)
 
             track_item.setText(2, status)
             track_item.setData(0, Qt.ItemDataRole.UserRole, ('track', track))
@@ -796,17 +1552,24 @@ class MainWindow(QMainWindow):
         parent_microplaylists = self.microplaylist_handler.get_microplaylists_for_playlist(p_id)
         valid_mps = [mp for mp in parent_microplaylists if isinstance(mp, dict)]
         
+        # Score every folder's unmatched tracks against its leftover files in one batch.
+        for (mp_p_id, mp_name), mp_tracks in micro_tracks_map.items():
+            if mp_p_id == p_id:
+                self.track_checker.match_playlist(mp_tracks, playlist_info, mp_name)
+        self.track_checker.match_playlist(remaining_tracks_map.get(p_id, []), playlist_info)
+
         for mp in sorted(valid_mps, key=lambda x: x['name']):
             folder_item = QTreeWidgetItem(self.tracks_tree)
             folder_item.setText(0, f"📁 {mp['name']}")
             folder_item.setData(0, Qt.ItemDataRole.UserRole, ('micro_folder', (p_id, mp['name'])))
             tracks_in_folder = micro_tracks_map.get((p_id, mp['name']), [])
             
-            for track in sort_tracks(tracks_in_folder):
+            for track in tracks_in_folder:
                 add_track_to_tree(folder_item, track, mp['name'])
 
-        for track in sort_tracks(remaining_tracks_map.get(p_id, [])):
+        for track in remaining_tracks_map.get(p_id, []):
             add_track_to_tree(self.tracks_tree, track)
+        count('display_tracks.tracks', len(seen_video_ids))
 
     def start_download(self):
         selected_items = self.tracks_tree.selectedItems()
@@ -816,6 +1579,9 @@ class MainWindow(QMainWindow):
         if not download_dir or not os.path.exists(download_dir):
             QMessageBox.warning(self, "Directory Not Set", "Please set a valid download directory in Settings.")
             return
+        if self.is_downloading():
+            QMessageBox.information(self, "Download Running", "Wait for the current downloads to finish first.")
+            return
 
         self.expanded_folders.clear()
         iterator = QTreeWidgetItemIterator(self.tracks_tree)
@@ -828,7 +1594,7 @@ class MainWindow(QMainWindow):
             iterator += 1
 
         tracks_to_download = []
-        unique_ids = set()
+        unique_targets = set()
         
         current_playlist_item = self.playlist_tree.currentItem()
         if not current_playlist_item: return
@@ -841,13 +1607,10 @@ class MainWindow(QMainWindow):
         
         def process_track(track_data, micro_name=None):
             video_id = track_data.get('videoId')
-            if video_id and video_id not in unique_ids:
+            if video_id and (video_id, micro_name) not in unique_targets:
                 if not self.track_checker.is_downloaded(track_data, playlist_info, micro_name):
-                    track_data['playlist_title'] = playlist_info.get('title')
-                    track_data['microplaylist_title'] = micro_name
-                    track_data['playlist_track_count'] = len(playlist_info.get('tracks', []))
-                    tracks_to_download.append(track_data)
-                    unique_ids.add(video_id)
+                    tracks_to_download.append(make_download_job(track_data, playlist_info, micro_name))
+                    unique_targets.add((video_id, micro_name))
 
         for item in selected_items:
             data = item.data(0, Qt.ItemDataRole.UserRole)
@@ -873,23 +1636,160 @@ class MainWindow(QMainWindow):
             self.status_label.setText("All selected songs are already downloaded.")
             return
 
-        self.downloader = DownloadHandler(tracks_to_download, self.file_manager, download_dir)
+        # Tracks already archived for another playlist are linked instead of downloaded again,
+        # so the library index is rebuilt first, on a worker thread.
+        self.status_label.setText(f"Preparing download of {len(tracks_to_download)} track(s)...")
+        self.library_index_thread = LibraryIndexThread(self.playlists, self.microplaylist_handler,
+                                                       self.create_worker_track_checker())
+        self.library_index_thread.index_built.connect(lambda: self.on_download_index_built(tracks_to_download, download_dir))
+        self.download_plan = self.library_index_thread
+        self.library_index_thread.start()
+        self.update_download_buttons()
+
+    def on_download_index_built(self, tracks_to_download, download_dir):
+        self.download_plan = None
+        self.library_index = self.library_index_thread.library_index
+        self.run_downloads(tracks_to_download, download_dir)
+        self.update_download_buttons()
+
+    def start_download_all_missing(self):
+        """
+        Downloads every missing track of every synced playlist and micro-playlist, in the order
+        set in Settings. The missing tracks are found on a worker thread.
+        """
+        if self.is_downloading():
+            QMessageBox.information(self, "Download Running", "Wait for the current downloads to finish first.")
+            return
+        download_dir = self.config.get("download_directory")
+        if not download_dir or not os.path.exists(download_dir):
+            QMessageBox.warning(self, "Directory Not Set", "Please set a valid download directory in Settings.")
+            return
+
+        # The library must not change while the plan is made.
+        for button in self.library_buttons + [self.full_refresh_button]:
+            button.setEnabled(False)
+        self.status_label.setText("Finding missing tracks in every playlist...")
+        self.download_plan_thread = self.create_download_plan_thread()
+        self.download_plan_thread.plan_finished.connect(self.on_download_plan_finished)
+        self.download_plan = self.download_plan_thread
+        self.download_plan_thread.start()
+        self.update_download_buttons()
+
+    def create_worker_track_checker(self):
+        """
+        Returns an unscanned TrackChecker for a worker thread, so the track view's is never used from two threads.
+        """
+        # The tag cache is read from disk, so the worker's checker works on its own TagIndex.
+        tag_index = TagIndex(self.track_checker.tag_index.cache_path)
+        return TrackChecker(self.file_manager, self.config.get("download_directory"), tag_index=tag_index, scan=False)
+
+    def create_download_plan_thread(self, playlist_ids=None):
+        """
+        Returns a DownloadPlanThread for the given playlists, or all of them, with its own TrackChecker.
+        """
+        return DownloadPlanThread(self.playlists, self.microplaylist_handler, self.create_worker_track_checker(),
+                                  self.config.get("download_priority", "library"), playlist_ids=playlist_ids)
+
+    def on_download_plan_finished(self, tracks_to_download):
+        self.download_plan = None
+        self.library_index = self.download_plan_thread.library_index
+        for button in self.library_buttons:
+            button.setEnabled(True)
+        self.update_login_button_state()
+        if not tracks_to_download:
+            self.status_label.setText("Every playlist is fully downloaded.")
+        else:
+            self.expanded_folders.clear()
+            self.run_downloads(tracks_to_download, self.config.get("download_directory"))
+        self.update_download_buttons()
+
+    def is_downloading(self):
+        """
+        Returns whether downloads are running or a plan for them is being made.
+        """
+        return self.download_plan is not None or bool(self.downloader and self.downloader.isRunning())
+
+    def update_download_buttons(self):
+        for button in (self.download_button, self.download_all_button):
+            button.setEnabled(self.library_loaded and not self.is_downloading())
+
+    def run_downloads(self, tracks_to_download, download_dir):
+        """
+        Starts a DownloadHandler for the given download jobs. The library index must be built.
+        Nothing is started while another DownloadHandler is running.
+        """
+        if self.downloader and self.downloader.isRunning():
+            self.status_label.setText("Downloads are already running; the new ones were not started.")
+            return
+        staging_dir = None
+        if self.config.get("staging_enabled"):
+            staging_dir = self.config.get("staging_directory") or os.path.join(tempfile.gettempdir(), "ytmusic-rekordbox-staging")
+
+        # Tracks the user already owns in Rekordbox are skipped or linked instead of downloaded.
+        rekordbox_collection = None
+        if self.config.get("rekordbox_collection_xml"):
+            rekordbox_collection = RekordboxCollection(self.config["rekordbox_collection_xml"])
+
+        self.downloader = DownloadHandler(tracks_to_download, self.file_manager, download_dir, staging_directory=staging_dir,
+                                          library_index=self.library_index, rekordbox_collection=rekordbox_collection,
+                                          collection_mode=self.config.get("rekordbox_collection_mode", "skip"),
+                                          loudness_scanner=self.loudness_scanner if self.config.get("loudness_after_download") else None,
+                                          fingerprint_index=self.fingerprint_index)
+        self.downloader.staging_queue_update.connect(self.update_staging_queue)
         self.downloader.progress_update.connect(self.update_track_status)
         self.downloader.estimation_update.connect(self.update_estimates)
+        self.downloader.overall_progress.connect(self.progress_bar.setValue)
         self.downloader.download_finished.connect(self.on_download_finished)
         self.downloader.all_downloads_finished.connect(self.on_all_downloads_finished)
         self.downloader.start()
+        self.update_download_buttons()
         self.status_label.setText(f"Starting download of {len(tracks_to_download)} track(s)...")
 
     def load_playlists(self):
-        if os.path.exists(self.playlists_file):
-            with open(self.playlists_file, 'r', encoding='utf-8') as f:
-                self.playlists = json.load(f)
-            self.refresh_playlist_tree()
+        self.set_library_loading()
+        self.library_thread = LibraryLoadThread(self.library_directory, self.track_checker, self.config)
+        self.library_thread.library_loaded.connect(self.on_library_loaded)
+        self.library_thread.start()
+
+    def set_library_loading(self):
+        """
+        Shows a placeholder in the playlist tree and disables the actions that need the library.
+        """
+        loading_item = QTreeWidgetItem(self.synced_playlists_item)
+        loading_item.setText(0, "Loading library...")
+        loading_item.setForeground(0, QBrush(QColor("grey")))
+        loading_item.setFlags(loading_item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+        self.synced_playlists_item.setExpanded(True)
+        for button in self.library_buttons:
+            button.setEnabled(False)
+        self.status_label.setText("Loading library...")
+
+    def on_library_loaded(self, library):
+        if 'error' in library:
+            # The buttons stay disabled so an empty library is never saved over the unreadable file.
+            self.status_label.setText(f"Could not load the library: {library['error']}")
+            QMessageBox.critical(self, "Library Error", f"Could not load the library in '{self.library_directory}':\n{library['error']}")
+            return
+        self.playlists = library['playlists']
+        self.audio_analyzer = library['audio_analyzer']
+        self.loudness_scanner = library['loudness_scanner']
+        self.fingerprint_index = library['fingerprint_index']
+        self.library_loaded = True
+        for button in self.library_buttons:
+            button.setEnabled(True)
+        self.update_login_button_state()
+        self.refresh_playlist_tree()
+        self.status_label.setText("Status: Idle")
+        self.startup_times.setdefault('library', time.perf_counter() - STARTED_AT)
+        self.report_startup()
+        self.recount_playlists()
+        self.schedule_update_check()
 
     def save_playlists(self):
-        with open(self.playlists_file, 'w', encoding='utf-8') as f:
-            json.dump(self.playlists, f, indent=4)
+        # Track titles may have changed upstream, so memoized filenames are dropped.
+        self.file_manager.clear_cache()
+        # Assigning a playlist already wrote its file; this writes the manifest.
+        self.playlists.save()
 
     def toggle_login_logout(self):
         if self.youtube_handler.is_authenticated(): self.logout()
@@ -897,10 +1797,20 @@ class MainWindow(QMainWindow):
     
     def update_login_button_state(self):
         is_auth = self.youtube_handler.is_authenticated()
-        self.login_logout_button.setText("Logout" if is_auth else "Login with Google")
-        self.logged_out_label.setVisible(not is_auth)
+        if not self.credentials_checked:
+            self.login_logout_button.setText("Checking login...")
+        else:
+            self.login_logout_button.setText("Logout" if is_auth else "Login with Google")
+        self.login_logout_button.setEnabled(self.credentials_checked)
+        self.logged_out_label.setVisible(self.credentials_checked and not is_auth)
         self.user_playlists_item.setHidden(not is_auth)
-        self.full_refresh_button.setEnabled(is_auth)
+        self.full_refresh_button.setEnabled(is_auth and self.library_loaded)
+
+    def on_credentials_loaded(self):
+        self.credentials_checked = True
+        self.update_login_button_state()
+        if self.youtube_handler.is_authenticated():
+            self.fetch_all_user_playlists()
 
     def login(self):
         self.status_label.setText("Attempting to log in... Please follow the instructions in your browser.")
@@ -920,6 +1830,9 @@ class MainWindow(QMainWindow):
         self.refresh_playlist_tree()
 
     def fetch_all_user_playlists(self):
+        # Signing in and loading the library can both ask for the list; one fetch serves both.
+        if hasattr(self, 'fetch_playlists_thread') and self.fetch_playlists_thread.isRunning():
+            return
         self.status_label.setText("Fetching your YouTube playlists...")
         self.fetch_playlists_thread = FetchAllPlaylistsThread(self.youtube_handler)
         self.fetch_playlists_thread.fetch_finished.connect(self.populate_user_playlists)
@@ -950,12 +1863,16 @@ class MainWindow(QMainWindow):
             self.status_label.setText(f"Syncing {data['title']}...")
             QApplication.processEvents()
 
+            signatures = self.youtube_handler.get_playlist_signatures([pid])
             full_data = self.youtube_handler.get_playlist_info(pid, is_private)
             if full_data and 'error' not in full_data:
                 full_data['is_private'] = is_private
                 self.playlists[pid] = full_data
+                self.update_checker.mark_synced(pid, signatures.get(pid))
+                self.update_checker.save_state()
                 self.save_playlists()
                 self.refresh_playlist_tree()
+                self.recount_playlists([pid])
                 self.status_label.setText(f"Synced: {full_data['title']}")
             else:
                 self.status_label.setText(f"Error syncing playlist: {full_data.get('error', 'Unknown')}")
@@ -975,6 +1892,7 @@ class MainWindow(QMainWindow):
                     self.playlists[pid] = data
                     self.save_playlists()
                     self.refresh_playlist_tree()
+                    self.recount_playlists([pid])
                 else: self.status_label.setText("Error: Could not fetch playlist. It may be private.")
             else: self.status_label.setText("Error: Invalid URL.")
 
@@ -984,13 +1902,16 @@ class MainWindow(QMainWindow):
             user_data = current.data(0, Qt.ItemDataRole.UserRole)
             if user_data and user_data[0] == 'playlist':
                 pid = user_data[1]
-                playlist_title = self.playlists.get(pid, {}).get('title', 'this playlist')
+                playlist_title = self.playlists.info(pid)['title'] if pid in self.playlists else 'this playlist'
                 reply = QMessageBox.question(self, "Confirm Removal", f"Are you sure you want to remove '{playlist_title}' from the synced list?")
                 if reply == QMessageBox.StandardButton.No:
                     return
 
                 if pid in self.playlists:
                     del self.playlists[pid]
+                self.library_status.remove_playlist(pid)
+                self.update_checker.forget(pid)
+                self.update_checker.save_state()
                 if pid in self.microplaylist_handler.microplaylists:
                     del self.microplaylist_handler.microplaylists[pid]
                     self.microplaylist_handler.save_microplaylists()
@@ -1014,7 +1935,7 @@ class MainWindow(QMainWindow):
         self.full_sync_thread.sync_finished.connect(self.on_full_sync_finished)
         self.full_sync_thread.start()
 
-    def on_full_sync_finished(self, updated_data, summary):
+    def on_full_sync_finished(self, updated_data, summary, signatures):
         self.playlists.update(updated_data)
         # Remove playlists that were not in the updated data (e.g., deleted online)
         current_ids = set(updated_data.keys())
@@ -1022,9 +1943,15 @@ class MainWindow(QMainWindow):
         for pid in existing_ids - current_ids:
             if pid in self.playlists:
                 del self.playlists[pid]
+            self.library_status.remove_playlist(pid)
+            self.update_checker.forget(pid)
+        for pid in updated_data:
+            self.update_checker.mark_synced(pid, signatures.get(pid))
+        self.update_checker.save_state()
 
         self.save_playlists()
         self.refresh_playlist_tree()
+        self.recount_playlists(updated_data.keys())
         self.full_refresh_button.setEnabled(True)
         self.status_label.setText("Full refresh complete.")
 
@@ -1033,6 +1960,95 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.information(self, "Refresh Complete", "No new songs found, but playlist details have been updated.")
 
+    def is_syncing(self):
+        return hasattr(self, 'full_sync_thread') and self.full_sync_thread.isRunning()
+
+    def schedule_update_check(self):
+        """
+        Starts the timer for the next update check, or stops it if checks are turned off.
+        """
+        minutes = self.config.get("update_check_minutes", DEFAULT_CHECK_INTERVAL_MINUTES)
+        if not minutes:
+            self.update_check_timer.stop()
+            return
+        delay = self.update_checker.next_delay(minutes * 60)
+        self.update_check_timer.start(int(delay * 1000))
+
+    def start_update_check(self):
+        if (not self.youtube_handler.is_authenticated() or not self.library_loaded or not self.playlists
+                or self.is_syncing() or (hasattr(self, 'update_check_thread') and self.update_check_thread.isRunning())):
+            self.schedule_update_check()
+            return
+        track_counts = {p_id: self.playlists.info(p_id)['track_count'] for p_id in self.playlists}
+        self.update_check_thread = UpdateCheckThread(self.update_checker, track_counts)
+        self.update_check_thread.check_finished.connect(self.on_update_check_finished)
+        self.update_check_thread.start()
+
+    def on_update_check_finished(self, result):
+        self.schedule_update_check()
+        if 'error' in result:
+            print(f"Update check failed: {result['error']}")
+            return
+        print(f"Update check: {result['checked']} playlist(s), {result['units']} quota unit(s), "
+              f"{len(result['changed'])} changed.")
+        for p_id in result['changed']:
+            self.show_update_flag(p_id)
+        changed = [p_id for p_id in self.update_checker.changed if p_id in self.playlists]
+        if not changed:
+            return
+        if self.config.get("auto_sync_updates") and not self.is_syncing():
+            self.status_label.setText(f"Syncing {len(changed)} playlist(s) that changed on YouTube...")
+            self.full_refresh_button.setEnabled(False)
+            self.full_sync_thread = FullSyncThread(self.youtube_handler, {p_id: self.playlists[p_id] for p_id in changed})
+            self.full_sync_thread.sync_finished.connect(self.on_update_sync_finished)
+            self.full_sync_thread.start()
+        elif result['changed']:
+            self.status_label.setText(f"{len(changed)} synced playlist(s) changed on YouTube. Run Full Refresh to update them.")
+
+    def on_update_sync_finished(self, updated_data, summary, signatures):
+        """
+        Stores the playlists synced after an update check and, if enabled, downloads their new tracks.
+        Unlike a Full Refresh, playlists missing from the result are kept.
+        """
+        self.playlists.update(updated_data)
+        for p_id in updated_data:
+            self.update_checker.mark_synced(p_id, signatures.get(p_id))
+        self.update_checker.save_state()
+        self.save_playlists()
+        self.refresh_playlist_tree()
+        self.recount_playlists(updated_data.keys())
+        self.update_login_button_state()
+        self.status_label.setText("; ".join(summary) if summary else f"Synced {len(updated_data)} changed playlist(s).")
+
+        download_dir = self.config.get("download_directory")
+        if (self.config.get("auto_download_updates") and updated_data and download_dir and os.path.exists(download_dir)
+                and not self.is_downloading()):
+            self.update_plan_thread = self.create_download_plan_thread(list(updated_data))
+            self.update_plan_thread.plan_finished.connect(self.on_update_plan_finished)
+            self.download_plan = self.update_plan_thread
+            self.update_plan_thread.start()
+            self.update_download_buttons()
+
+    def on_update_plan_finished(self, tracks_to_download):
+        self.download_plan = None
+        if tracks_to_download:
+            self.library_index = self.update_plan_thread.library_index
+            self.run_downloads(tracks_to_download, self.config.get("download_directory"))
+        self.update_download_buttons()
+
+    def show_update_flag(self, p_id):
+        """
+        Marks a synced playlist in the tree if it changed on YouTube since it was last synced.
+        """
+        playlist_item = self.playlist_items.get(p_id)
+        if playlist_item is None:
+            return
+        changed = self.update_checker.is_changed(p_id)
+        font = playlist_item.font(0)
+        font.setBold(changed)
+        playlist_item.setFont(0, font)
+        playlist_item.setToolTip(0, "Changed on YouTube since the last sync" if changed else "")
+
     def update_track_status(self, video_id, status, percentage):
         iterator = QTreeWidgetItemIterator(self.tracks_tree)
         while iterator.value():
@@ -1044,6 +2060,10 @@ class MainWindow(QMainWindow):
             iterator += 1
 
     def on_download_finished(self, video_id, success, message):
+        if success:
+            # The folder watcher may miss changes, e.g. on network drives, so the folders are read again anyway.
+            self.pending_status_directories.update(self.library_status.directories_with(video_id))
+            self.status_refresh_timer.start()
         iterator = QTreeWidgetItemIterator(self.tracks_tree)
         while iterator.value():
             item = iterator.value()
@@ -1059,6 +2079,7 @@ class MainWindow(QMainWindow):
     def on_all_downloads_finished(self):
         self.status_label.setText("All downloads finished.")
         self.downloader = None
+        self.update_download_buttons()
         current_playlist_item = self.playlist_tree.currentItem()
         self.display_tracks(current_playlist_item, None)
         
@@ -1076,6 +2097,10 @@ class MainWindow(QMainWindow):
     def update_estimates(self, time_str):
         self.estimates_label.setText(f"Estimates: {time_str}")
 
+    def update_staging_queue(self, depth):
+        if depth:
+            self.status_label.setText(f"Moving downloaded files into place... ({depth} queued)")
+
     def extract_playlist_id(self, url):
         match = re.search(r"list=([a-zA-Z0-9_-]+)", url)
         return match.group(1) if match else None
@@ -1093,10 +2118,34 @@ class MainWindow(QMainWindow):
         # Check other utility threads
         if hasattr(self, 'login_thread') and self.login_thread.isRunning():
             running_threads.append(self.login_thread)
+        if self.credentials_thread.isRunning():
+            running_threads.append(self.credentials_thread)
+        if self.library_thread.isRunning():
+            running_threads.append(self.library_thread)
         if hasattr(self, 'fetch_playlists_thread') and self.fetch_playlists_thread.isRunning():
             running_threads.append(self.fetch_playlists_thread)
         if hasattr(self, 'full_sync_thread') and self.full_sync_thread.isRunning():
             running_threads.append(self.full_sync_thread)
+        self.update_check_timer.stop()
+        for name in ('update_check_thread', 'update_plan_thread', 'download_plan_thread', 'library_index_thread'):
+            if hasattr(self, name) and getattr(self, name).isRunning():
+                running_threads.append(getattr(self, name))
+        if self.status_thread and self.status_thread.isRunning():
+            self.status_thread.stop()
+            running_threads.append(self.status_thread)
+        if hasattr(self, 'reformat_thread') and self.reformat_thread.isRunning():
+            running_threads.append(self.reformat_thread)
+        if hasattr(self, 'export_thread') and self.export_thread.isRunning():
+            running_threads.append(self.export_thread)
+        if hasattr(self, 'analysis_thread') and self.analysis_thread.isRunning():
+            self.analysis_thread.stop()
+            running_threads.append(self.analysis_thread)
+        if hasattr(self, 'loudness_thread') and self.loudness_thread.isRunning():
+            self.loudness_thread.stop()
+            running_threads.append(self.loudness_thread)
+        if hasattr(self, 'duplicate_thread') and self.duplicate_thread.isRunning():
+            self.duplicate_thread.stop()
+            running_threads.append(self.duplicate_thread)
 
         if running_threads:
             print("Waiting for background tasks to finish before closing...")
@@ -1109,9 +2158,20 @@ class MainWindow(QMainWindow):
                 thread.quit()
                 thread.wait(5000) # Wait up to 5 seconds for each thread
 
+        if instrumentation.is_enabled():
+            print(instrumentation.format_summary())
+            print(f"Profile written to {instrumentation.write_trace()}")
+
         event.accept() # Now it's safe to close
 
 if __name__ == "__main__":
+    # Analysis runs in worker processes, which must not start the GUI in frozen builds.
+    multiprocessing.freeze_support()
+    try:
+        # Track names sort in the order of the user's language.
+        locale.setlocale(locale.LC_COLLATE, '')
+    except locale.Error:
+        print("Could not apply the system locale; sorting track names by code point.")
     print("Starting application...")
     app = QApplication(sys.argv)
     print("QApplication created.")
@@ -1,6 +1,7 @@
 import json
 import os
 from collections import defaultdict
+from instrumentation import span, timed
 
 class MicroPlaylistHandler:
     def __init__(self, config_path='microplaylists.json'):
@@ -17,7 +18,7 @@ class MicroPlaylistHandler:
         return {}
 
     def save_microplaylists(self):
-        with open(self.config_path, 'w') as f:
+        with span('save.microplaylists'), open(self.config_path, 'w') as f:
             json.dump(self.microplaylists, f, indent=4)
 
     def get_microplaylists_for_playlist(self, parent_playlist_id):
@@ -64,6 +65,7 @@ class MicroPlaylistHandler:
                 return False, "Original micro-playlist not found."
         return False, "Parent playlist not found."
 
+    @timed('segregate_tracks')
     def segregate_tracks(self, all_synced_playlists):
         micro_playlist_tracks = defaultdict(list)
         remaining_playlist_tracks = defaultdict(list)
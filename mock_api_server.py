@@ -0,0 +1,479 @@
+"""
+A local stand-in for the YouTube Data API and the YouTube Music endpoints ytmusicapi calls,
+for load-testing playlist syncs offline at realistic scale and with realistic failures.
+
+It serves a deterministic synthetic library through paged playlists().list and
+playlistItems().list responses, and through the innertube browse responses that
+YTMusic.get_playlist parses, with configurable latency, page sizes, error rates and
+bursts of 429 responses. Point a YouTubeHandler at it with api_endpoint=server.url.
+
+Usage:
+    python mock_api_server.py --playlists 200 --tracks 300 --port 8765
+    python mock_api_server.py --playlists 200 --latency 0.1 --burst-every 50 --load-test
+"""
+import sys
+import json
+import time
+import base64
+import hashlib
+import random
+import string
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# The most items the Data API returns per page, whatever maxResults asks for.
+DATA_API_MAX_RESULTS = 50
+# Tracks per browse response or continuation on YouTube Music.
+MUSIC_PAGE_SIZE = 100
+
+def random_word(rng, min_length=3, max_length=9):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_length, max_length))).capitalize()
+
+def random_id(rng, length, prefix=''):
+    return prefix + ''.join(rng.choice(string.ascii_letters + string.digits + '-_') for _ in range(length))
+
+def encode_token(playlist_id, offset):
+    return base64.urlsafe_b64encode(json.dumps([playlist_id, offset]).encode('utf-8')).decode('ascii')
+
+def decode_token(token):
+    """
+    Returns the (playlist_id, offset) a page token was issued for, or None if it is malformed.
+    """
+    try:
+        playlist_id, offset = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return str(playlist_id), int(offset)
+    except (ValueError, TypeError):
+        return None
+
+class MockLibrary:
+    """
+    A deterministic synthetic account: playlists with their privacy status and tracks.
+    """
+
+    def __init__(self, playlist_count=50, tracks_per_playlist=200, private_share=0.3, seed=1):
+        """
+        Initializes the MockLibrary.
+
+        Args:
+            playlist_count (int): The number of playlists in the account.
+            tracks_per_playlist (int): The average playlist length; lengths vary by +-50%.
+            private_share (float): The share of playlists that are private or unlisted.
+            seed (int): Seeds the generator, so the same arguments give the same library.
+        """
+        rng = random.Random(seed)
+        artists = [(' '.join(random_word(rng) for _ in range(rng.randint(1, 2))), random_id(rng, 22, 'UC'))
+                   for _ in range(max(20, playlist_count * tracks_per_playlist // 20))]
+        self.playlists = {}
+        for p in range(playlist_count):
+            playlist_id = f"PLmock{p:06d}{random_id(rng, 8)}"
+            tracks = []
+            for _ in range(max(1, int(tracks_per_playlist * rng.uniform(0.5, 1.5)))):
+                seconds = rng.randint(120, 420)
+                tracks.append({
+                    'videoId': random_id(rng, 11),
+                    'title': ' '.join(random_word(rng) for _ in range(rng.randint(1, 4))),
+                    'artists': rng.sample(artists, rng.choice((1, 1, 1, 2))),
+                    'album': (random_word(rng), random_id(rng, 11, 'MPREb_')),
+                    'duration': f"{seconds // 60}:{seconds % 60:02d}",
+                })
+            privacy = 'public'
+            if rng.random() < private_share:
+                privacy = rng.choice(('private', 'unlisted'))
+            self.playlists[playlist_id] = {
+                'title': f"{random_word(rng)} {random_word(rng)} {p}",
+                'privacyStatus': privacy,
+                'year': str(rng.randint(2010, 2025)),
+                'tracks': tracks,
+            }
+
+    def track_count(self):
+        return sum(len(p['tracks']) for p in self.playlists.values())
+
+# --- YouTube Data API v3 responses ---
+
+def data_api_error(code, reason, message):
+    return {'error': {'code': code, 'message': message, 'errors': [{'domain': 'youtube', 'reason': reason, 'message': message}]}}
+
+def data_api_playlist(playlist_id, playlist):
+    # The etag changes whenever the title or the tracks change, as a real one would.
+    etag = hashlib.sha1(json.dumps([playlist['title'], [t['videoId'] for t in playlist['tracks']]]).encode('utf-8')).hexdigest()
+    return {
+        'kind': 'youtube#playlist',
+        'etag': etag[:27],
+        'id': playlist_id,
+        'snippet': {'title': playlist['title'], 'description': ''},
+        'status': {'privacyStatus': playlist['privacyStatus']},
+        'contentDetails': {'itemCount': len(playlist['tracks'])},
+    }
+
+def data_api_playlist_item(playlist_id, position, track):
+    return {
+        'kind': 'youtube#playlistItem',
+        'id': f"{playlist_id}.{position}",
+        'snippet': {
+            'title': track['title'],
+            'position': position,
+            'playlistId': playlist_id,
+            'resourceId': {'kind': 'youtube#video', 'videoId': track['videoId']},
+            'videoOwnerChannelTitle': f"{track['artists'][0][0]} - Topic",
+            'videoOwnerChannelId': track['artists'][0][1],
+        },
+    }
+
+def data_api_page(kind, items, offset, page_size, token_key):
+    """
+    Returns one page of a list response, with a nextPageToken while items remain.
+    """
+    response = {
+        'kind': kind,
+        'items': items[offset:offset + page_size],
+        'pageInfo': {'totalResults': len(items), 'resultsPerPage': page_size},
+    }
+    if offset + page_size < len(items):
+        response['nextPageToken'] = encode_token(token_key, offset + page_size)
+    return response
+
+# --- YouTube Music (innertube) responses, in the shape ytmusicapi parses ---
+
+def text_runs(*runs):
+    return {'runs': list(runs)}
+
+def browse_run(text, browse_id, page_type):
+    return {
+        'text': text,
+        'navigationEndpoint': {'browseEndpoint': {
+            'browseId': browse_id,
+            'browseEndpointContextSupportedConfigs': {'browseEndpointContextMusicConfig': {'pageType': page_type}},
+        }},
+    }
+
+def flex_column(*runs):
+    return {'musicResponsiveListItemFlexColumnRenderer': {'text': text_runs(*runs)}}
+
+def music_list_item(track):
+    artist_runs = []
+    for name, channel_id in track['artists']:
+        if artist_runs:
+            artist_runs.append({'text': ' & '})
+        artist_runs.append(browse_run(name, channel_id, 'MUSIC_PAGE_TYPE_ARTIST'))
+    album_name, album_id = track['album']
+    watch = {'watchEndpoint': {'videoId': track['videoId']}}
+    return {'musicResponsiveListItemRenderer': {
+        'overlay': {'musicItemThumbnailOverlayRenderer': {'content': {'musicPlayButtonRenderer': {'playNavigationEndpoint': watch}}}},
+        'flexColumns': [
+            flex_column({'text': track['title'], 'navigationEndpoint': watch}),
+            flex_column(*artist_runs),
+            flex_column(browse_run(album_name, album_id, 'MUSIC_PAGE_TYPE_ALBUM')),
+        ],
+        'fixedColumns': [{'musicResponsiveListItemFixedColumnRenderer': {'text': text_runs({'text': track['duration']})}}],
+    }}
+
+def music_items_page(playlist_id, tracks, offset, page_size):
+    """
+    Returns one page of playlist items, ending with a continuation item while tracks remain.
+    """
+    items = [music_list_item(track) for track in tracks[offset:offset + page_size]]
+    if offset + page_size < len(tracks):
+        items.append({'continuationItemRenderer': {'continuationEndpoint': {'continuationCommand': {
+            'token': encode_token(playlist_id, offset + page_size), 'request': 'CONTINUATION_REQUEST_TYPE_BROWSE'}}}})
+    return items
+
+def music_playlist_page(playlist_id, playlist, page_size):
+    header = {'musicResponsiveHeaderRenderer': {
+        'title': text_runs({'text': playlist['title']}),
+        'subtitle': text_runs({'text': 'Playlist'}, {'text': ' • '}, {'text': playlist['year']}),
+        'secondSubtitle': text_runs({'text': f"{len(playlist['tracks'])} songs"}),
+        'buttons': [{}, {'musicPlayButtonRenderer': {'playNavigationEndpoint': {'watchEndpoint': {'playlistId': playlist_id}}}}],
+    }}
+    shelf = {'musicPlaylistShelfRenderer': {
+        'playlistId': playlist_id,
+        'contents': music_items_page(playlist_id, playlist['tracks'], 0, page_size),
+    }}
+    return {'contents': {'twoColumnBrowseResultsRenderer': {
+        'tabs': [{'tabRenderer': {'content': {'sectionListRenderer': {'contents': [header]}}}}],
+        'secondaryContents': {'sectionListRenderer': {'contents': [shelf]}},
+    }}}
+
+def music_continuation_page(playlist_id, playlist, offset, page_size):
+    return {'onResponseReceivedActions': [{'appendContinuationItemsAction': {
+        'continuationItems': music_items_page(playlist_id, playlist['tracks'], offset, page_size)}}]}
+
+def music_error(code, status, message):
+    return {'error': {'code': code, 'message': message, 'status': status}}
+
+class MockAPIServer:
+    """
+    Serves a MockLibrary over HTTP on a background thread, imitating the YouTube Data API and
+    YouTube Music. Every request waits for the configured latency, then may fail with a
+    transient server error or fall in a burst of 429 responses. Per-endpoint request counts
+    are kept in stats, so a load test can report how many calls a sync needed.
+    """
+
+    def __init__(self, library, host='127.0.0.1', port=0, latency=0.0, latency_jitter=0.0,
+                 page_size=DATA_API_MAX_RESULTS, music_page_size=MUSIC_PAGE_SIZE,
+                 error_rate=0.0, burst_every=0, burst_length=0, seed=1):
+        """
+        Initializes the MockAPIServer.
+
+        Args:
+            library (MockLibrary): The account to serve.
+            host (str): The interface to listen on.
+            port (int): The port to listen on; 0 picks a free one.
+            latency (float): Seconds each request waits before responding.
+            latency_jitter (float): Up to this many extra seconds, chosen at random per request.
+            page_size (int): The most Data API items per page, also capped by the request's maxResults.
+            music_page_size (int): Tracks per YouTube Music browse page or continuation.
+            error_rate (float): The share of requests that fail with a 503 (Data API) or 500 (YouTube Music).
+            burst_every (int): Start a burst of 429 responses every this many requests; 0 disables bursts.
+            burst_length (int): The number of consecutive requests rejected in each burst.
+            seed (int): Seeds the choice of failing requests and jitter.
+        """
+        self.library = library
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.page_size = min(page_size, DATA_API_MAX_RESULTS)
+        self.music_page_size = music_page_size
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.stats = {'requests': 0, 'playlists': 0, 'playlistItems': 0, 'browse': 0, 'errors': 0, 'throttled': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _admit(self, endpoint):
+        """
+        Counts a request and decides its fate after waiting out the latency.
+
+        Returns:
+            str or None: 'throttled' or 'error' if the request should fail, otherwise None.
+        """
+        with self.lock:
+            position = self.request_count
+            self.request_count += 1
+            self.stats['requests'] += 1
+            self.stats[endpoint] += 1
+            delay = self.latency + (self.rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+            fails = self.error_rate and self.rng.random() < self.error_rate
+            throttled = self.burst_every and self.burst_length and position % self.burst_every < self.burst_length
+            outcome = 'throttled' if throttled else 'error' if fails else None
+            if outcome:
+                self.stats['throttled' if throttled else 'errors'] += 1
+        if delay:
+            time.sleep(delay)
+        return outcome
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                if parts.path.endswith('/playlists'):
+                    self.handle_data_api('playlists', query)
+                elif parts.path.endswith('/playlistItems'):
+                    self.handle_data_api('playlistItems', query)
+                elif parts.path in ('', '/'):
+                    # ytmusicapi reads a visitor ID from the home page before its first request.
+                    body = b'<html><script>ytcfg.set({"VISITOR_DATA": "mock-visitor"});</script></html>'
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=UTF-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_json(404, data_api_error(404, 'notFound', f"Unknown endpoint {parts.path}."))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError:
+                    body = None
+                parts = urlsplit(self.path)
+                if not parts.path.endswith('/browse'):
+                    self.send_json(404, music_error(404, 'NOT_FOUND', f"Unknown endpoint {parts.path}."))
+                elif body is None:
+                    self.send_json(400, music_error(400, 'INVALID_ARGUMENT', "Invalid JSON payload received."))
+                else:
+                    self.handle_browse(body)
+
+            def handle_data_api(self, endpoint, query):
+                outcome = server._admit(endpoint)
+                if outcome == 'throttled':
+                    return self.send_json(429, data_api_error(429, 'rateLimitExceeded', "The request cannot be completed because you have exceeded your quota."))
+                if outcome == 'error':
+                    return self.send_json(503, data_api_error(503, 'backendError', "Backend Error"))
+
+                try:
+                    page_size = min(server.page_size, int(query.get('maxResults', 5)))
+                except ValueError:
+                    return self.send_json(400, data_api_error(400, 'invalidParameter', "Invalid value for maxResults."))
+                offset = 0
+                if query.get('pageToken'):
+                    decoded = decode_token(query['pageToken'])
+                    if not decoded:
+                        return self.send_json(400, data_api_error(400, 'invalidPageToken', "The request specifies an invalid page token."))
+                    offset = decoded[1]
+
+                playlists = server.library.playlists
+                if endpoint == 'playlists':
+                    if 'id' in query:
+                        ids = [pid for pid in query['id'].split(',') if pid in playlists]
+                    else:
+                        ids = list(playlists)
+                    items = [data_api_playlist(pid, playlists[pid]) for pid in ids]
+                    return self.send_json(200, data_api_page('youtube#playlistListResponse', items, offset, page_size, 'mine'))
+
+                playlist_id = query.get('playlistId')
+                if playlist_id not in playlists:
+                    return self.send_json(404, data_api_error(404, 'playlistNotFound', "The playlist identified with the request's playlistId parameter cannot be found."))
+                items = [data_api_playlist_item(playlist_id, i, t) for i, t in enumerate(playlists[playlist_id]['tracks'])]
+                return self.send_json(200, data_api_page('youtube#playlistItemListResponse', items, offset, page_size, playlist_id))
+
+            def handle_browse(self, body):
+                outcome = server._admit('browse')
+                if outcome == 'throttled':
+                    return self.send_json(429, music_error(429, 'RESOURCE_EXHAUSTED', "Too many requests."))
+                if outcome == 'error':
+                    return self.send_json(500, music_error(500, 'INTERNAL', "Internal error encountered."))
+
+                playlists = server.library.playlists
+                if body.get('continuation'):
+                    decoded = decode_token(body['continuation'])
+                    if not decoded or decoded[0] not in playlists:
+                        return self.send_json(400, music_error(400, 'INVALID_ARGUMENT', "Request contains an invalid argument."))
+                    playlist_id, offset = decoded
+                    return self.send_json(200, music_continuation_page(playlist_id, playlists[playlist_id], offset, server.music_page_size))
+
+                playlist_id = str(body.get('browseId', ''))
+                if playlist_id.startswith('VL'):
+                    playlist_id = playlist_id[2:]
+                playlist = playlists.get(playlist_id)
+                # Private playlists are not visible to unauthenticated YouTube Music requests.
+                if not playlist or playlist['privacyStatus'] == 'private':
+                    return self.send_json(404, music_error(404, 'NOT_FOUND', "Requested entity was not found."))
+                return self.send_json(200, music_playlist_page(playlist_id, playlist, server.music_page_size))
+
+        return Handler
+
+def run_load_test(server, num_retries):
+    """
+    Runs a full sync of every playlist in the server's library through a YouTubeHandler and prints a report.
+
+    Returns:
+        dict: The sync's outcome counts, elapsed time and the server's request stats.
+    """
+    from youtube_handler import YouTubeHandler
+
+    handler = YouTubeHandler(api_endpoint=server.url, num_retries=num_retries)
+    playlists_to_sync = {pid: {'title': p['title'], 'tracks': []} for pid, p in server.library.playlists.items()}
+    server.reset_stats()
+    start = time.perf_counter()
+    updated_playlists, summary = handler.sync_playlists(playlists_to_sync)
+    elapsed = time.perf_counter() - start
+    synced_tracks = sum(len(p.get('tracks', [])) for p in updated_playlists.values())
+    report = {
+        'playlists': len(playlists_to_sync),
+        'synced': len(updated_playlists),
+        'failed': len(playlists_to_sync) - len(updated_playlists),
+        'tracks': synced_tracks,
+        'elapsed': elapsed,
+        'server': dict(server.stats),
+    }
+    print(f"Synced {report['synced']}/{report['playlists']} playlists ({synced_tracks} tracks) in {elapsed:.2f}s, "
+          f"{synced_tracks / elapsed if elapsed else 0:.0f} tracks/s")
+    print("Requests: " + ", ".join(f"{key} {value}" for key, value in report['server'].items()))
+    failures = [line for line in summary if 'Failed' in line or 'Skipped' in line]
+    for line in failures[:10]:
+        print(f"  {line}")
+    if len(failures) > 10:
+        print(f"  ... and {len(failures) - 10} more")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic account that imitates the YouTube Data API and YouTube Music.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--playlists', type=int, default=50, help="Playlists in the account (default: 50).")
+    parser.add_argument('--tracks', type=int, default=200, help="Average tracks per playlist (default: 200).")
+    parser.add_argument('--private-share', type=float, default=0.3, help="Share of private or unlisted playlists (default: 0.3).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response (default: 0).")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many random extra seconds per response (default: 0).")
+    parser.add_argument('--page-size', type=int, default=DATA_API_MAX_RESULTS, help="Data API items per page (default: 50).")
+    parser.add_argument('--music-page-size', type=int, default=MUSIC_PAGE_SIZE, help="YouTube Music tracks per page (default: 100).")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failing with a 5xx (default: 0).")
+    parser.add_argument('--burst-every', type=int, default=0, help="Start a burst of 429s every N requests (default: off).")
+    parser.add_argument('--burst-length', type=int, default=3, help="Requests rejected per 429 burst (default: 3).")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--load-test', action='store_true', help="Run a full sync against the server, print a report and exit.")
+    parser.add_argument('--retries', type=int, default=3, help="Retries per Data API request during the load test (default: 3).")
+    args = parser.parse_args(argv)
+
+    library = MockLibrary(args.playlists, args.tracks, args.private_share, args.seed)
+    server = MockAPIServer(
+        library, args.host, 0 if args.load_test else args.port, args.latency, args.jitter,
+        args.page_size, args.music_page_size, args.error_rate, args.burst_every, args.burst_length, args.seed,
+    )
+    print(f"Serving {len(library.playlists)} playlists ({library.track_count()} tracks) at {server.url}")
+    with server:
+        if args.load_test:
+            run_load_test(server, args.retries)
+            return 0
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\nStopping.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
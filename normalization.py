@@ -0,0 +1,56 @@
+import re
+import unicodedata
+
+# Bracketed suffixes that describe the upload rather than the song, e.g. "(Official Video)",
+# and "(Original Mix)", which stores add to the default version of a track.
+NOISE_PATTERN = re.compile(
+    r'[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|explicit|clean|original mix)\b[^\)\]]*[\)\]]',
+    re.IGNORECASE)
+BRACKETED_FEATURE_PATTERN = re.compile(r'[\(\[]\s*(feat|ft|featuring)\b[^\)\]]*[\)\]]', re.IGNORECASE)
+UNBRACKETED_FEATURE_PATTERN = re.compile(r'\s(feat|ft|featuring)\b[^_\(\[\-]*', re.IGNORECASE)
+ARTIST_SEPARATOR_PATTERN = re.compile(r'\s*(?:,|&|;|/|\bfeat\b\.?|\bft\b\.?|\bfeaturing\b|\bvs\b\.?)\s*', re.IGNORECASE)
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+def normalize_text(text):
+    """
+    Folds a string for comparison: accents are removed, case is folded and punctuation
+    is collapsed into single spaces.
+    """
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.casefold()
+    return ' '.join(NON_WORD_PATTERN.sub(' ', text).split())
+
+def normalize_title(title):
+    """
+    Normalizes a track title, dropping featured artists and upload noise such as "(Official Video)".
+    """
+    title = BRACKETED_FEATURE_PATTERN.sub(' ', title or '')
+    title = UNBRACKETED_FEATURE_PATTERN.sub(' ', title)
+    title = NOISE_PATTERN.sub(' ', title)
+    return normalize_text(title)
+
+def split_artists(artist_string):
+    """
+    Splits a combined artist string such as "A & B feat. C" into normalized artist names.
+    """
+    names = (normalize_text(name) for name in ARTIST_SEPARATOR_PATTERN.split(artist_string or ''))
+    return [name for name in names if name]
+
+def track_artist_names(track_info):
+    """
+    Returns the normalized artist names of a YouTube Music track.
+    """
+    names = []
+    for artist in track_info.get('artists', []):
+        if artist and artist.get('name'):
+            names.extend(split_artists(artist['name'].replace(' - Topic', '')))
+    return names
+
+def match_key(artist, title):
+    """
+    Builds the lookup key for one normalized artist and title.
+    """
+    return f"{artist}\t{title}"
@@ -0,0 +1,242 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from array import array
+from urllib.parse import quote
+from xml.sax.saxutils import quoteattr
+
+# Rekordbox 'Kind' values for the extensions this project writes.
+FILE_KINDS = {
+    '.mp3': 'MP3 File',
+    '.m4a': 'M4A File',
+    '.aac': 'AAC File',
+    '.ogg': 'OGG File',
+    '.opus': 'OPUS File',
+}
+
+def path_to_location(filepath):
+    """
+    Converts a local path into the file URI format used by Rekordbox, e.g.
+    'file://localhost/C:/Music/Track.mp3'.
+    """
+    path = os.path.abspath(filepath).replace('\\', '/')
+    if not path.startswith('/'):
+        path = '/' + path
+    return 'file://localhost' + quote(path, safe="/:")
+
+def get_duration_seconds(track_info):
+    """
+    Returns a track's duration in whole seconds, or None if it is unknown.
+    """
+    if track_info.get('duration_seconds'):
+        return int(track_info['duration_seconds'])
+    duration = track_info.get('duration')
+    if duration:
+        try:
+            seconds = 0
+            for part in str(duration).split(':'):
+                seconds = seconds * 60 + int(part)
+            return seconds
+        except ValueError:
+            return None
+    return None
+
+class RekordboxExporter:
+    """
+    Writes the downloaded library as a Rekordbox 'rekordbox.xml' collection.
+    Every synced playlist becomes a playlist node, with its micro-playlists as sibling
+    nodes in a folder. The XML is streamed to disk while playlists are resolved, and the TRACK
+    entries of files whose size and modification time are unchanged are reused from the previous
+    export. The entries are cached in a SQLite file keyed by path and read and written one at a
+    time, so neither the document nor the cache is held in memory.
+    """
+
+    def __init__(self, file_manager, track_checker, microplaylist_handler, cache_path='rekordbox_export_cache.sqlite',
+                 attribute_providers=()):
+        """
+        Initializes the RekordboxExporter.
+
+        Args:
+            file_manager (FileManager): Used to resolve names and directories.
+            track_checker (TrackChecker): Used to locate the downloaded files. It should be freshly rescanned.
+            microplaylist_handler (MicroPlaylistHandler): Used to split playlists into micro-playlists.
+            cache_path (str): Where TRACK entries are cached between exports.
+            attribute_providers (iterable): Callables that take a file path and return a dict of extra
+                                            TRACK attributes (e.g. AverageBpm), or an empty dict.
+        """
+        self.file_manager = file_manager
+        self.track_checker = track_checker
+        self.microplaylist_handler = microplaylist_handler
+        self.cache_path = cache_path
+        self.attribute_providers = list(attribute_providers)
+
+    def open_cache(self):
+        """
+        Opens the TRACK entry cache. Each row holds a file's size, modification time, rendered
+        attributes and the number of the export that last used it.
+        """
+        try:
+            return self._connect_cache()
+        except sqlite3.DatabaseError:
+            os.remove(self.cache_path)  # Rebuild a corrupted cache
+            return self._connect_cache()
+
+    def _connect_cache(self):
+        connection = sqlite3.connect(self.cache_path)
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS tracks (path TEXT PRIMARY KEY, size INTEGER, '
+                               'mtime_ns INTEGER, attributes TEXT, export INTEGER)')
+        except sqlite3.DatabaseError:
+            connection.close()
+            raise
+        return connection
+
+    def _build_track_attributes(self, track_info, filepath, stat):
+        """
+        Renders the cacheable TRACK attributes of one file (everything except TrackID).
+        """
+        attributes = [
+            ('Name', track_info.get('title', '')),
+            ('Artist', ', '.join(a['name'].replace(' - Topic', '').strip() for a in track_info.get('artists', []) if a and 'name' in a)),
+        ]
+        album = track_info.get('album')
+        if isinstance(album, dict) and album.get('name'):
+            attributes.append(('Album', album['name']))
+        kind = FILE_KINDS.get(os.path.splitext(filepath)[1].lower())
+        if kind:
+            attributes.append(('Kind', kind))
+        attributes.append(('Size', str(stat.st_size)))
+        duration = get_duration_seconds(track_info)
+        if duration:
+            attributes.append(('TotalTime', str(duration)))
+        if track_info.get('year'):
+            attributes.append(('Year', str(track_info['year'])))
+        attributes.append(('Location', path_to_location(filepath)))
+        return ''.join(f' {name}={quoteattr(str(value))}' for name, value in attributes)
+
+    def _extra_attributes(self, filepath):
+        extras = {}
+        for provider in self.attribute_providers:
+            extras.update(provider(filepath) or {})
+        return ''.join(f' {name}={quoteattr(str(value))}' for name, value in extras.items())
+
+    def export(self, playlists, output_path, progress_callback=None):
+        """
+        Exports all playlists to a Rekordbox XML file. The file is written under a temporary
+        name and renamed into place when complete.
+
+        Args:
+            playlists (dict): All synced playlists, keyed by playlist ID.
+            output_path (str): Where to write rekordbox.xml.
+            progress_callback (callable, optional): Called as progress_callback(done, total) per playlist.
+
+        Returns:
+            dict: 'tracks' (collection size), 'playlists' (playlist nodes) and 'reused' (cached entries).
+        """
+        cache = self.open_cache()
+        try:
+            return self._export(cache, playlists, output_path, progress_callback)
+        finally:
+            cache.close()
+
+    def _export(self, cache, playlists, output_path, progress_callback):
+        # Entries this export does not use are dropped at the end; until the commit, the previous cache stays intact.
+        export_number = (cache.execute('SELECT MAX(export) FROM tracks').fetchone()[0] or 0) + 1
+        track_ids = {}
+        reused = 0
+        # (folder name or None, [(node name, array of TrackIDs)])
+        nodes = []
+
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as collection_body:
+            for done, (p_id, playlist_info) in enumerate(playlists.items(), start=1):
+                micro_tracks_map, remaining_tracks_map = self.microplaylist_handler.segregate_tracks({p_id: playlist_info})
+                title = playlist_info.get('title', 'Untitled Playlist')
+                placements = [(title, None, remaining_tracks_map.get(p_id, []))]
+                for (_, mp_name), mp_tracks in sorted(micro_tracks_map.items(), key=lambda item: item[0][1]):
+                    placements.append((mp_name, mp_name, mp_tracks))
+
+                playlist_nodes = []
+                for node_name, micro_name, tracks in placements:
+                    members = array('I')
+                    for track in tracks:
+                        video_id = track.get('videoId')
+                        if video_id in track_ids:
+                            members.append(track_ids[video_id])
+                            continue
+                        filepath = self.track_checker.is_downloaded(track, playlist_info, micro_name)
+                        if not filepath:
+                            continue
+                        try:
+                            stat = os.stat(filepath)
+                        except OSError:
+                            continue
+
+                        cached = cache.execute('SELECT size, mtime_ns, attributes FROM tracks WHERE path = ?',
+                                               (filepath,)).fetchone()
+                        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                            attributes = cached[2]
+                            reused += 1
+                            cache.execute('UPDATE tracks SET export = ? WHERE path = ?', (export_number, filepath))
+                        else:
+                            attributes = self._build_track_attributes(track, filepath, stat)
+                            cache.execute('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)',
+                                          (filepath, stat.st_size, stat.st_mtime_ns, attributes, export_number))
+
+                        track_id = len(track_ids) + 1
+                        track_ids[video_id] = track_id
+                        members.append(track_id)
+                        collection_body.write(f'    <TRACK TrackID="{track_id}"{attributes}{self._extra_attributes(filepath)}/>\n')
+                    playlist_nodes.append((node_name, members))
+
+                if len(playlist_nodes) > 1:
+                    nodes.append((title, playlist_nodes))
+                else:
+                    nodes.append((None, playlist_nodes))
+                if progress_callback:
+                    progress_callback(done, len(playlists))
+
+            fd, temp_output = tempfile.mkstemp(suffix='.xml.tmp', dir=output_dir)
+            try:
+                self._write_document(fd, collection_body, len(track_ids), nodes)
+                os.replace(temp_output, output_path)
+            except OSError:
+                if os.path.exists(temp_output):
+                    os.remove(temp_output)
+                raise
+
+        cache.execute('DELETE FROM tracks WHERE export != ?', (export_number,))
+        cache.commit()
+        playlist_count = sum(len(playlist_nodes) for _, playlist_nodes in nodes)
+        return {'tracks': len(track_ids), 'playlists': playlist_count, 'reused': reused}
+
+    def _write_document(self, fd, collection_body, entry_count, nodes):
+        """
+        Writes the final XML document around the already-rendered collection entries.
+        """
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            out.write('<DJ_PLAYLISTS Version="1.0.0">\n')
+            out.write('  <PRODUCT Name="Rekordbox YT Music Bridge" Version="1.0" Company=""/>\n')
+            out.write(f'  <COLLECTION Entries="{entry_count}">\n')
+            collection_body.seek(0)
+            shutil.copyfileobj(collection_body, out)
+            out.write('  </COLLECTION>\n')
+            out.write('  <PLAYLISTS>\n')
+            out.write(f'    <NODE Type="0" Name="ROOT" Count="{len(nodes)}">\n')
+            for folder_name, playlist_nodes in nodes:
+                indent = '      '
+                if folder_name is not None:
+                    out.write(f'{indent}<NODE Type="0" Name={quoteattr(folder_name)} Count="{len(playlist_nodes)}">\n')
+                    indent += '  '
+                for node_name, members in playlist_nodes:
+                    out.write(f'{indent}<NODE Name={quoteattr(node_name)} Type="1" KeyType="0" Entries="{len(members)}">\n')
+                    for track_id in members:
+                        out.write(f'{indent}  <TRACK Key="{track_id}"/>\n')
+                    out.write(f'{indent}</NODE>\n')
+                if folder_name is not None:
+                    out.write('      </NODE>\n')
+            out.write('    </NODE>\n')
+            out.write('  </PLAYLISTS>\n')
+            out.write('</DJ_PLAYLISTS>\n')
@@ -0,0 +1,110 @@
+import os
+import re
+import json
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, urlparse
+from normalization import match_key, normalize_title, split_artists, track_artist_names
+
+def location_to_path(location):
+    """
+    Converts a Rekordbox file URI such as 'file://localhost/C:/Music/Track.mp3' into a local path.
+    """
+    path = unquote(urlparse(location).path)
+    if re.match(r'^/[A-Za-z]:/', path):
+        path = path[1:]  # Windows drive letter
+    return os.path.normpath(path)
+
+def parse_collection(xml_path):
+    """
+    Streams through a rekordbox.xml file and indexes its COLLECTION by artist and title.
+    Each TRACK element is discarded as soon as it has been read, so memory use depends on
+    the size of the index rather than the size of the file.
+
+    Args:
+        xml_path (str): Path to the exported rekordbox.xml.
+
+    Returns:
+        dict: A map of match keys (see normalization.match_key) to local file paths.
+    """
+    index = {}
+    collection = None
+    for event, elem in ET.iterparse(xml_path, events=('start', 'end')):
+        if elem.tag == 'COLLECTION':
+            if event == 'end':
+                break  # Only PLAYLISTS follow, which reference the same tracks.
+            collection = elem
+        elif event == 'end' and elem.tag == 'TRACK' and collection is not None:
+            location = elem.get('Location', '')
+            title = normalize_title(elem.get('Name'))
+            if location.startswith('file:') and title:
+                filepath = location_to_path(location)
+                for artist in split_artists(elem.get('Artist')):
+                    index.setdefault(match_key(artist, title), filepath)
+            collection.clear()
+    return index
+
+class RekordboxCollection:
+    """
+    An index of the tracks already in a Rekordbox collection, built from its XML export.
+    The index is cached on disk and only rebuilt when the XML file's size or modification
+    time changes.
+    """
+
+    def __init__(self, xml_path, cache_path='rekordbox_collection_index.json'):
+        """
+        Initializes the RekordboxCollection. The index is not built until load() is called.
+
+        Args:
+            xml_path (str): Path to the exported rekordbox.xml.
+            cache_path (str): Where the parsed index is cached between runs.
+        """
+        self.xml_path = xml_path
+        self.cache_path = cache_path
+        self.index = {}
+
+    def load_cache(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_cache(self, cache):
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+
+    def load(self):
+        """
+        Loads the index from the cache, or parses the XML file if it changed since it was cached.
+
+        Raises:
+            OSError: If the XML file cannot be read.
+            xml.etree.ElementTree.ParseError: If the XML file is malformed.
+        """
+        stat = os.stat(self.xml_path)
+        source = os.path.abspath(self.xml_path)
+        cache = self.load_cache()
+        if cache.get('source') == source and cache.get('size') == stat.st_size and cache.get('mtime_ns') == stat.st_mtime_ns:
+            self.index = cache.get('index', {})
+            return
+
+        self.index = parse_collection(self.xml_path)
+        self.save_cache({'source': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'index': self.index})
+
+    def find(self, track_info):
+        """
+        Looks a YouTube Music track up by its normalized artists and title.
+
+        Returns:
+            str or None: The path of the matching collection file, if it still exists.
+        """
+        title = normalize_title(track_info.get('title'))
+        if not title:
+            return None
+        for artist in track_artist_names(track_info):
+            filepath = self.index.get(match_key(artist, title))
+            if filepath and os.path.exists(filepath):
+                return filepath
+        return None
@@ -0,0 +1,215 @@
+import os
+import json
+import uuid
+
+def build_reformat_mapping(playlist_id, playlist_info, file_manager, track_checker, microplaylist_handler):
+    """
+    Computes the full old -> new path mapping for reformatting one playlist's files.
+    Every track is resolved through the TrackChecker's indexes, so the whole mapping is
+    built in a single pass over the playlist.
+
+    Args:
+        playlist_id (str): The ID of the synced playlist.
+        playlist_info (dict): The playlist's metadata, including its tracks.
+        file_manager (FileManager): Generates the new filenames from the current settings.
+        track_checker (TrackChecker): Locates the existing files. It should be freshly rescanned.
+        microplaylist_handler (MicroPlaylistHandler): Determines which micro-playlist folders tracks live in.
+
+    Returns:
+        dict: A map of existing file paths to their new paths.
+    """
+    tracks = playlist_info.get('tracks', [])
+    total_tracks = len(tracks)
+    positions = {}
+    for i, track in enumerate(tracks):
+        positions.setdefault(track.get('videoId'), i + 1)
+
+    micro_tracks_map, remaining_tracks_map = microplaylist_handler.segregate_tracks({playlist_id: playlist_info})
+    placements = [(mp_name, mp_tracks) for (_, mp_name), mp_tracks in micro_tracks_map.items()]
+    placements.append((None, remaining_tracks_map.get(playlist_id, [])))
+
+    mapping = {}
+    for micro_name, placed_tracks in placements:
+        for track in placed_tracks:
+            old_filepath = track_checker.is_downloaded(track, playlist_info, micro_name)
+            if not old_filepath or old_filepath in mapping:
+                continue
+            new_filename = file_manager.get_filename(track, positions.get(track.get('videoId')), total_tracks)
+            new_filepath = os.path.join(os.path.dirname(old_filepath), new_filename + os.path.splitext(old_filepath)[1])
+            if new_filepath != old_filepath:
+                mapping[old_filepath] = new_filepath
+    return mapping
+
+class RenamePlanner:
+    """
+    Turns a set of requested renames into a safe, ordered list of operations.
+    Renames that form chains (A -> B while B -> C) are ordered so that every target is
+    free before it is written, and cycles (A -> B, B -> A) are broken by moving one file
+    to a temporary name first. Applied operations are recorded in a journal so that an
+    interrupted or failed run can be rolled back.
+    """
+
+    def __init__(self, mapping):
+        """
+        Initializes the RenamePlanner and computes the plan.
+
+        Args:
+            mapping (dict): A map of existing file paths to their desired new paths.
+        """
+        self.operations = []
+        self.conflicts = []
+        self.temporary_moves = 0
+        self._plan(mapping)
+
+    def _plan(self, mapping):
+        # A target may only be claimed once, and only if it is free or itself being renamed away.
+        renames = {}
+        claimed = set()
+        for src, dst in mapping.items():
+            if src == dst:
+                continue
+            if dst in claimed:
+                self.conflicts.append((src, dst, "Another file is being renamed to this name."))
+            elif os.path.exists(dst) and dst not in mapping:
+                self.conflicts.append((src, dst, "A different file with this name already exists."))
+            else:
+                renames[src] = dst
+                claimed.add(dst)
+
+        # A skipped file stays where it is, so a rename onto it must be skipped too, and so on
+        # down the chain until every remaining target is free or renamed away.
+        skipped = True
+        while skipped:
+            skipped = False
+            for src, dst in list(renames.items()):
+                if dst in mapping and dst not in renames:
+                    self.conflicts.append((src, dst, "The file with this name could not be renamed away."))
+                    del renames[src]
+                    claimed.discard(dst)
+                    skipped = True
+
+        # Each file has at most one predecessor and one successor, so the renames form
+        # simple chains and cycles. Chains are applied from their free end backwards.
+        done = set()
+        for head in renames:
+            if head in claimed:
+                continue
+            chain = [head]
+            while renames[chain[-1]] in renames:
+                chain.append(renames[chain[-1]])
+            for src in reversed(chain):
+                self.operations.append((src, renames[src]))
+                done.add(src)
+
+        # Whatever is left belongs to a cycle.
+        for start in renames:
+            if start in done:
+                continue
+            cycle = [start]
+            while renames[cycle[-1]] != start:
+                cycle.append(renames[cycle[-1]])
+
+            temp_path = os.path.join(os.path.dirname(start), f".reformat-{uuid.uuid4().hex}.tmp")
+            self.operations.append((start, temp_path))
+            for src in reversed(cycle[1:]):
+                self.operations.append((src, renames[src]))
+            self.operations.append((temp_path, renames[start]))
+            self.temporary_moves += 1
+            done.update(cycle)
+
+    def rename_count(self):
+        return len(self.operations) - self.temporary_moves
+
+    def describe(self, limit=200):
+        """
+        Returns a human-readable dry run of the plan.
+        """
+        lines = [f"{self.rename_count()} file(s) will be renamed."]
+        if self.temporary_moves:
+            lines.append(f"{self.temporary_moves} rename cycle(s) will be resolved through temporary names.")
+        if self.conflicts:
+            lines.append(f"{len(self.conflicts)} file(s) will be skipped because of name conflicts.")
+        lines.append("")
+        for src, dst in self.operations[:limit]:
+            lines.append(f"{os.path.basename(src)} -> {os.path.basename(dst)}")
+        if len(self.operations) > limit:
+            lines.append(f"... and {len(self.operations) - limit} more")
+        for src, dst, reason in self.conflicts:
+            lines.append(f"SKIPPED {os.path.basename(src)} -> {os.path.basename(dst)}: {reason}")
+        return "\n".join(lines)
+
+    def apply(self, journal_path, progress_callback=None, should_continue=None):
+        """
+        Executes the planned operations in order, journaling each completed rename.
+
+        Args:
+            journal_path (str): File the journal is written to, for use with rollback().
+            progress_callback (callable, optional): Called as progress_callback(done, total).
+            should_continue (callable, optional): Polled before each rename; returning False stops the run.
+
+        Returns:
+            tuple: (renamed_count, errors), where errors is a list of (src, dst, message).
+        """
+        errors = []
+        renamed = 0
+        total = len(self.operations)
+        # Paths of failed operations. A later operation that needs one of them belongs to the
+        # same chain or cycle and is skipped; independent chains go on.
+        blocked = set()
+
+        with open(journal_path, 'w', encoding='utf-8') as journal:
+            for i, (src, dst) in enumerate(self.operations):
+                if should_continue and not should_continue():
+                    break
+                if src in blocked or dst in blocked:
+                    errors.append((src, dst, "Skipped because an earlier rename in its chain failed."))
+                    blocked.update((src, dst))
+                    continue
+                try:
+                    # os.rename silently replaces existing files on POSIX, so check first.
+                    if os.path.exists(dst):
+                        raise FileExistsError(f"'{dst}' already exists")
+                    os.rename(src, dst)
+                except OSError as e:
+                    errors.append((src, dst, str(e)))
+                    blocked.update((src, dst))
+                    continue
+                journal.write(json.dumps({"src": src, "dst": dst}) + "\n")
+                journal.flush()
+                if not os.path.basename(dst).startswith('.reformat-'):
+                    renamed += 1
+                if progress_callback:
+                    progress_callback(i + 1, total)
+
+        return renamed, errors
+
+    @staticmethod
+    def rollback(journal_path, progress_callback=None):
+        """
+        Reverts the renames recorded in a journal, newest first.
+
+        Returns:
+            tuple: (reverted_count, errors), where errors is a list of (src, dst, message).
+        """
+        if not os.path.exists(journal_path):
+            return 0, []
+
+        with open(journal_path, 'r', encoding='utf-8') as journal:
+            entries = [json.loads(line) for line in journal if line.strip()]
+
+        errors = []
+        reverted = 0
+        for i, entry in enumerate(reversed(entries)):
+            try:
+                if os.path.exists(entry["src"]):
+                    raise FileExistsError(f"'{entry['src']}' already exists")
+                os.rename(entry["dst"], entry["src"])
+                reverted += 1
+            except OSError as e:
+                errors.append((entry["dst"], entry["src"], str(e)))
+            if progress_callback:
+                progress_callback(i + 1, len(entries))
+
+        if not errors:
+            os.remove(journal_path)
+        return reverted, errors
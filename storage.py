@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from instrumentation import span, count
+from track_record import TrackRecord, compact_playlist
+
+PLAYLISTS_FILE = "playlists.json"
+CONFIG_FILE = "config.json"
+LIBRARY_DIRECTORY = "library"
+MANIFEST_FILE = "manifest.json"
+RAW_DIRECTORY = "raw"
+# Playlists whose tracks are kept in memory after they were last used.
+PLAYLIST_CACHE_SIZE = 16
+DEFAULT_CONFIG = {
+    "download_directory": "",
+    "numbering": "playlist_order",
+    "name_order": "track_artist",
+    "output_format": "mp3",
+    "staging_enabled": False
+}
+
+def load_playlists(path=PLAYLISTS_FILE):
+    """
+    Loads the synced playlists from the single-file format used before PlaylistStore, keyed by
+    playlist ID, for migration. Returns an empty dict if the file does not exist.
+    """
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def load_config(path=CONFIG_FILE):
+    """
+    Loads the settings shared by the GUI and the command line.
+
+    Returns:
+        dict: The saved settings, or a copy of DEFAULT_CONFIG if there is no config file yet.
+    """
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return dict(DEFAULT_CONFIG)
+
+def save_config(config, path=CONFIG_FILE):
+    with span('save.config'), open(path, 'w') as f:
+        json.dump(config, f, indent=4)
+
+def write_json_atomically(data, path, **dump_options):
+    """
+    Writes JSON to a temporary file and moves it over path, so a crash never leaves a half-written file.
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_options)
+    os.replace(temp_path, path)
+
+class PlaylistStore(MutableMapping):
+    """
+    The synced playlists, keyed by playlist ID, stored as a small manifest (title, track count
+    and sync time per playlist) plus one compact file per playlist.
+
+    Only the manifest is read up front. A playlist's tracks are read the first time it is
+    accessed, and the most recently used playlists stay in memory, so opening the library costs
+    time and memory in proportion to the number of playlists rather than the number of tracks.
+    Assigning a playlist reduces its tracks to TrackRecords and writes its file; save() writes
+    the manifest.
+    """
+
+    def __init__(self, directory=LIBRARY_DIRECTORY, cache_size=PLAYLIST_CACHE_SIZE, legacy_file=PLAYLISTS_FILE,
+                 keep_raw=False):
+        """
+        Initializes the PlaylistStore.
+
+        Args:
+            directory (str): The library directory holding the manifest and the playlist files.
+            cache_size (int): The number of playlists kept in memory.
+            legacy_file (str): A single-file playlists.json to migrate from if there is no manifest
+                yet. It is renamed with a .bak suffix once migrated.
+            keep_raw (bool): Also write each assigned playlist as received, with every field the API
+                returned, to the raw subdirectory.
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.cache_size = cache_size
+        self.keep_raw = keep_raw
+        self.lock = threading.RLock()
+        self.loaded = OrderedDict()
+        self.manifest_changed = False
+        with span('library.open'):
+            self.manifest = self._load_manifest(legacy_file)
+
+    def _load_manifest(self, legacy_file):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        self.manifest = {}
+        os.makedirs(self.directory, exist_ok=True)
+        if legacy_file and os.path.exists(legacy_file):
+            print(f"Migrating {legacy_file} to per-playlist files in {self.directory}...")
+            for p_id, playlist_info in load_playlists(legacy_file).items():
+                self._write_playlist(p_id, playlist_info, synced_at=None)
+            self.save()
+            os.replace(legacy_file, legacy_file + '.bak')
+        return self.manifest
+
+    @staticmethod
+    def playlist_filename(p_id):
+        """
+        Returns the file a playlist is stored in. Playlist IDs differ by case alone, so a short
+        hash keeps them apart on case-insensitive file systems.
+        """
+        digest = hashlib.sha1(p_id.encode('utf-8')).hexdigest()[:8]
+        return f"{re.sub(r'[^A-Za-z0-9_-]', '_', p_id)}-{digest}.json"
+
+    def _write_playlist(self, p_id, playlist_info, synced_at):
+        """
+        Writes a playlist's file and manifest entry.
+
+        Returns:
+            dict: The playlist as stored, with its tracks as TrackRecords.
+        """
+        filename = self.playlist_filename(p_id)
+        if self.keep_raw:
+            os.makedirs(os.path.join(self.directory, RAW_DIRECTORY), exist_ok=True)
+            write_json_atomically(playlist_info, os.path.join(self.directory, RAW_DIRECTORY, filename), separators=(',', ':'))
+        playlist_info = compact_playlist(playlist_info)
+        write_json_atomically(playlist_info, os.path.join(self.directory, filename), separators=(',', ':'),
+                              default=TrackRecord.to_dict)
+        self.manifest[p_id] = {
+            'title': playlist_info.get('title', ''),
+            'track_count': len(playlist_info.get('tracks', [])),
+            'synced_at': synced_at,
+            'file': filename,
+        }
+        self.manifest_changed = True
+        return playlist_info
+
+    def _cache(self, p_id, playlist_info):
+        self.loaded[p_id] = playlist_info
+        self.loaded.move_to_end(p_id)
+        while len(self.loaded) > self.cache_size:
+            self.loaded.popitem(last=False)
+
+    def info(self, p_id):
+        """
+        Returns a playlist's manifest entry ('title', 'track_count', 'synced_at') without reading its tracks.
+        """
+        return self.manifest[p_id]
+
+    def __getitem__(self, p_id):
+        with self.lock:
+            playlist_info = self.loaded.get(p_id)
+            if playlist_info is not None:
+                self.loaded.move_to_end(p_id)
+                return playlist_info
+            entry = self.manifest[p_id]
+            path = os.path.join(self.directory, entry['file'])
+            count('library.playlist_loads')
+            with span('library.load_playlist', playlist_id=p_id):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        playlist_info = compact_playlist(json.load(f))
+                except FileNotFoundError:
+                    print(f"Playlist file {path} is missing; showing '{entry['title']}' without tracks.")
+                    playlist_info = {'title': entry['title'], 'tracks': []}
+            self._cache(p_id, playlist_info)
+            return playlist_info
+
+    def __setitem__(self, p_id, playlist_info):
+        with self.lock, span('library.save_playlist', playlist_id=p_id):
+            playlist_info = self._write_playlist(p_id, playlist_info, synced_at=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            self._cache(p_id, playlist_info)
+
+    def __delitem__(self, p_id):
+        with self.lock:
+            entry = self.manifest.pop(p_id)
+            self.loaded.pop(p_id, None)
+            self.manifest_changed = True
+            for path in (os.path.join(self.directory, entry['file']),
+                         os.path.join(self.directory, RAW_DIRECTORY, entry['file'])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def __contains__(self, p_id):
+        return p_id in self.manifest
+
+    def __iter__(self):
+        # Iterates over a snapshot, so playlists can be added or removed meanwhile from another thread.
+        return iter(list(self.manifest))
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def save(self):
+        """
+        Writes the manifest if playlists were added, replaced or removed since it was last written.
+        """
+        with self.lock:
+            if not self.manifest_changed:
+                return
+            with span('save.manifest'):
+                write_json_atomically(self.manifest, self.manifest_path, indent=4)
+            self.manifest_changed = False
@@ -0,0 +1,167 @@
+import os
+import json
+import struct
+from instrumentation import span
+
+# Name of the custom tag holding the YouTube videoId. ffmpeg writes it as a TXXX frame in
+# MP3 files and as a Vorbis comment in .opus/.ogg files.
+VIDEO_ID_TAG = 'youtube_video_id'
+
+# How much of an Ogg file is read when looking for the comment header.
+OGG_HEADER_READ_SIZE = 65536
+
+def read_video_id(filepath):
+    """
+    Reads the videoId tag of a downloaded file by parsing only its tag header.
+    The audio data is never read.
+
+    Args:
+        filepath (str): Path to an audio file.
+
+    Returns:
+        str or None: The videoId, or None if the file has no such tag or cannot be parsed.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            magic = f.read(4)
+            f.seek(0)
+            if magic[:3] == b'ID3':
+                return _read_id3_video_id(f)
+            if magic == b'OggS':
+                return _read_ogg_video_id(f)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        pass
+    return None
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _decode_id3_text(encoding, data):
+    """
+    Splits a TXXX payload into its description and value.
+    """
+    if encoding in (1, 2):
+        codec = 'utf-16' if encoding == 1 else 'utf-16-be'
+        # The terminator is a 2-byte null aligned to a character boundary.
+        for i in range(0, len(data) - 1, 2):
+            if data[i:i + 2] == b'\x00\x00':
+                return data[:i].decode(codec), data[i + 2:].decode(codec).rstrip('\x00')
+        return data.decode(codec), ''
+    codec = 'latin-1' if encoding == 0 else 'utf-8'
+    description, _, value = data.partition(b'\x00')
+    return description.decode(codec), value.decode(codec).rstrip('\x00')
+
+def _read_id3_video_id(f):
+    header = f.read(10)
+    if len(header) < 10:
+        return None
+    major_version, flags = header[3], header[5]
+    if major_version not in (3, 4):
+        return None
+    tag = f.read(_syncsafe(header[6:10]))
+
+    pos = 0
+    if flags & 0x40:
+        # Skip the extended header.
+        ext_size = _syncsafe(tag[0:4]) if major_version == 4 else struct.unpack('>I', tag[0:4])[0] + 4
+        pos = ext_size
+
+    while pos + 10 <= len(tag):
+        frame_id = tag[pos:pos + 4]
+        if frame_id == b'\x00\x00\x00\x00':
+            break  # Padding
+        size_bytes = tag[pos + 4:pos + 8]
+        frame_size = _syncsafe(size_bytes) if major_version == 4 else struct.unpack('>I', size_bytes)[0]
+        frame = tag[pos + 10:pos + 10 + frame_size]
+        pos += 10 + frame_size
+
+        if frame_id == b'TXXX' and frame:
+            description, value = _decode_id3_text(frame[0], frame[1:])
+            if description.lower() == VIDEO_ID_TAG:
+                return value or None
+    return None
+
+def _read_ogg_video_id(f):
+    data = f.read(OGG_HEADER_READ_SIZE)
+    for marker in (b'OpusTags', b'\x03vorbis'):
+        pos = data.find(marker)
+        if pos != -1:
+            pos += len(marker)
+            break
+    else:
+        return None
+
+    vendor_length = struct.unpack('<I', data[pos:pos + 4])[0]
+    pos += 4 + vendor_length
+    count = struct.unpack('<I', data[pos:pos + 4])[0]
+    pos += 4
+    for _ in range(count):
+        length = struct.unpack('<I', data[pos:pos + 4])[0]
+        comment = data[pos + 4:pos + 4 + length]
+        pos += 4 + length
+        key, _, value = comment.partition(b'=')
+        if key.decode('ascii', 'replace').lower() == VIDEO_ID_TAG:
+            return value.decode('utf-8') or None
+    return None
+
+class TagIndex:
+    """
+    Builds a videoId -> file path index from the tags of downloaded files.
+    Tags are cached on disk by file size and modification time, so a rescan only opens
+    files that are new or have changed since the last scan.
+    """
+
+    def __init__(self, cache_path='tag_index.json'):
+        """
+        Initializes the TagIndex. The cache is read on the first update().
+
+        Args:
+            cache_path (str): Where the tag cache is stored between runs.
+        """
+        self.cache_path = cache_path
+        self.cache = None
+
+    def load_cache(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}  # Rebuild a corrupted cache
+        return {}
+
+    def save_cache(self):
+        with span('save.tag_index'), open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f)
+
+    def update(self, file_stats):
+        """
+        Refreshes the index for the given files.
+
+        Args:
+            file_stats (dict): Maps each file path to its (size, mtime_ns).
+
+        Returns:
+            dict: A map of videoIds to the list of files tagged with them.
+        """
+        if self.cache is None:
+            self.cache = self.load_cache()
+        changed = False
+        new_cache = {}
+        video_id_map = {}
+
+        for path, (size, mtime_ns) in file_stats.items():
+            entry = self.cache.get(path)
+            if entry and entry[0] == size and entry[1] == mtime_ns:
+                video_id = entry[2]
+            else:
+                video_id = read_video_id(path)
+                changed = True
+            new_cache[path] = [size, mtime_ns, video_id]
+            if video_id:
+                video_id_map.setdefault(video_id, []).append(path)
+
+        if changed or len(new_cache) != len(self.cache):
+            self.cache = new_cache
+            self.save_cache()
+        return video_id_map
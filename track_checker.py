@@ -1,53 +1,201 @@
 import os
 import re
+from tag_index import TagIndex
+from instrumentation import span, count
 
 class TrackChecker:
     """
     Detects whether a track has already been downloaded using flexible matching.
-    This class uses the FileManager to generate an expected base filename (without numbers)
-    and then searches for a matching file in the target directory, ignoring any numeric prefixes.
+    Files are first matched by the videoId tag written at download time, which survives
+    renames and title edits. Untagged files fall back to name matching: the FileManager
+    generates an expected base filename (without numbers) and the target directory is
+    searched for a matching file, ignoring any numeric prefixes. Tracks that still have no
+    match can be fuzzy-matched per folder with match_playlist().
     """
 
-    def __init__(self, file_manager, download_directory):
+    def __init__(self, file_manager, download_directory, tag_index=None, fuzzy_matcher=None, scan=True):
         """
         Initializes the TrackChecker.
 
         Args:
             file_manager (FileManager): An instance of the FileManager to handle naming and paths.
             download_directory (str): The root directory where tracks are saved.
+            tag_index (TagIndex, optional): The cached tag reader. A default one is created if omitted.
+            fuzzy_matcher (FuzzyMatcher, optional): Scores near-miss filenames. A default one is created
+                on first use, which also defers importing NumPy.
+            scan (bool): Scan the download directory now. Pass False to leave it to a later rescan(),
+                e.g. on a background thread.
         """
         self.file_manager = file_manager
         self.download_directory = download_directory
-        self.local_files_map = self._scan_directory()
+        self.tag_index = tag_index or TagIndex()
+        self.video_id_map = {}
+        self.fuzzy_matcher = fuzzy_matcher
+        self.base_name_indexes = {}
+        self.fuzzy_matches = {}
+        self.review_matches = {}
+        self.local_files_map = self._scan_directory() if scan else {}
 
     def _scan_directory(self):
         """
         Scans the download directory recursively and builds a map of directories to their files.
+        The videoId index is refreshed from the same scan.
 
         Returns:
             dict: A dictionary where keys are directory paths and values are lists of filenames.
         """
         dir_map = {}
-        if not os.path.exists(self.download_directory):
+        file_stats = {}
+        if not self.download_directory or not os.path.exists(self.download_directory):
+            self.video_id_map = {}
             return dir_map
 
-        for root, _, files in os.walk(self.download_directory):
-            mp3_files = [f for f in files if f.endswith(".mp3")]
-            if mp3_files:
-                dir_map[root] = mp3_files
+        pending = [self.download_directory]
+        while pending:
+            root = pending.pop()
+            audio_files = []
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif self.file_manager.is_audio_file(entry.name):
+                    audio_files.append(entry.name)
+                    stat = entry.stat()
+                    file_stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            if audio_files:
+                dir_map[root] = audio_files
+
+        self.video_id_map = self.tag_index.update(file_stats)
         return dir_map
 
     def rescan(self):
         """
         Forces a re-scan of the download directory to update the list of local files.
         """
-        self.local_files_map = self._scan_directory()
+        with span('rescan') as s:
+            self.local_files_map = self._scan_directory()
+            file_count = sum(len(files) for files in self.local_files_map.values())
+            s.set(directories=len(self.local_files_map), files=file_count)
+        count('rescan.files', file_count)
+        self.base_name_indexes = {}
+        self.fuzzy_matches = {}
+        self.review_matches = {}
+
+    @staticmethod
+    def strip_number_prefix(filename_no_ext):
+        """
+        Removes a numeric prefix such as '001_' or '2023_' from a filename without extension.
+        """
+        parts = filename_no_ext.split('_', 1)
+        # If there's a numeric prefix, the base name is the second part.
+        # Otherwise, it's the whole filename.
+        if len(parts) > 1 and parts[0].isdigit():
+            return parts[1]
+        return filename_no_ext
+
+    def get_base_name_index(self, directory):
+        """
+        Returns a map of prefix-stripped base names to filenames for one directory.
+        The index is built on first use after each scan, so lookups are constant time.
+        """
+        index = self.base_name_indexes.get(directory)
+        if index is None:
+            index = {}
+            for filename_with_ext in self.local_files_map.get(directory, []):
+                base_name = self.strip_number_prefix(os.path.splitext(filename_with_ext)[0])
+                index.setdefault(base_name, filename_with_ext)
+            self.base_name_indexes[directory] = index
+        return index
+
+    def find_by_video_id(self, video_id, directory=None):
+        """
+        Looks up a downloaded file by its embedded videoId tag.
+
+        Args:
+            video_id (str): The YouTube videoId.
+            directory (str, optional): If given, only a file in this directory matches.
+
+        Returns:
+            str or None: The file path, or None if no tagged file was found.
+        """
+        for filepath in self.video_id_map.get(video_id, []):
+            if directory is None or os.path.dirname(filepath) == directory:
+                return filepath
+        return None
+
+    def _find_exact(self, track_info, target_directory):
+        tagged_filepath = self.find_by_video_id(track_info.get('videoId'), target_directory)
+        if tagged_filepath:
+            return tagged_filepath
+
+        expected_base_name = self.file_manager.get_base_filename(track_info)
+
+        # Look the base name up in the target directory's index of prefix-stripped names
+        filename_with_ext = self.get_base_name_index(target_directory).get(expected_base_name)
+        if filename_with_ext:
+            return os.path.join(target_directory, filename_with_ext)
+        return None
+
+    def match_playlist(self, tracks, playlist_info, microplaylist_name=None):
+        """
+        Fuzzy-matches the tracks of one folder that have no exact match against the folder's
+        unclaimed files, in a single batch. Accepted matches are returned by is_downloaded()
+        until the next rescan, and near misses by get_review_match().
+
+        Args:
+            tracks (list): The tracks that belong in the folder.
+            playlist_info (dict): Metadata of the parent playlist.
+            microplaylist_name (str, optional): The name of the micro-playlist, if applicable.
+        """
+        playlist_name = playlist_info.get('title', 'Unknown Playlist')
+        target_directory = self.file_manager.get_track_directory(self.download_directory, playlist_name, microplaylist_name)
+
+        unresolved = []
+        claimed = set()
+        for track in tracks:
+            filepath = self._find_exact(track, target_directory)
+            if filepath:
+                claimed.add(os.path.basename(filepath))
+            else:
+                unresolved.append(track)
+        candidates = [f for f in self.local_files_map.get(target_directory, []) if f not in claimed]
+        if not unresolved or not candidates:
+            return
+
+        queries = [self.file_manager.get_base_filename(track) for track in unresolved]
+        candidate_names = [self.strip_number_prefix(os.path.splitext(f)[0]) for f in candidates]
+        if self.fuzzy_matcher is None:
+            from fuzzy_matcher import FuzzyMatcher
+            self.fuzzy_matcher = FuzzyMatcher()
+        matches, review = self.fuzzy_matcher.match(queries, candidate_names)
+
+        fuzzy_matches = self.fuzzy_matches.setdefault(target_directory, {})
+        for query_index, candidate_index, _ in matches:
+            fuzzy_matches[unresolved[query_index].get('videoId')] = os.path.join(target_directory, candidates[candidate_index])
+        review_matches = self.review_matches.setdefault(target_directory, {})
+        for query_index, candidate_index, score in review:
+            review_matches[unresolved[query_index].get('videoId')] = (os.path.join(target_directory, candidates[candidate_index]), score)
+
+    def get_review_match(self, track_info, playlist_info, microplaylist_name=None):
+        """
+        Returns the near-miss file found for a track by match_playlist(), for the user to review.
+
+        Returns:
+            tuple or None: (file path, score), or None if there is no candidate.
+        """
+        playlist_name = playlist_info.get('title', 'Unknown Playlist')
+        target_directory = self.file_manager.get_track_directory(self.download_directory, playlist_name, microplaylist_name)
+        return self.review_matches.get(target_directory, {}).get(track_info.get('videoId'))
 
     def is_downloaded(self, track_info, playlist_info, microplaylist_name=None):
         """
-        Checks if a specific track is downloaded using flexible, prefix-agnostic matching.
-        It generates the expected filename without a number and looks for a file in the
-        target directory that matches this base name, regardless of any numeric prefix.
+        Checks if a specific track is downloaded, first by its videoId tag and then using
+        flexible, prefix-agnostic name matching. It generates the expected filename without
+        a number and looks for a file in the target directory that matches this base name,
+        regardless of any numeric prefix. Fuzzy matches accepted by match_playlist() count too.
 
         Args:
             track_info (dict): Metadata of the track to check.
@@ -59,32 +207,11 @@ class TrackChecker:
         """
         playlist_name = playlist_info.get('title', 'Unknown Playlist')
         
-        # 1. Get the expected directory and base filename (without number prefix)
+        # 1. Get the expected directory
         target_directory = self.file_manager.get_track_directory(self.download_directory, playlist_name, microplaylist_name)
-        expected_base_name = self.file_manager.get_base_filename(track_info)
 
-        # 2. Get the list of files in the target directory from our scanned map
-        files_in_dir = self.local_files_map.get(target_directory)
-        if not files_in_dir:
-            return None
-
-        # 3. Iterate through the files and check for a match
-        for filename_with_ext in files_in_dir:
-            # Remove the .mp3 extension
-            filename_no_ext = os.path.splitext(filename_with_ext)[0]
-            
-            # Strip the numeric prefix, if it exists
-            parts = filename_no_ext.split('_', 1)
-            
-            # If there's a numeric prefix, the part to compare is the second part.
-            # Otherwise, it's the whole filename.
-            if len(parts) > 1 and parts[0].isdigit():
-                base_to_compare = parts[1]
-            else:
-                base_to_compare = filename_no_ext
-            
-            # 4. Compare the stripped local filename with the expected base name
-            if base_to_compare == expected_base_name:
-                return os.path.join(target_directory, filename_with_ext)
-                
-        return None
+        # 2. Match by tag or base name, then fall back to the folder's fuzzy matches
+        filepath = self._find_exact(track_info, target_directory)
+        if filepath:
+            return filepath
+        return self.fuzzy_matches.get(target_directory, {}).get(track_info.get('videoId'))
@@ -0,0 +1,133 @@
+"""
+Compact in-memory records for synced tracks.
+
+ytmusicapi returns each playlist track as a large dict (thumbnails, feedback tokens,
+setVideoId, album and like status, ...), of which the app only reads a few fields. Tracks are
+reduced to a TrackRecord when a playlist is stored, and every distinct artist or album is kept
+as one shared entry, so a large library costs a small fraction of the raw payload's memory.
+"""
+import locale
+import sys
+
+# The track fields the app reads. Everything else is dropped when a playlist is stored.
+TRACK_FIELDS = ('videoId', 'title', 'artists', 'album', 'year', 'duration', 'duration_seconds', 'position')
+# The playlist fields the app reads.
+PLAYLIST_FIELDS = ('id', 'title', 'is_private', 'tracks')
+# Leading words ignored when sorting by name, so "The Beatles" sorts under B.
+SORT_IGNORED_ARTICLES = ('the ', 'a ', 'an ')
+
+_shared_names = {}  # (name, id) -> the one {'name', 'id'} dict used by every track
+
+def shared_name(entry):
+    """
+    Returns the shared {'name', 'id'} dict for an artist or album entry, or None if it has no name.
+    """
+    if not isinstance(entry, dict) or entry.get('name') is None:
+        return None
+    key = (entry['name'], entry.get('id'))
+    shared = _shared_names.get(key)
+    if shared is None:
+        name = sys.intern(entry['name']) if isinstance(entry['name'], str) else entry['name']
+        shared = _shared_names.setdefault(key, {'name': name, 'id': entry.get('id')})
+    return shared
+
+def collation_key(text):
+    """
+    Returns the key a title or artist name sorts by: casefolded, without a leading article or
+    a " - Topic" channel suffix, and transformed for the current locale's collation order.
+    """
+    text = (text or '').casefold().strip()
+    if text.endswith(' - topic'):
+        text = text[:-len(' - topic')].rstrip()
+    for article in SORT_IGNORED_ARTICLES:
+        if text.startswith(article) and len(text) > len(article):
+            text = text[len(article):]
+            break
+    return locale.strxfrm(text)
+
+class TrackRecord:
+    """
+    One synced track, holding only the fields the app reads. It answers the dict methods the
+    rest of the app uses (get, [], in, keys), so it stands in for the track dicts.
+    An unset field reads as None; a name that is not a field raises KeyError.
+    """
+    # filepath is set by the track view for the matched local file, and the sort keys are computed
+    # when the record is created. None of them are stored.
+    __slots__ = TRACK_FIELDS + ('filepath', 'title_key', 'artist_key')
+
+    def __init__(self, videoId=None, title=None, artists=(), album=None, year=None, duration=None,
+                 duration_seconds=None, position=None, filepath=None):
+        self.videoId = videoId
+        self.title = title
+        self.artists = artists
+        self.album = album
+        self.year = year
+        self.duration = duration
+        self.duration_seconds = duration_seconds
+        self.position = position
+        self.filepath = filepath
+        self.title_key = collation_key(title)
+        self.artist_key = collation_key(artists[0]['name'] if artists else None)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in TrackRecord.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        # A field the record has but that is unset reads as None, like a dict holding None.
+        if key not in TrackRecord.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in TrackRecord.__slots__:
+            raise KeyError(f"TrackRecord has no field '{key}'")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        return [key for key in TRACK_FIELDS + ('filepath',) if getattr(self, key) is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self):
+        """
+        Returns the stored fields as a plain dict, e.g. for writing to JSON.
+        """
+        return {key: getattr(self, key) for key in TRACK_FIELDS if getattr(self, key) is not None}
+
+    def __repr__(self):
+        return f"TrackRecord({self.videoId!r}, {self.title!r})"
+
+def compact_track(track, position=None):
+    """
+    Returns a TrackRecord with the used fields of a track dict (or another TrackRecord).
+
+    Args:
+        track (dict): The track, e.g. as returned by ytmusicapi or the YouTube Data API.
+        position (int, optional): The 1-based index of the track in its playlist.
+    """
+    artists = tuple(filter(None, (shared_name(artist) for artist in track.get('artists') or ())))
+    return TrackRecord(
+        videoId=track.get('videoId'),
+        title=track.get('title'),
+        artists=artists,
+        album=shared_name(track.get('album')),
+        year=track.get('year'),
+        duration=track.get('duration'),
+        duration_seconds=track.get('duration_seconds'),
+        position=position if position is not None else track.get('position'),
+    )
+
+def compact_playlist(playlist_info):
+    """
+    Returns a playlist dict with only the used fields and its tracks as TrackRecords, numbered
+    by their position in the playlist.
+    """
+    compact = {key: playlist_info[key] for key in PLAYLIST_FIELDS if key in playlist_info}
+    compact['tracks'] = [compact_track(track, position) for position, track in
+                         enumerate(playlist_info.get('tracks') or (), start=1)]
+    return compact
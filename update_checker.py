@@ -0,0 +1,171 @@
+import os
+import json
+import math
+import random
+import threading
+import time
+from datetime import date
+from instrumentation import span, count
+from storage import write_json_atomically
+from youtube_handler import PLAYLISTS_PER_REQUEST
+
+UPDATE_CHECKS_FILE = "update_checks.json"
+DEFAULT_CHECK_INTERVAL_MINUTES = 60
+# Data API quota units a day spent on checks; the API grants 10,000 a day per project.
+DEFAULT_DAILY_QUOTA = 100
+# Each interval is stretched or shortened at random by up to this share, so checks do not line up.
+CHECK_JITTER = 0.2
+# The earliest a check runs after the app starts, so startup makes no API requests.
+MIN_CHECK_DELAY = 60
+
+class UpdateChecker:
+    """
+    Detects synced playlists that changed on YouTube without reading their items.
+    A check fetches the etag and item count of up to 50 playlists per Data API request (one quota
+    unit) and compares them with the values recorded when each playlist was last synced. Checks
+    are spread out with random jitter and stop once the daily quota budget is spent, so an idle
+    library costs about one unit per 50 playlists per check. The state is kept in a JSON file,
+    so restarting the app neither repeats a check early nor forgets a change.
+    """
+
+    def __init__(self, youtube_handler, state_path=UPDATE_CHECKS_FILE, daily_quota=DEFAULT_DAILY_QUOTA,
+                 jitter=CHECK_JITTER, rng=None):
+        """
+        Initializes the UpdateChecker.
+
+        Args:
+            youtube_handler (YouTubeHandler): Used to fetch the playlists' etags and item counts.
+            state_path (str): The JSON file holding the recorded values and the quota used today.
+            daily_quota (int): The most quota units checks may use per day.
+            jitter (float): The largest random share by which an interval is lengthened or shortened.
+            rng (random.Random, optional): The source of the jitter.
+        """
+        self.youtube_handler = youtube_handler
+        self.state_path = state_path
+        self.daily_quota = daily_quota
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        state = self.load_state()
+        # p_id -> {'etag', 'item_count'} as of the last sync, and as seen live when that differs.
+        self.signatures = state.get('signatures', {})
+        self.changed = state.get('changed', {})
+        self.checked_at = state.get('checked_at', {})
+        self.last_check = state.get('last_check')
+        self.quota_day = state.get('quota_day')
+        self.quota_used = state.get('quota_used', 0)
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_state(self):
+        with self.lock:
+            state = {'signatures': self.signatures, 'changed': self.changed, 'checked_at': self.checked_at,
+                     'last_check': self.last_check, 'quota_day': self.quota_day, 'quota_used': self.quota_used}
+            with span('save.update_checks'):
+                write_json_atomically(state, self.state_path)
+
+    def next_delay(self, interval):
+        """
+        Returns the seconds until the next check, counted from the last check.
+
+        Args:
+            interval (float): The average time between checks, in seconds.
+        """
+        jittered = interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        remaining = jittered - (time.time() - self.last_check) if self.last_check else jittered
+        return max(MIN_CHECK_DELAY, remaining)
+
+    def quota_left(self):
+        """
+        Returns the quota units checks may still use today.
+        """
+        today = date.today().isoformat()
+        if self.quota_day != today:
+            self.quota_day, self.quota_used = today, 0
+        return max(0, self.daily_quota - self.quota_used)
+
+    def check(self, playlist_ids, track_counts=None):
+        """
+        Compares the live etag and item count of synced playlists with the recorded ones. When the
+        budget does not cover every playlist, those checked longest ago go first.
+        A playlist without recorded values is recorded as it is if its live item count matches the
+        number of tracks it had when it was synced, and counts as changed otherwise.
+
+        Args:
+            playlist_ids (iterable): The synced playlists.
+            track_counts (dict, optional): The number of tracks of each playlist as of its last sync.
+
+        Returns:
+            dict: 'changed', the playlists found changed by this check, 'checked' and 'units', or
+                  'error' if the request failed or the day's budget is spent.
+        """
+        now = time.time()
+        playlist_ids = sorted(playlist_ids, key=lambda p_id: self.checked_at.get(p_id, 0))
+        playlist_ids = playlist_ids[:self.quota_left() * PLAYLISTS_PER_REQUEST]
+        self.last_check = now
+        if not playlist_ids:
+            self.save_state()
+            return {'changed': [], 'checked': 0, 'units': 0, 'error': "The daily quota budget for update checks is spent."}
+
+        units = math.ceil(len(playlist_ids) / PLAYLISTS_PER_REQUEST)
+        with span('update_check', playlists=len(playlist_ids)):
+            live = self.youtube_handler.get_playlist_signatures(playlist_ids)
+        self.quota_used += units
+        count('update_check.units', units)
+        if 'error' in live:
+            self.save_state()
+            return {'changed': [], 'checked': 0, 'units': units, 'error': live['error']}
+
+        track_counts = track_counts or {}
+        newly_changed = []
+        with self.lock:
+            for p_id in playlist_ids:
+                signature = live.get(p_id)
+                if signature is None:
+                    # Deleted or no longer visible; a Full Refresh reports it.
+                    continue
+                self.checked_at[p_id] = now
+                recorded = self.signatures.get(p_id)
+                if recorded is None and track_counts.get(p_id, signature['item_count']) == signature['item_count']:
+                    self.signatures[p_id] = recorded = signature
+                if signature == recorded:
+                    self.changed.pop(p_id, None)
+                elif self.changed.get(p_id) != signature:
+                    self.changed[p_id] = signature
+                    newly_changed.append(p_id)
+        self.save_state()
+        return {'changed': newly_changed, 'checked': len(playlist_ids), 'units': units}
+
+    def is_changed(self, p_id):
+        return p_id in self.changed
+
+    def mark_synced(self, p_id, signature=None):
+        """
+        Records that a playlist was synced.
+
+        Args:
+            p_id (str): The playlist ID.
+            signature (dict, optional): The etag and item count fetched right before the sync, so
+                that a change made during or after it is found by the next check. Without it, the
+                values seen by the check that flagged the playlist are recorded, and a playlist that
+                was not flagged is compared with its synced track count by the next check instead.
+        """
+        with self.lock:
+            signature = signature or self.changed.get(p_id)
+            self.changed.pop(p_id, None)
+            if signature:
+                self.signatures[p_id] = signature
+            else:
+                self.signatures.pop(p_id, None)
+
+    def forget(self, p_id):
+        with self.lock:
+            for values in (self.signatures, self.changed, self.checked_at):
+                values.pop(p_id, None)
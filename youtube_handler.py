@@ -1,31 +1,86 @@
 import os
 import pickle
-import httplib2
-from ytmusicapi import YTMusic
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from google.auth.exceptions import RefreshError
+import threading
+from instrumentation import span, count
 
-httplib2.Http.DEFAULT_TIMEOUT = 300
+# ytmusicapi, requests, googleapiclient, httplib2 and the Google auth libraries take a few hundred
+# milliseconds to import, so they are imported where they are first used, off the GUI's startup path.
+HTTP_TIMEOUT = 300
+# The most playlists the Data API returns for one playlists.list request.
+PLAYLISTS_PER_REQUEST = 50
 
 class YouTubeHandler:
-    def __init__(self):
+    def __init__(self, api_endpoint=None, num_retries=3, defer_credentials=False):
+        """
+        Initializes the YouTubeHandler.
+
+        Args:
+            api_endpoint (str, optional): Send all YouTube Data API and YouTube Music requests to this
+                base URL instead, e.g. a mock_api_server. No credentials are needed or stored in that case.
+            num_retries (int): Retries for Data API requests that fail with a 429 or a server error,
+                with exponential backoff.
+            defer_credentials (bool): Skip loading and refreshing the stored credentials, which may make
+                a network request; the caller runs load_credentials() later, e.g. on a background thread.
+        """
         print("Initializing YouTubeHandler...")
-        self.ytmusic = YTMusic()
+        self.api_endpoint = api_endpoint
+        self.num_retries = num_retries
+        self._ytmusic = None
         self.credentials = None
         self.api_service = None
         self.scopes = ["https://www.googleapis.com/auth/youtube.readonly"]
         self.client_secrets_file = "client_secrets.json"
         self.token_pickle_file = "token.pickle"
-        self.load_credentials()
+        self.thread_local = threading.local()
+        if not defer_credentials:
+            self.load_credentials()
         print("YouTubeHandler initialized.")
 
+    @property
+    def ytmusic(self):
+        """
+        The YTMusic client, created on first use since it is only needed for public playlists.
+        """
+        if self._ytmusic is None:
+            from ytmusicapi import YTMusic
+            from endpoint_session import EndpointSession
+            self._ytmusic = YTMusic(requests_session=EndpointSession(self.api_endpoint))
+        return self._ytmusic
+
+    def get_http(self):
+        """
+        Returns an HTTP client for Data API requests made on the calling thread.
+        httplib2 connections are not thread-safe, and the playlist fetch and a sync can run
+        on separate threads at the same time, so each thread gets its own client.
+        """
+        cached = getattr(self.thread_local, 'http', None)
+        if cached and cached[0] is self.credentials:
+            return cached[1]
+        import httplib2
+        import google_auth_httplib2
+        http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        if self.credentials:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=http)
+        self.thread_local.http = (self.credentials, http)
+        return http
+
+    def build_service(self, credentials):
+        from googleapiclient.discovery import build
+        if self.api_endpoint:
+            return build("youtube", "v3", developerKey="mock", static_discovery=True,
+                         client_options={"api_endpoint": self.api_endpoint.rstrip('/') + '/'})
+        return build("youtube", "v3", credentials=credentials)
+
     def load_credentials(self):
         print("Attempting to load credentials...")
         self.credentials = None
         self.api_service = None
 
+        if self.api_endpoint:
+            print(f"Using the API endpoint at {self.api_endpoint}.")
+            self.api_service = self.build_service(None)
+            return
+
         if os.path.exists(self.token_pickle_file):
             try:
                 with open(self.token_pickle_file, "rb") as token:
@@ -37,6 +92,8 @@ class YouTubeHandler:
                 self.credentials = None
 
         if self.credentials:
+            from google.auth.transport.requests import Request
+            from google.auth.exceptions import RefreshError
             try:
                 if self.credentials.expired and self.credentials.refresh_token:
                     print("Credentials expired. Attempting to refresh...")
@@ -55,7 +112,7 @@ class YouTubeHandler:
 
             if self.credentials and self.credentials.valid:
                 print("Credentials are valid. Building API service.")
-                self.api_service = build("youtube", "v3", credentials=self.credentials)
+                self.api_service = self.build_service(self.credentials)
             else:
                 print("Credentials are not valid after check.")
                 self.api_service = None
@@ -66,14 +123,18 @@ class YouTubeHandler:
         return self.api_service is not None
 
     def authenticate(self):
+        if self.api_endpoint:
+            self.load_credentials()
+            return "Authentication successful."
         if not os.path.exists(self.client_secrets_file):
             return "client_secrets.json not found."
         try:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, self.scopes)
             self.credentials = flow.run_local_server(port=0)
             with open(self.token_pickle_file, "wb") as token:
                 pickle.dump(self.credentials, token)
-            self.api_service = build("youtube", "v3", credentials=self.credentials)
+            self.api_service = self.build_service(self.credentials)
             return "Authentication successful."
         except Exception as e:
             return f"Authentication failed: {e}"
@@ -97,7 +158,9 @@ class YouTubeHandler:
                     maxResults=50,
                     pageToken=next_page_token
                 )
-                response = request.execute()
+                count('api.requests')
+                with span('api.playlists.page'):
+                    response = request.execute(http=self.get_http(), num_retries=self.num_retries)
                 for item in response.get("items", []):
                     playlists.append({
                         "id": item["id"],
@@ -111,6 +174,42 @@ class YouTubeHandler:
                 return {"error": str(e)}
         return playlists
 
+    def get_playlist_signatures(self, playlist_ids):
+        """
+        Fetches the etag and item count of playlists, 50 per request, without reading their items.
+        Each request costs one unit of the Data API quota.
+
+        Args:
+            playlist_ids (list): The playlists to look up.
+
+        Returns:
+            dict: {'etag', 'item_count'} keyed by playlist ID, without the playlists that no longer
+                  exist or are not visible, or {"error": message}.
+        """
+        if not self.is_authenticated():
+            return {"error": "User not authenticated."}
+        signatures = {}
+        for start in range(0, len(playlist_ids), PLAYLISTS_PER_REQUEST):
+            batch = playlist_ids[start:start + PLAYLISTS_PER_REQUEST]
+            try:
+                request = self.api_service.playlists().list(
+                    part="contentDetails",
+                    id=",".join(batch),
+                    maxResults=PLAYLISTS_PER_REQUEST,
+                    fields="items(id,etag,contentDetails/itemCount)"
+                )
+                count('api.requests')
+                with span('api.playlists.signatures', playlists=len(batch)):
+                    response = request.execute(http=self.get_http(), num_retries=self.num_retries)
+            except Exception as e:
+                return {"error": str(e)}
+            for item in response.get("items", []):
+                signatures[item["id"]] = {
+                    "etag": item.get("etag"),
+                    "item_count": item.get("contentDetails", {}).get("itemCount"),
+                }
+        return signatures
+
     def get_playlist_info(self, playlist_id, is_private=False):
         if is_private:
             return self.get_private_playlist_info(playlist_id)
@@ -131,7 +230,9 @@ class YouTubeHandler:
             return {"error": "User not authenticated. Please log in."}
         try:
             playlist_request = self.api_service.playlists().list(part="snippet", id=playlist_id)
-            playlist_response = playlist_request.execute()
+            count('api.requests')
+            with span('api.playlists.page', playlist_id=playlist_id):
+                playlist_response = playlist_request.execute(http=self.get_http(), num_retries=self.num_retries)
             if not playlist_response.get("items"):
                 return {"error": "Private playlist not found. Check the ID and your permissions."}
             playlist_title = playlist_response["items"][0]["snippet"]["title"]
@@ -144,7 +245,9 @@ class YouTubeHandler:
                     maxResults=50,
                     pageToken=next_page_token
                 )
-                playlist_items_response = playlist_items_request.execute()
+                count('api.requests')
+                with span('api.playlistItems.page', playlist_id=playlist_id):
+                    playlist_items_response = playlist_items_request.execute(http=self.get_http(), num_retries=self.num_retries)
                 for item in playlist_items_response["items"]:
                     snippet = item["snippet"]
                     video_id = snippet.get("resourceId", {}).get("videoId")
@@ -164,3 +267,54 @@ class YouTubeHandler:
             return {"title": playlist_title, "tracks": tracks}
         except Exception as e:
             return {"error": str(e)}
+
+    def sync_playlists(self, playlists_to_sync, progress_callback=None):
+        """
+        Re-fetches every given playlist, choosing the public or private path from its current privacy status.
+
+        Args:
+            playlists_to_sync (dict): The synced playlists, keyed by playlist ID.
+            progress_callback (callable, optional): Called as progress_callback(done, total) after each playlist.
+
+        Returns:
+            tuple: (updated_playlists, summary), the fresh playlist data keyed by ID and a list of
+                   human-readable lines about new songs and failures.
+        """
+        with span('sync_playlists', playlists=len(playlists_to_sync)):
+            return self._sync_playlists(playlists_to_sync, progress_callback)
+
+    def _sync_playlists(self, playlists_to_sync, progress_callback):
+        live_user_playlists = self.get_all_user_playlists()
+        if 'error' in live_user_playlists:
+            return {}, [f"Error fetching playlists: {live_user_playlists['error']}"]
+
+        live_playlist_map = {p['id']: p for p in live_user_playlists}
+        updated_playlists = {}
+        summary = []
+
+        for done, (playlist_id, old_playlist_data) in enumerate(playlists_to_sync.items(), start=1):
+            if playlist_id not in live_playlist_map:
+                summary.append(f"'{old_playlist_data.get('title', '...')}'': Skipped (not found in your account).")
+            else:
+                live_data = live_playlist_map[playlist_id]
+                is_now_private = live_data['privacyStatus'] != 'public'
+
+                with span('sync_playlists.playlist', playlist_id=playlist_id, private=is_now_private):
+                    new_data = self.get_playlist_info(playlist_id, is_now_private)
+
+                if new_data and 'error' not in new_data:
+                    old_ids = {t['videoId'] for t in old_playlist_data.get('tracks', [])}
+                    new_ids = {t['videoId'] for t in new_data.get('tracks', [])}
+                    count = len(new_ids - old_ids)
+                    if count > 0:
+                        summary.append(f"'{new_data.get('title', '...')[:30]}...': {count} new song(s)")
+
+                    new_data['is_private'] = is_now_private
+                    updated_playlists[playlist_id] = new_data
+                else:
+                    summary.append(f"'{old_playlist_data.get('title', '...')}'': Failed to sync.")
+
+            if progress_callback:
+                progress_callback(done, len(playlists_to_sync))
+
+        return updated_playlists, summary